@@ -0,0 +1,45 @@
+"""Near-duplicate lookup cost of the Hamming index against a pairwise scan.
+
+Usage: python benchmarks/bench_dedupe.py [--hashes 200000] [--queries 1000] [--distances 0,4,8]
+"""
+import argparse
+import random
+import time
+from scan_image.dedupe import HammingIndex, _popcount
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hashes", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--distances", default="0,4,8")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(args.hashes)]
+    hashes = [f"{value:016x}" for value in values]
+
+    start = time.perf_counter()
+    for value in values[:100]:
+        [_popcount(value ^ other) for other in values]
+    pairwise_ms = (time.perf_counter() - start) * 1000 / 100
+    print(f"{args.hashes} stored hashes; pairwise scan: {pairwise_ms:.2f} ms/lookup\n")
+
+    print(f"{'distance':>8} {'build s':>8} {'ms/lookup':>10} {'found':>6}")
+    for distance in map(int, args.distances.split(",")):
+        index = HammingIndex(distance)
+        start = time.perf_counter()
+        for i, phash in enumerate(hashes):
+            index.add(phash, i)
+        build = time.perf_counter() - start
+        queries = []
+        for value in rng.sample(values, args.queries):
+            for bit in rng.sample(range(64), distance):
+                value ^= 1 << bit
+            queries.append(f"{value:016x}")
+        start = time.perf_counter()
+        found = sum(index.find(query) is not None for query in queries)
+        lookup_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        print(f"{distance:>8} {build:>8.2f} {lookup_ms:>10.3f} {found:>6}")
+
+if __name__ == "__main__":
+    main()
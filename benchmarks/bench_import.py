@@ -0,0 +1,47 @@
+"""Measure import and CLI startup time in fresh interpreters.
+
+Usage: python benchmarks/bench_import.py [--runs 10]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+CASES = {
+    "import scan_image.scanner": [sys.executable, "-c", "import scan_image.scanner"],
+    "scan-image --version": [sys.executable, "-m", "scan_image.scanner", "--version"],
+    "heavy deps (reference)": [sys.executable, "-c", "import cv2, imagehash, numpy, pytesseract, PIL.Image"],
+    "bare interpreter": [sys.executable, "-c", "pass"],
+}
+
+def time_command(cmd, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), min(samples)
+
+def self_import_time():
+    """Cumulative import time of scan_image.scanner as reported by -X importtime."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import scan_image.scanner"],
+                         capture_output=True, text=True, check=True).stderr
+    for line in out.splitlines():
+        if line.rstrip().endswith("| scan_image.scanner"):
+            return int(line.split("|")[1]) / 1000
+    return float("nan")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'case':<28} {'median ms':>10} {'min ms':>8}")
+    for name, cmd in CASES.items():
+        median, best = time_command(cmd, args.runs)
+        print(f"{name:<28} {median * 1000:10.1f} {best * 1000:8.1f}")
+    print(f"-X importtime scan_image.scanner: {self_import_time():.1f} ms")
+
+if __name__ == "__main__":
+    main()
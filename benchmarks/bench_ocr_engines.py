@@ -0,0 +1,51 @@
+"""Compare OCR engines against the original one-subprocess-per-image path.
+
+Usage: python benchmarks/bench_ocr_engines.py [--images 40] [--batch-size 8]
+"""
+import argparse
+import shutil
+import time
+from PIL import Image, ImageDraw
+from scan_image import ocr
+from scan_image.config import setup_tesseract
+
+def make_images(count):
+    images = []
+    for i in range(count):
+        img = Image.new("RGB", (320, 80), color="white")
+        ImageDraw.Draw(img).text((10, 30), f"SAMPLE TEXT {i}", fill="black")
+        images.append(img)
+    return images
+
+def run(engine_name, images, batch_size):
+    engine = ocr.get_engine(engine_name)
+    start = time.perf_counter()
+    texts = []
+    for i in range(0, len(images), batch_size):
+        texts.extend(engine.images_to_strings(images[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+    found = sum(f"SAMPLE TEXT {i}" in text.upper() for i, text in enumerate(texts))
+    return elapsed, found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    setup_tesseract()
+    if not shutil.which(ocr.pytesseract.pytesseract.tesseract_cmd):
+        raise SystemExit("tesseract not found; set TESSERACT_PATH")
+
+    images = make_images(args.images)
+    print(f"{'engine':<12} {'seconds':>8} {'img/s':>8} {'found':>7}")
+    for name in ("subprocess", "batch", "tesserocr"):
+        try:
+            elapsed, found = run(name, images, args.batch_size)
+        except ImportError:
+            print(f"{name:<12} {'not installed':>25}")
+            continue
+        print(f"{name:<12} {elapsed:8.2f} {len(images) / elapsed:8.1f} {found:>3}/{len(images)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Per-stage and end-to-end scan throughput on synthetic corpora, reported as JSON.
+
+Usage: python benchmarks/bench_pipeline.py [--sizes 100,400] [--workers 1,2,4] [--noise 8]
+       [--duplicates 0.1] [--seed 0] [--schedulers pool,pipeline] [--corpus DIR] [--output results.json]
+
+Each stage (is_valid_image, has_text_heuristic, compute_perceptual_hash and,
+when Tesseract is installed, contains_phrase) is timed image by image on the
+largest corpus and reported as images/sec with p50/p95 latency. The
+end-to-end scan_images_for_phrase runs once per corpus size, worker count and
+scheduler, each in a fresh interpreter so peak RSS (of the scanning process and of its
+largest worker) belongs to that run alone; corpora are generated in a
+subprocess too, as Linux carries the peak RSS of a parent over into the
+processes it starts. Without Tesseract every OCR attempt fails, so the
+end-to-end numbers then only compare the stages before OCR.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from corpus import load_labels
+from scan_image import __version__, ocr
+from scan_image.config import setup_tesseract
+from scan_image.scanner import scan_images_for_phrase
+from scan_image.utils import compute_perceptual_hash, contains_phrase, has_text_heuristic, is_valid_image, load_image
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+def summarize(timings):
+    return {
+        "images": len(timings),
+        "images_per_sec": round(len(timings) / sum(timings), 1) if sum(timings) else None,
+        "p50_ms": round(percentile(timings, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+    }
+
+def timed(func, items):
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def peak_rss_mb():
+    """Peak RSS of this process and of its largest finished child, in MB."""
+    if resource is None:
+        return None, None
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return tuple(round(resource.getrusage(who).ru_maxrss * unit / 2 ** 20, 1)
+                 for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+def stage_timings(corpus_dir, labels, phrase, with_ocr):
+    paths = [os.path.join(corpus_dir, label["path"]) for label in labels]
+    stages = {"is_valid_image": summarize(timed(is_valid_image, paths))}
+    # Decoding is part of the stages that need pixels, as it is in a scan
+    stages["has_text_heuristic"] = summarize(timed(lambda path: has_text_heuristic(load_image(path, decode=False)),
+                                                   paths))
+    stages["compute_perceptual_hash"] = summarize(timed(lambda path: compute_perceptual_hash(load_image(path)),
+                                                        paths))
+    if with_ocr:
+        engine = ocr.get_engine()
+        stages["contains_phrase"] = summarize(timed(lambda path: contains_phrase(load_image(path), phrase, engine),
+                                                    paths))
+    return stages
+
+def single_run(corpus_dir, phrase, workers, scheduler):
+    """One end-to-end scan; runs in its own interpreter and prints its result as JSON."""
+    setup_tesseract()
+    start = time.perf_counter()
+    found = scan_images_for_phrase(corpus_dir, phrase, processes=workers, scheduler=scheduler)
+    elapsed = time.perf_counter() - start
+    images = len(load_labels(corpus_dir))
+    rss, worker_rss = peak_rss_mb()
+    print(json.dumps({"images": images, "workers": workers, "scheduler": scheduler, "seconds": round(elapsed, 3),
+                      "images_per_sec": round(images / elapsed, 1), "matches": len(found),
+                      "peak_rss_mb": rss, "peak_worker_rss_mb": worker_rss}))
+
+def end_to_end(corpus_dir, phrase, workers, scheduler):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--single-run", corpus_dir,
+                             "--phrase", phrase, "--workers", str(workers), "--schedulers", scheduler],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def generate_corpus(corpus_dir, size, args):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.py")
+    subprocess.run([sys.executable, script, corpus_dir, "--images", str(size), "--seed", str(args.seed),
+                    "--noise", str(args.noise), "--duplicates", str(args.duplicates)],
+                   check=True, stdout=subprocess.DEVNULL)
+    return load_labels(corpus_dir)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,400", help="Comma-separated corpus sizes")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--noise", type=float, default=8.0, help="Maximum Gaussian noise in grey levels")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="Share of near-duplicate images")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--schedulers", default="pool,pipeline",
+                        help="Comma-separated values of scan_images_for_phrases(scheduler=...) to compare")
+    parser.add_argument("--corpus", help="Use this corpus from benchmarks/corpus.py instead of generating them")
+    parser.add_argument("--phrase", default="invoice")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--single-run", metavar="DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single_run:
+        single_run(args.single_run, args.phrase, int(args.workers), args.schedulers)
+        return
+
+    setup_tesseract()
+    with_ocr = bool(shutil.which(ocr.pytesseract.pytesseract.tesseract_cmd))
+    workers = [int(value) for value in args.workers.split(",")]
+    report = {
+        "meta": {"version": __version__, "python": platform.python_version(), "platform": platform.platform(),
+                 "cpu_count": os.cpu_count(), "tesseract": with_ocr, "phrase": args.phrase,
+                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "corpus": {"noise": args.noise, "duplicates": args.duplicates, "seed": args.seed},
+        "end_to_end": [],
+        "stages": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.corpus:
+            corpora = [(args.corpus, load_labels(args.corpus))]
+        else:
+            corpora = []
+            for size in sorted(int(value) for value in args.sizes.split(",")):
+                corpus_dir = os.path.join(tmp, str(size))
+                corpora.append((corpus_dir, generate_corpus(corpus_dir, size, args)))
+        # End to end first, before decoding images here raises the RSS the runs would inherit
+        for corpus_dir, labels in corpora:
+            for count in workers:
+                for scheduler in args.schedulers.split(","):
+                    report["end_to_end"].append(end_to_end(corpus_dir, args.phrase, count, scheduler))
+        corpus_dir, labels = corpora[-1]
+        report["stages"] = stage_timings(corpus_dir, labels, args.phrase, with_ocr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Precision/recall and speed of the text prefilter on a labelled synthetic corpus.
+
+Usage: python benchmarks/bench_prefilter.py [--corpus DIR] [--images 200] [--size 640]
+       [--thresholds 0.005,0.01,0.02]
+
+"legacy" is the original heuristic: full-resolution decode and the sum of the
+Canny output (255 per edge pixel) over the pixel count compared with 0.02.
+"""
+import argparse
+import os
+import tempfile
+import time
+from corpus import generate, load_labels
+from scan_image.utils import PrefilterConfig, cv2, has_text_heuristic, load_image
+
+def legacy(image):
+    edges = cv2.Canny(image.gray, 100, 200)
+    return edges.sum() / (edges.shape[0] * edges.shape[1]) > 0.02
+
+def run(corpus_dir, labels, check):
+    tp = fp = fn = tn = 0
+    start = time.perf_counter()
+    for label in labels:
+        image = load_image(os.path.join(corpus_dir, label["path"]), decode=False)
+        predicted = image is not None and check(image)
+        if predicted and label["has_text"]:
+            tp += 1
+        elif predicted:
+            fp += 1
+        elif label["has_text"]:
+            fn += 1
+        else:
+            tn += 1
+    elapsed = time.perf_counter() - start
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return precision, recall, (tp + tn) / len(labels), len(labels) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="Corpus from benchmarks/corpus.py (default: generate a temporary one)")
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--size", type=int, default=640, help="Preview size for the new prefilter")
+    parser.add_argument("--thresholds", default="0.002,0.005,0.01")
+    parser.add_argument("--min-regions", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus or tmp
+        labels = load_labels(corpus_dir) if args.corpus else generate(corpus_dir, args.images)
+        configs = [("legacy", legacy)]
+        for threshold in map(float, args.thresholds.split(",")):
+            config = PrefilterConfig("edges", args.size, threshold, 0)
+            configs.append((f"edges {threshold}", lambda image, config=config: has_text_heuristic(image, config=config)))
+        for threshold in map(float, args.thresholds.split(",")):
+            config = PrefilterConfig("regions", args.size, threshold, args.min_regions)
+            configs.append((f"regions {threshold}", lambda image, config=config: has_text_heuristic(image, config=config)))
+
+        print(f"{len(labels)} images, {sum(label['has_text'] for label in labels)} with text\n")
+        print(f"{'prefilter':<16} {'precision':>9} {'recall':>7} {'accuracy':>8} {'images/s':>9}")
+        for name, check in configs:
+            precision, recall, accuracy, rate = run(corpus_dir, labels, check)
+            print(f"{name:<16} {precision:>9.3f} {recall:>7.3f} {accuracy:>8.3f} {rate:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Before/after timing and accuracy of OCR preprocessing (rescaling and binarization).
+
+Usage: python benchmarks/bench_preprocess.py [--corpus DIR] [--no-ocr]
+
+Runs on a few sample images rendered in memory (SAMPLES below) plus, with
+--corpus, the text images of a corpus from benchmarks/corpus.py. Without Tesseract (or with --no-ocr) only the
+preprocessing cost and the pixels left for Tesseract are reported.
+"""
+import argparse
+import io
+import os
+import shutil
+import time
+from PIL import Image, ImageDraw
+from corpus import load_labels
+from scan_image import ocr
+from scan_image.config import setup_tesseract
+from scan_image.preprocess import DEFAULT_PREPROCESS, preprocess
+from scan_image.utils import load_image
+
+# Expected text of the built-in samples, each drawn small on a white page
+SAMPLES = ("HELLO_TEST", "invoice total amount paid")
+CONFIGS = [
+    ("original", None),
+    ("otsu", DEFAULT_PREPROCESS._replace(binarize="otsu")),
+    ("x-height", DEFAULT_PREPROCESS._replace(scale="x-height")),
+    ("x-height+otsu", DEFAULT_PREPROCESS._replace(scale="x-height", binarize="otsu")),
+    ("x-height+adaptive", DEFAULT_PREPROCESS._replace(scale="x-height", binarize="adaptive")),
+]
+
+def render_sample(text):
+    """PNG bytes of text in PIL's default font on a 400x150 page."""
+    img = Image.new("RGB", (400, 150), color="white")
+    ImageDraw.Draw(img).text((20, 60), text, fill="black")
+    out = io.BytesIO()
+    img.save(out, format="PNG")
+    return out.getvalue()
+
+def samples(corpus_dir):
+    """(image, expected text) pairs of the built-in samples and the corpus."""
+    found = [(load_image(f"sample{i}.png", render_sample(text)), text) for i, text in enumerate(SAMPLES)]
+    if corpus_dir:
+        found.extend((load_image(os.path.join(corpus_dir, label["path"])), label["text"])
+                     for label in load_labels(corpus_dir) if label["has_text"])
+    return [(image, text) for image, text in found if image is not None]
+
+def word_accuracy(text, expected):
+    words = expected.lower().split()
+    return sum(word in text.lower() for word in words), len(words)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="Also use the text images of this corpus")
+    parser.add_argument("--no-ocr", action="store_true", help="Only measure preprocessing")
+    args = parser.parse_args()
+
+    images = samples(args.corpus)
+    run_ocr = not args.no_ocr
+    if run_ocr:
+        setup_tesseract()
+        if not shutil.which(ocr.pytesseract.pytesseract.tesseract_cmd):
+            print("tesseract not found, reporting preprocessing only (set TESSERACT_PATH)\n")
+            run_ocr = False
+    engine = ocr.get_engine() if run_ocr else None
+
+    print(f"{len(images)} images\n")
+    print(f"{'input':<18} {'prep ms':>8} {'Mpixels':>8} {'OCR s':>7} {'word acc':>8}")
+    for name, config in CONFIGS:
+        prep = ocr_time = 0.0
+        pixels = found = total = 0
+        for image, expected in images:
+            start = time.perf_counter()
+            data = image.image if config is None else preprocess(image.gray, config)
+            prep += time.perf_counter() - start
+            pixels += data.size[0] * data.size[1] if config is None else data.size
+            if engine:
+                start = time.perf_counter()
+                text = engine.image_to_string(data)
+                ocr_time += time.perf_counter() - start
+                hit, count = word_accuracy(text, expected)
+                found += hit
+                total += count
+        accuracy = f"{found / total:.3f}" if total else "-"
+        ocr_column = f"{ocr_time:.2f}" if engine else "-"
+        print(f"{name:<18} {prep * 1000 / len(images):>8.1f} {pixels / 1e6:>8.1f} {ocr_column:>7} {accuracy:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Recall impact and savings of OCR'ing only detected text regions.
+
+Usage: python benchmarks/bench_regions.py [--corpus DIR] [--images 200] [--ocr]
+
+Without Tesseract it reports how many labelled text lines fall inside the
+detected regions and the share of pixels left to OCR. With --ocr it also
+OCRs every text image whole and as crops and compares phrase recall and time.
+"""
+import argparse
+import os
+import tempfile
+import time
+from corpus import generate, load_labels
+from scan_image.config import setup_tesseract
+from scan_image.ocr import get_engine
+from scan_image.regions import find_text_regions
+from scan_image.utils import load_image, np, ocr_text_batch
+
+# A labelled line counts as found when this much of its box is inside a region
+LINE_COVERAGE = 0.9
+
+def line_recall(gray, regions, boxes):
+    if not regions:
+        return len(boxes), len(boxes)
+    height, width = gray.shape
+    mask = np.zeros((height, width), dtype=bool)
+    for region in regions:
+        x0, y0, x1, y1 = region.box
+        mask[y0:y1, x0:x1] = True
+    found = 0
+    for x0, y0, x1, y1 in boxes:
+        x0, y0, x1, y1 = max(0, int(x0)), max(0, int(y0)), min(width, int(x1)), min(height, int(y1))
+        if x1 > x0 and y1 > y0 and mask[y0:y1, x0:x1].mean() >= LINE_COVERAGE:
+            found += 1
+    return found, len(boxes)
+
+def words_found(text, expected):
+    words = expected.lower().split()
+    text = text.lower()
+    return sum(word in text for word in words), len(words)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="Corpus from benchmarks/corpus.py (default: generate a temporary one)")
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--ocr", action="store_true", help="Also run Tesseract on whole images and crops")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus or tmp
+        labels = load_labels(corpus_dir) if args.corpus else generate(corpus_dir, args.images)
+        labels = [label for label in labels if label["has_text"]]
+        images = [load_image(os.path.join(corpus_dir, label["path"])) for label in labels]
+
+        found = total = ocr_pixels = all_pixels = fallbacks = 0
+        start = time.perf_counter()
+        for image, label in zip(images, labels):
+            regions = find_text_regions(image.gray)
+            pixels = image.gray.size
+            all_pixels += pixels
+            if not regions:
+                fallbacks += 1
+                ocr_pixels += pixels
+            else:
+                ocr_pixels += sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in (region.box for region in regions))
+            line_found, line_total = line_recall(image.gray, regions, label["boxes"])
+            found += line_found
+            total += line_total
+        detect_ms = (time.perf_counter() - start) * 1000 / len(images)
+
+        print(f"{len(images)} text images, {total} text lines")
+        print(f"line recall:         {found / total:.3f}")
+        print(f"pixels OCR'd:        {ocr_pixels / all_pixels:.1%} of full images")
+        print(f"whole-image fallback {fallbacks} images")
+        print(f"detection:           {detect_ms:.1f} ms/image")
+
+        if args.ocr:
+            setup_tesseract()
+            engine = get_engine()
+            for name, text_regions in (("whole images", False), ("text regions", True)):
+                start = time.perf_counter()
+                texts = ocr_text_batch(images, engine, text_regions=text_regions)
+                elapsed = time.perf_counter() - start
+                hits = [words_found(text or "", label["text"]) for text, label in zip(texts, labels)]
+                recall = sum(hit for hit, _ in hits) / sum(count for _, count in hits)
+                print(f"{name}: word recall {recall:.3f}, {elapsed:.2f}s ({len(images) / elapsed:.1f} images/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Generate a labelled synthetic image corpus for the benchmarks, fully offline.
+
+Usage: python benchmarks/corpus.py OUT_DIR [--images 200] [--seed 0] [--noise 0]
+       [--duplicates 0]
+
+Writes the images plus labels.json, a list of {"path", "has_text", "text",
+"boxes", "duplicate_of"} records with paths relative to OUT_DIR; boxes are the
+[x0, y0, x1, y1] pixel bounds of each rendered line of text, duplicate_of names
+the image a near-duplicate was derived from. The same arguments always produce
+the same corpus.
+"""
+import argparse
+import json
+import os
+import random
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+FONT_DIRS = ("/usr/share/fonts/truetype/dejavu", "/usr/share/fonts/dejavu", "/Library/Fonts", "C:\\Windows\\Fonts")
+FONT_NAMES = ("DejaVuSans.ttf", "DejaVuSerif.ttf", "DejaVuSansMono.ttf", "Arial.ttf")
+WORDS = ("invoice total amount paid order number customer account balance receipt date "
+         "shipping address confidential report quarterly revenue meeting notes password "
+         "project deadline summary payment reference").split()
+SCALES = (0.5, 1, 2, 4)
+
+def load_font(size, rng):
+    for name in rng.sample(FONT_NAMES, len(FONT_NAMES)):
+        for folder in FONT_DIRS:
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size=size)
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def _background(rng, size):
+    width, height = size
+    kind = rng.choice(("white", "tint", "gradient"))
+    if kind == "white":
+        return Image.new("RGB", size, "white")
+    if kind == "tint":
+        return Image.new("RGB", size, tuple(rng.randint(190, 255) for _ in range(3)))
+    ramp = np.linspace(rng.randint(150, 200), 255, width, dtype=np.uint8)
+    return Image.fromarray(np.tile(ramp, (height, 1))).convert("RGB")
+
+def _photo(rng, size):
+    """Smooth blobs and a few shapes: edges, but nothing shaped like characters."""
+    width, height = size
+    noise = np.random.default_rng(rng.randrange(2 ** 32)).integers(0, 256, (height // 16 + 1, width // 16 + 1, 3))
+    img = Image.fromarray(noise.astype(np.uint8)).resize(size, Image.BICUBIC).filter(ImageFilter.GaussianBlur(4))
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(0, 4)):
+        x, y = rng.randrange(width), rng.randrange(height)
+        r = rng.randint(min(size) // 10, min(size) // 3)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+    return img
+
+def text_image(rng, scale):
+    """A document, label, screenshot or captioned photo; returns (image, text, line boxes)."""
+    kind = rng.choice(("document", "label", "screenshot", "caption"))
+    if kind == "document":
+        size = (int(600 * scale), int(800 * scale))
+        img = _background(rng, size)
+        font_size = int(rng.randint(12, 18) * scale)
+        lines = [sentence(rng, rng.randint(3, 7)) for _ in range(rng.randint(5, 25))]
+    elif kind == "label":
+        size = (int(rng.randint(200, 500) * scale), int(rng.randint(100, 200) * scale))
+        img = _background(rng, size)
+        font_size = int(rng.randint(20, 40) * scale)
+        lines = [sentence(rng, rng.randint(1, 2))]
+    elif kind == "screenshot":
+        size = (int(800 * scale), int(500 * scale))
+        img = Image.new("RGB", size, tuple(rng.randint(200, 250) for _ in range(3)))
+        font_size = int(rng.randint(11, 15) * scale)
+        lines = [sentence(rng, rng.randint(2, 5)) for _ in range(rng.randint(2, 10))]
+    else:
+        size = (int(640 * scale), int(480 * scale))
+        img = _photo(rng, size)
+        font_size = int(rng.randint(18, 30) * scale)
+        lines = [sentence(rng, rng.randint(2, 4))]
+
+    font = load_font(max(font_size, 6), rng)
+    draw = ImageDraw.Draw(img)
+    ink = (0, 0, 0) if kind != "caption" else (255, 255, 255)
+    boxes = []
+    x = int(rng.randint(10, 40) * scale)
+    y = int(rng.randint(10, 40) * scale) if kind != "caption" else size[1] - int(font_size * 1.6) - int(10 * scale)
+    for line in lines:
+        if y + font_size > size[1]:
+            break
+        if kind == "caption":
+            box = draw.textbbox((x, y), line, font=font)
+            draw.rectangle((box[0] - 4, box[1] - 4, box[2] + 4, box[3] + 4), fill=(0, 0, 0))
+        draw.text((x, y), line, fill=ink, font=font)
+        boxes.append(list(draw.textbbox((x, y), line, font=font)))
+        y += int(font_size * 1.5)
+    # Only the lines that fit are in the image
+    return img, "\n".join(lines[:len(boxes)]), boxes
+
+def blank_image(rng, scale):
+    """Blank, gradient, flat colour or photo-like image without text."""
+    kind = rng.choice(("blank", "gradient", "photo", "shapes"))
+    size = (int(rng.randint(300, 800) * scale), int(rng.randint(200, 600) * scale))
+    if kind == "photo":
+        return _photo(rng, size)
+    img = _background(rng, size) if kind != "blank" else Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    if kind == "shapes":
+        draw = ImageDraw.Draw(img)
+        for _ in range(rng.randint(1, 5)):
+            x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+            x1, y1 = x0 + rng.randint(size[0] // 8, size[0] // 2), y0 + rng.randint(size[1] // 8, size[1] // 2)
+            draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+    return img
+
+def add_noise(rng, img, sigma):
+    """Gaussian sensor-like noise with a standard deviation of up to sigma grey levels."""
+    noise_rng = np.random.default_rng(rng.randrange(2 ** 32))
+    pixels = np.asarray(img, dtype=np.float32)
+    pixels = pixels + noise_rng.normal(0, rng.uniform(0, sigma), pixels.shape)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+def near_duplicate(rng, img, boxes):
+    """A slightly cropped and resized copy of img (saved recompressed by the caller) and its line boxes."""
+    width, height = img.size
+    dx, dy = int(width * rng.uniform(0, 0.03)), int(height * rng.uniform(0, 0.03))
+    factor = rng.uniform(0.7, 1.0)
+    img = img.crop((dx, dy, width - dx, height - dy))
+    img = img.resize((max(1, int(img.width * factor)), max(1, int(img.height * factor))), Image.BILINEAR)
+    boxes = [[(x0 - dx) * factor, (y0 - dy) * factor, (x1 - dx) * factor, (y1 - dy) * factor]
+             for x0, y0, x1, y1 in boxes]
+    return img, boxes
+
+def generate(out_dir, count=200, seed=0, text_ratio=0.5, scales=SCALES, noise=0.0, duplicate_ratio=0.0):
+    """Write count images into out_dir and return their label records.
+
+    noise adds Gaussian noise of up to that many grey levels to every image;
+    duplicate_ratio is the share of images that are near-duplicates of an earlier one.
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    labels = []
+    for i in range(count):
+        if labels and duplicate_ratio and rng.random() < duplicate_ratio:
+            source = rng.choice([label for label in labels if label["duplicate_of"] is None])
+            with Image.open(os.path.join(out_dir, source["path"])) as original:
+                img, boxes = near_duplicate(rng, original.convert("RGB"), source["boxes"])
+            name = f"{i:05d}_{'text' if source['has_text'] else 'blank'}_dup.jpg"
+            img.save(os.path.join(out_dir, name), quality=rng.randint(60, 85))
+            labels.append({"path": name, "has_text": source["has_text"], "text": source["text"], "boxes": boxes,
+                           "duplicate_of": source["path"]})
+            continue
+        scale = rng.choice(scales)
+        has_text = rng.random() < text_ratio
+        img, text, boxes = text_image(rng, scale) if has_text else (blank_image(rng, scale), "", [])
+        if noise:
+            img = add_noise(rng, img, noise)
+        ext = rng.choice((".png", ".jpg"))
+        name = f"{i:05d}_{'text' if has_text else 'blank'}{ext}"
+        options = {"quality": 90} if ext == ".jpg" else {}
+        img.save(os.path.join(out_dir, name), **options)
+        labels.append({"path": name, "has_text": has_text, "text": text, "boxes": boxes, "duplicate_of": None})
+    with open(os.path.join(out_dir, "labels.json"), "w") as f:
+        json.dump(labels, f, indent=1)
+    return labels
+
+def load_labels(corpus_dir):
+    with open(os.path.join(corpus_dir, "labels.json")) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--noise", type=float, default=0.0, help="Maximum Gaussian noise in grey levels")
+    parser.add_argument("--duplicates", type=float, default=0.0, help="Share of near-duplicate images")
+    args = parser.parse_args()
+    labels = generate(args.out_dir, args.images, args.seed, noise=args.noise, duplicate_ratio=args.duplicates)
+    print(f"Wrote {len(labels)} images ({sum(label['has_text'] for label in labels)} with text) to {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
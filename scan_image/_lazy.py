@@ -0,0 +1,35 @@
+import importlib
+
+class LazyModule:
+    """Stand-in for a heavy module that is only imported on first attribute access.
+
+    Attribute writes and deletes are forwarded too, so unittest.mock.patch works
+    on names such as ``scan_image.utils.cv2.imread``. on_load, if given, is
+    called with the module once it is imported.
+    """
+
+    def __init__(self, name, on_load=None):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+        object.__setattr__(self, "_on_load", on_load)
+
+    def _load(self):
+        if self._module is None:
+            module = importlib.import_module(self._name)
+            if self._on_load is not None:
+                self._on_load(module)
+            object.__setattr__(self, "_module", module)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
@@ -0,0 +1,160 @@
+import os
+import zlib
+import logging
+import tarfile
+import zipfile
+import threading
+from collections import OrderedDict
+from .config import IMAGE_EXTENSIONS
+
+ZIP_EXTENSIONS = (".zip",)
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+ARCHIVE_EXTENSIONS = ZIP_EXTENSIONS + TAR_EXTENSIONS
+# Members are reported as "<archive path>!/<path inside the archive>"
+SEPARATOR = "!/"
+# Archives kept open per thread for reading single members
+OPEN_ARCHIVES = 4
+
+_ARCHIVE_ERRORS = (OSError, EOFError, zlib.error, zipfile.BadZipFile, tarfile.TarError)
+_local = threading.local()
+
+def is_archive(name):
+    return name.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def is_tar(name):
+    return name.lower().endswith(TAR_EXTENSIONS)
+
+def _is_image(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+def member_path(archive_path, name):
+    return f"{archive_path}{SEPARATOR}{name}"
+
+def split_member_path(path):
+    """(archive path, member name) for a path inside an archive, or None for a plain file."""
+    start = 0
+    while True:
+        index = path.find(SEPARATOR, start)
+        if index == -1:
+            return None
+        if is_archive(path[:index]):
+            return path[:index], path[index + len(SEPARATOR):]
+        start = index + 1
+
+def iter_members(archive_path):
+    """Yield (member path, bytes) for every image in an archive, reading it once from start to end.
+
+    Members that cannot be read are skipped with a warning; a damaged
+    archive ends the iteration early.
+    """
+    try:
+        if archive_path.lower().endswith(ZIP_EXTENSIONS):
+            with zipfile.ZipFile(archive_path) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not _is_image(info.filename):
+                        continue
+                    try:
+                        data = archive.read(info)
+                    except (RuntimeError, *_ARCHIVE_ERRORS) as e:
+                        # Encrypted or corrupt member
+                        logging.warning(f"Cannot read {member_path(archive_path, info.filename)}: {e}")
+                        continue
+                    yield member_path(archive_path, info.filename), data
+        else:
+            # Stream mode: compressed tars are decompressed once, without seeking back
+            with tarfile.open(archive_path, "r|*") as archive:
+                for info in archive:
+                    if info.isfile() and _is_image(info.name):
+                        yield member_path(archive_path, info.name), archive.extractfile(info).read()
+    except _ARCHIVE_ERRORS as e:
+        logging.warning(f"Cannot read archive {archive_path}: {e}")
+
+def member_sizes(archive_path):
+    """Yield (member path, uncompressed size) for every image in an archive without reading the members.
+
+    For a compressed tar this still decompresses the whole archive.
+    """
+    try:
+        if archive_path.lower().endswith(ZIP_EXTENSIONS):
+            with zipfile.ZipFile(archive_path) as archive:
+                members = [(info.filename, info.file_size) for info in archive.infolist()
+                           if not info.is_dir() and _is_image(info.filename)]
+        else:
+            with tarfile.open(archive_path, "r:*") as archive:
+                members = [(info.name, info.size) for info in archive.getmembers()
+                           if info.isfile() and _is_image(info.name)]
+    except _ARCHIVE_ERRORS as e:
+        logging.warning(f"Cannot read archive {archive_path}: {e}")
+        return
+    for name, size in members:
+        yield member_path(archive_path, name), size
+
+def _open_archive(archive_path):
+    """An open archive for this thread, kept for the next members of the same archive."""
+    archives = getattr(_local, "archives", None)
+    if archives is None:
+        archives = _local.archives = OrderedDict()
+    archive = archives.get(archive_path)
+    if archive is not None:
+        archives.move_to_end(archive_path)
+        return archive
+    if archive_path.lower().endswith(ZIP_EXTENSIONS):
+        archive = zipfile.ZipFile(archive_path)
+    else:
+        archive = tarfile.open(archive_path, "r:*")
+    archives[archive_path] = archive
+    if len(archives) > OPEN_ARCHIVES:
+        archives.popitem(last=False)[1].close()
+    return archive
+
+def read_member(path):
+    """Read one member by its member path.
+
+    Zip members are read directly; compressed tars have to be decompressed up
+    to the member, so scans read those in one pass with iter_members instead.
+    """
+    archive_path, name = split_member_path(path)
+    try:
+        archive = _open_archive(archive_path)
+        if isinstance(archive, zipfile.ZipFile):
+            return archive.read(name)
+        member = archive.extractfile(name)
+        if member is None:
+            raise OSError(f"Not a file: {path}")
+        return member.read()
+    except KeyError:
+        raise FileNotFoundError(f"No such member: {path}") from None
+    except OSError:
+        raise
+    except (RuntimeError, *_ARCHIVE_ERRORS) as e:
+        raise OSError(f"Cannot read {path}: {e}") from e
+
+def read_tar_members(paths):
+    """Yield paths, tar members becoming (member path, bytes) pairs read in one pass per tar, after the others.
+
+    Read one by one, the members of a compressed tar would each decompress
+    the archive up to themselves; zip members are left to read_member.
+    """
+    tars = {}
+    for path in paths:
+        parts = split_member_path(path)
+        if parts is not None and is_tar(parts[0]):
+            tars.setdefault(parts[0], set()).add(path)
+        else:
+            yield path
+    for archive_path, wanted in tars.items():
+        for item in iter_members(archive_path):
+            if item[0] in wanted:
+                yield item
+
+def read_bytes(path):
+    """Contents of a file or of an archive member."""
+    if split_member_path(path) is not None:
+        return read_member(path)
+    with open(path, "rb") as f:
+        return f.read()
+
+def stat_path(path):
+    """os.stat of a file, or of the archive holding a member, which changes whenever the member does."""
+    parts = split_member_path(path)
+    return os.stat(parts[0] if parts else path)
@@ -0,0 +1,148 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+from collections import namedtuple
+from contextlib import contextmanager
+
+CACHE_VERSION = 1
+CACHE_FILENAME = "ocr_cache.sqlite3"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Check the cache size after this many writes
+EVICT_EVERY = 200
+
+# valid: the file decoded and passed the size check; has_text: the text heuristic passed;
+# phash: hex perceptual hash or None; text: OCR text, None until OCR has run
+CacheEntry = namedtuple("CacheEntry", ["valid", "has_text", "phash", "text"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    valid INTEGER NOT NULL,
+    has_text INTEGER NOT NULL,
+    phash TEXT,
+    text TEXT,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE TABLE IF NOT EXISTS paths (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    key TEXT NOT NULL
+);
+"""
+
+def content_key(data):
+    """Cache key for a file's bytes."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+def make_fingerprint(tesseract_version, **settings):
+    """Everything that changes OCR or filter results; a different fingerprint empties the cache."""
+    parts = [f"cache={CACHE_VERSION}", f"tesseract={tesseract_version}"]
+    parts.extend(f"{name}={settings[name]}" for name in sorted(settings))
+    return ";".join(parts)
+
+class OcrCache:
+    """SQLite store of per-image results keyed by content hash, with a (path, size, mtime) fast path."""
+
+    def __init__(self, cache_dir, fingerprint, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILENAME)
+        self.max_bytes = max_bytes
+        self._writes = 0
+        # Workers share the file, so wait on locks instead of failing
+        self._db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._check_fingerprint(fingerprint)
+
+    def _check_fingerprint(self, fingerprint):
+        with self._transaction():
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'fingerprint'").fetchone()
+            if row and row[0] == fingerprint:
+                return
+            if row:
+                logging.info("OCR cache settings or Tesseract version changed, clearing the cache")
+            self._db.execute("DELETE FROM entries")
+            self._db.execute("DELETE FROM paths")
+            self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('fingerprint', ?)", (fingerprint,))
+
+    @contextmanager
+    def _transaction(self):
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def lookup_path(self, path, size, mtime_ns):
+        """Return the content key recorded for an unchanged file, or None."""
+        row = self._db.execute("SELECT size, mtime_ns, key FROM paths WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == size and row[1] == mtime_ns:
+            return row[2]
+        return None
+
+    def link_path(self, path, size, mtime_ns, key):
+        self._db.execute("INSERT OR REPLACE INTO paths (path, size, mtime_ns, key) VALUES (?, ?, ?, ?)",
+                         (path, size, mtime_ns, key))
+
+    def get(self, key):
+        row = self._db.execute("SELECT valid, has_text, phash, text FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return CacheEntry(bool(row[0]), bool(row[1]), row[2], row[3])
+
+    def put(self, key, entry):
+        size = len(key) + len(entry.phash or "") + len((entry.text or "").encode("utf-8")) + 64
+        self._db.execute("INSERT OR REPLACE INTO entries (key, valid, has_text, phash, text, size, last_used) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (key, int(entry.valid), int(entry.has_text), entry.phash, entry.text, size, time.time()))
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def total_size(self):
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self):
+        """Drop least recently used entries until the cache is below 90% of max_bytes."""
+        total = self.total_size()
+        if total <= self.max_bytes:
+            return 0
+        target = self.max_bytes * 0.9
+        removed = 0
+        with self._transaction():
+            rows = self._db.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall()
+            for key, size in rows:
+                if total <= target:
+                    break
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+            self._db.execute("DELETE FROM paths WHERE key NOT IN (SELECT key FROM entries)")
+        logging.debug(f"Evicted {removed} entries from the OCR cache")
+        return removed
+
+    def close(self):
+        self._db.close()
+
+_cache = None
+
+def open_cache(cache_dir, fingerprint, max_bytes=DEFAULT_MAX_BYTES):
+    """Open the cache used by get_cache() in this process; also called from the Pool initializer."""
+    global _cache
+    if _cache is not None:
+        _cache.close()
+    _cache = OcrCache(cache_dir, fingerprint, max_bytes) if cache_dir else None
+    return _cache
+
+def get_cache():
+    return _cache
@@ -1,19 +1,41 @@
 import os
-import pytesseract
 import logging
+from ._lazy import LazyModule
+
+pytesseract = LazyModule("pytesseract")
 
 IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tiff"}
 MIN_WIDTH = 50
 MIN_HEIGHT = 50
+# Pages with more pixels are skipped: even decoded one page at a time and as
+# grayscale, they would not fit in a worker's memory
+MAX_PIXELS = 500_000_000
+# Pages whose decoding takes more memory at its peak are skipped too. Only
+# JPEG decodes straight to grayscale: other formats are decoded in their own
+# mode, up to 4 bytes per pixel, before the grayscale copy is made
+MAX_DECODE_BYTES = 1_000_000_000
 
-def setup_tesseract():
-    """Configure Tesseract path from environment variable and log version once."""
+_tesseract_version = None
+
+def configure_tesseract():
+    """Point pytesseract at TESSERACT_PATH if set. Cheap enough to run in every worker."""
     tesseract_path = os.getenv("TESSERACT_PATH")
     if tesseract_path:
         pytesseract.pytesseract.tesseract_cmd = tesseract_path
 
+def setup_tesseract():
+    """Configure Tesseract path from environment variable and log version once."""
+    global _tesseract_version
+    configure_tesseract()
+
     try:
-        version = pytesseract.get_tesseract_version()
-        logging.debug(f"Tesseract version {version} from binary: {pytesseract.pytesseract.tesseract_cmd}")
+        _tesseract_version = pytesseract.get_tesseract_version()
+        logging.debug(f"Tesseract version {_tesseract_version} from binary: {pytesseract.pytesseract.tesseract_cmd}")
     except pytesseract.pytesseract.TesseractNotFoundError:
+        _tesseract_version = None
         logging.error("Tesseract not found. Ensure TESSERACT_PATH points to the full executable path.")
+    return _tesseract_version
+
+def tesseract_version():
+    """Tesseract version found by setup_tesseract(), probing the binary if it has not run yet."""
+    return _tesseract_version if _tesseract_version is not None else setup_tesseract()
@@ -0,0 +1,141 @@
+import argparse
+from itertools import combinations
+
+# Hashes are split into this many chunks; any two hashes within d bits of
+# each other differ in at most d // CHUNKS bits in at least one chunk. Three
+# ~21-bit chunks keep buckets small for collections of up to millions of
+# hashes while probing only a few hundred buckets for d <= 8.
+CHUNKS = 3
+# Largest distance accepted: the buckets probed per chunk grow
+# combinatorially with it, past the cost of comparing every pair
+MAX_DISTANCE = 12
+
+if hasattr(int, "bit_count"):
+    _popcount = int.bit_count
+else:
+    def _popcount(value):
+        return bin(value).count("1")
+
+def check_distance(distance):
+    """Raise ValueError unless distance is a whole number of bits from 0 to MAX_DISTANCE."""
+    if isinstance(distance, bool) or not isinstance(distance, int) or not 0 <= distance <= MAX_DISTANCE:
+        raise ValueError(f"dedupe distance must be a whole number from 0 to {MAX_DISTANCE}, got {distance!r}")
+
+def distance_arg(value):
+    """argparse type for --dedupe-distance."""
+    try:
+        distance = int(value)
+        check_distance(distance)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number of bits from 0 to {MAX_DISTANCE}, got '{value}'")
+    return distance
+
+def hash_to_int(phash):
+    """Pack a hex perceptual hash (as stored in results and the cache) into an int."""
+    return int(str(phash), 16)
+
+def _flip_masks(bits, radius):
+    """Every mask of at most radius set bits within a bits-wide chunk."""
+    masks = [0]
+    for count in range(1, radius + 1):
+        for positions in combinations(range(bits), count):
+            mask = 0
+            for position in positions:
+                mask |= 1 << position
+            masks.append(mask)
+    return masks
+
+class HammingIndex:
+    """Multi-index hashing over packed perceptual hashes.
+
+    find() returns the stored item closest to a hash within max_distance bits
+    by probing a few buckets per chunk instead of comparing against every
+    stored hash.
+    """
+
+    def __init__(self, max_distance=0):
+        check_distance(max_distance)
+        self.max_distance = max_distance
+        self._bits = None
+        self._tables = [{} for _ in range(CHUNKS)]
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _setup(self, bits):
+        self._bits = bits
+        self._chunk_bits = -(-bits // CHUNKS)
+        self._chunk_mask = (1 << self._chunk_bits) - 1
+        self._masks = _flip_masks(self._chunk_bits, min(self.max_distance // CHUNKS, self._chunk_bits))
+
+    def _chunks(self, value):
+        for i in range(CHUNKS):
+            yield (value >> (i * self._chunk_bits)) & self._chunk_mask
+
+    def add(self, phash, item):
+        value = hash_to_int(phash)
+        if self._bits is None:
+            self._setup(len(str(phash)) * 4)
+        position = len(self._entries)
+        self._entries.append((value, item))
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            table.setdefault(chunk, []).append(position)
+
+    def find(self, phash):
+        """The item stored under the nearest hash within max_distance bits, or None."""
+        if self._bits is None:
+            return None
+        value = hash_to_int(phash)
+        best = None
+        seen = set()
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            for mask in self._masks:
+                for position in table.get(chunk ^ mask, ()):
+                    if position in seen:
+                        continue
+                    seen.add(position)
+                    stored, item = self._entries[position]
+                    distance = _popcount(stored ^ value)
+                    if distance <= self.max_distance and (best is None or distance < best[0]):
+                        if distance == 0:
+                            return item
+                        best = (distance, item)
+        return best[1] if best else None
+
+class NearDuplicates:
+    """Groups hashes under the first image seen within max_distance bits of them."""
+
+    def __init__(self, max_distance=0):
+        self.max_distance = max_distance
+        self._index = HammingIndex(max_distance)
+        self._exact = {}
+        self.groups = {}
+
+    def add(self, path, phash):
+        """Record an image; returns its representative, which is path itself for a new group.
+
+        Adding a path again, e.g. a rewritten file, never makes it a duplicate of itself.
+        """
+        if self.max_distance == 0 or phash is None:
+            representative = self._exact.get(phash)
+            if representative is None:
+                self._exact[phash] = path
+        else:
+            representative = self._index.find(phash)
+            if representative is None:
+                self._index.add(phash, path)
+        if representative is None:
+            self.groups[path] = []
+            return path
+        if representative == path:
+            return path
+        self.groups[representative].append(path)
+        return representative
+
+def group_near_duplicates(items, max_distance=0):
+    """Group (path, phash) pairs; returns {representative: [near-duplicate paths]} in first-seen order."""
+    duplicates = NearDuplicates(max_distance)
+    for path, phash in items:
+        duplicates.add(path, phash)
+    return duplicates.groups
@@ -0,0 +1,89 @@
+import os
+import hashlib
+import logging
+from .archives import is_archive, is_tar, iter_members, member_sizes
+from .config import IMAGE_EXTENSIONS
+
+PROGRESS_INTERVAL = 1000
+
+def iter_image_files(folder, progress_interval=PROGRESS_INTERVAL, archives=False):
+    """Yield image paths under folder as they are found, logging a running total.
+
+    With archives, zip and tar files are searched like folders: each image
+    inside is yielded as a (member path, bytes) pair, the archive being read
+    once from start to end.
+    """
+    for entry in _iter_image_entries(folder, progress_interval, archives):
+        if archives and is_archive(entry.name):
+            yield from iter_members(entry.path)
+        else:
+            yield entry.path
+
+def iter_image_sizes(folder, progress_interval=PROGRESS_INTERVAL, archives=False):
+    """Like iter_image_files, yielding (path, size in bytes); the size is 0 when it cannot be read.
+
+    With archives, the images inside zip files are listed by their member
+    paths. Tar files are listed whole, as (archive path, archive size): their
+    members can only be read cheaply in one pass, with iter_members.
+    """
+    for entry in _iter_image_entries(folder, progress_interval, archives):
+        if archives and is_archive(entry.name) and not is_tar(entry.name):
+            yield from member_sizes(entry.path)
+            continue
+        try:
+            size = entry.stat().st_size
+        except OSError:
+            size = 0
+        yield entry.path, size
+
+def item_path(item):
+    """The path of a discovered item, which is a path or a (path, bytes) pair."""
+    return item[0] if isinstance(item, tuple) else item
+
+def _iter_image_entries(folder, progress_interval, archives=False):
+    found = 0
+    pending = [folder]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                subdirs = []
+                for entry in entries:
+                    try:
+                        # Like os.walk, do not descend into symlinked directories
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                            continue
+                    except OSError:
+                        continue
+                    if (os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTENSIONS
+                            and not (archives and is_archive(entry.name))):
+                        continue
+                    found += 1
+                    if progress_interval and found % progress_interval == 0:
+                        logging.info(f"Found {found} image files so far...")
+                    yield entry
+        except OSError as e:
+            logging.warning(f"Cannot read directory {current}: {e}")
+            continue
+        # Reverse so directories are visited in listing order
+        pending.extend(reversed(subdirs))
+    logging.info(f"Discovery complete: found {found} image files")
+
+def shard_of(relative_path, count):
+    """Shard (0 to count-1) of a path relative to the scanned folder, the same on every machine and OS."""
+    key = relative_path.replace(os.sep, "/").encode("utf-8", "surrogateescape")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big") % count
+
+def filter_shard(image_paths, folder, shard, key=None):
+    """Keep the paths that belong to shard, an (index, count) pair; None keeps everything.
+
+    key extracts the path from each item, e.g. for (path, size) pairs.
+    """
+    if shard is None:
+        yield from image_paths
+        return
+    index, count = shard
+    for item in image_paths:
+        if shard_of(os.path.relpath(key(item) if key else item, folder), count) == index:
+            yield item
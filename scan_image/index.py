@@ -0,0 +1,227 @@
+import os
+import time
+import sqlite3
+import logging
+import argparse
+from multiprocessing import Pool, cpu_count
+from .cache import DEFAULT_MAX_BYTES
+from .config import setup_tesseract
+from .dedupe import MAX_DISTANCE, NearDuplicates, distance_arg
+from .discovery import iter_image_files
+from .logger import setup_logging
+from .matcher import PhraseMatcher, read_phrases_file
+from .ocr import ENGINE_NAMES
+from .scanner import (BATCH_SIZE, _add_stage_arguments, _batched, _fingerprint, _imap_bounded, _init_worker,
+                      _prefilter_from_args, _preprocess_from_args, _worker_initargs, extract_texts)
+
+DEFAULT_INDEX = "scan-image-index.sqlite3"
+# Shortest phrase the trigram index can answer; shorter ones scan every text
+MIN_INDEXED_PHRASE = 3
+COMMIT_EVERY = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    phash TEXT,
+    has_text INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS texts USING fts5(text, tokenize='trigram');
+"""
+
+class TextIndex:
+    """SQLite FTS5 index of OCR text, perceptual hash and file stamp per image."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path)
+        self._db.executescript(_SCHEMA)
+
+    def check_fingerprint(self, fingerprint):
+        """Drop everything if the index was built with a different Tesseract or engine."""
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'fingerprint'").fetchone()
+        if row and row[0] == fingerprint:
+            return False
+        if row:
+            logging.info("Tesseract version or OCR settings changed, rebuilding the whole index")
+        self._db.execute("DELETE FROM images")
+        self._db.execute("DELETE FROM texts")
+        self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('fingerprint', ?)", (fingerprint,))
+        self._db.commit()
+        return bool(row)
+
+    def stamps(self, folder):
+        """{path: (size, mtime_ns)} of indexed images under folder."""
+        prefix = os.path.join(folder, "")
+        rows = self._db.execute("SELECT path, size, mtime_ns FROM images WHERE substr(path, 1, ?) = ?",
+                                (len(prefix), prefix))
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def add(self, path, size, mtime_ns, phash, has_text, text):
+        self.remove(path)
+        cursor = self._db.execute("INSERT INTO images (path, size, mtime_ns, phash, has_text) VALUES (?, ?, ?, ?, ?)",
+                                  (path, size, mtime_ns, phash, int(has_text)))
+        self._db.execute("INSERT INTO texts (rowid, text) VALUES (?, ?)", (cursor.lastrowid, text or ""))
+
+    def remove(self, path):
+        row = self._db.execute("SELECT id FROM images WHERE path = ?", (path,)).fetchone()
+        if row:
+            self._db.execute("DELETE FROM texts WHERE rowid = ?", row)
+            self._db.execute("DELETE FROM images WHERE id = ?", row)
+
+    def commit(self):
+        self._db.commit()
+
+    def _candidates(self, phrase):
+        if len(phrase) < MIN_INDEXED_PHRASE:
+            return self._db.execute("SELECT images.path, images.phash, texts.text FROM texts "
+                                    "JOIN images ON images.id = texts.rowid WHERE images.has_text")
+        quoted = '"' + phrase.replace('"', '""') + '"'
+        return self._db.execute("SELECT images.path, images.phash, texts.text FROM texts "
+                                "JOIN images ON images.id = texts.rowid WHERE texts MATCH ?", (quoted,))
+
+    def query(self, phrases, report_duplicates=False, dedupe_distance=0):
+        """Return {path: [phrases]} with the same semantics as a scan: case-insensitive substring
+        matches, one image per group of perceptual hashes within dedupe_distance bits unless
+        report_duplicates is set."""
+        matcher = PhraseMatcher(phrases)
+        found = {}
+        for phrase in matcher.phrases:
+            # The trigram index narrows the candidates, the matcher decides
+            for path, phash, text in self._candidates(phrase):
+                if path not in found:
+                    found[path] = (phash, text)
+        results = {}
+        duplicates = NearDuplicates(dedupe_distance)
+        for path in sorted(found):
+            phash, text = found[path]
+            matched = matcher.find(text)
+            if not matched:
+                continue
+            if not report_duplicates and duplicates.add(path, phash) != path:
+                continue
+            results[path] = matched
+        return results
+
+    def close(self):
+        self._db.close()
+
+def build_index(folder, db_path=DEFAULT_INDEX, ocr_engine="auto", cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES,
+                prefilter=None, text_regions=False, preprocess=None):
+    """OCR new and changed images under folder into the index and drop deleted ones.
+
+    Returns (indexed, unchanged, removed) counts.
+    """
+    folder = os.path.abspath(folder)
+    index = TextIndex(db_path)
+    try:
+        index.check_fingerprint(_fingerprint(ocr_engine, prefilter, text_regions, preprocess))
+        known = index.stamps(folder)
+        seen = set()
+        counts = {"unchanged": 0}
+
+        def changed_files():
+            for image_path in iter_image_files(folder):
+                seen.add(image_path)
+                try:
+                    st = os.stat(image_path)
+                except OSError:
+                    continue
+                if known.get(image_path) == (st.st_size, st.st_mtime_ns):
+                    counts["unchanged"] += 1
+                    continue
+                yield image_path
+
+        indexed = 0
+        processes = cpu_count()
+        initargs = _worker_initargs(ocr_engine, cache_dir, cache_max_bytes, prefilter, text_regions, preprocess,
+                                    processes)
+        with Pool(processes=processes, initializer=_init_worker, initargs=initargs) as pool:
+            for results in _imap_bounded(pool, extract_texts, _batched(changed_files(), BATCH_SIZE), processes):
+                for image_path, size, mtime_ns, entry in results:
+                    # Leave images whose OCR failed out, so the next run retries them
+                    if entry.has_text and entry.text is None:
+                        continue
+                    index.add(image_path, size, mtime_ns, entry.phash, entry.has_text, entry.text)
+                    indexed += 1
+                    if indexed % COMMIT_EVERY == 0:
+                        index.commit()
+
+        removed = [path for path in known if path not in seen]
+        for path in removed:
+            index.remove(path)
+        index.commit()
+        return indexed, counts["unchanged"], len(removed)
+    finally:
+        index.close()
+
+def index_main(argv):
+    parser = argparse.ArgumentParser(prog="scan-image index",
+                                     description="OCR a folder once into a full-text index for fast phrase queries.")
+    parser.add_argument("folder", help="Folder path to index")
+    parser.add_argument("--db", default=os.getenv("SCAN_IMAGE_INDEX", DEFAULT_INDEX),
+                        help="Index database file (default: $SCAN_IMAGE_INDEX or %(default)s)")
+    parser.add_argument("--ocr-engine", choices=ENGINE_NAMES, default="auto", help="OCR backend")
+    parser.add_argument("--cache-dir", default=os.getenv("SCAN_IMAGE_CACHE_DIR"),
+                        help="Directory for the persistent OCR result cache")
+    _add_stage_arguments(parser)
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    setup_tesseract()
+    if not os.path.isdir(args.folder):
+        logging.error(f"The folder '{args.folder}' does not exist.")
+        exit(1)
+
+    start_time = time.time()
+    indexed, unchanged, removed = build_index(args.folder, args.db, ocr_engine=args.ocr_engine,
+                                              cache_dir=args.cache_dir, prefilter=_prefilter_from_args(args),
+                                              text_regions=args.text_regions,
+                                              preprocess=_preprocess_from_args(args))
+    logging.success(f"Index '{args.db}' updated: {indexed} images indexed, {unchanged} unchanged, {removed} removed")
+    logging.info(f"Time taken: {time.time() - start_time:.2f} seconds")
+
+def query_main(argv):
+    parser = argparse.ArgumentParser(prog="scan-image query",
+                                     description="Find indexed images whose OCR text contains the given phrases.")
+    parser.add_argument("phrases", nargs="*", help="Phrases to look up")
+    parser.add_argument("--phrases-file", help="File with one phrase per line to look up")
+    parser.add_argument("--db", default=os.getenv("SCAN_IMAGE_INDEX", DEFAULT_INDEX),
+                        help="Index database file (default: $SCAN_IMAGE_INDEX or %(default)s)")
+    parser.add_argument("--all-duplicates", action="store_true",
+                        help="List every matching image instead of one per perceptual hash")
+    parser.add_argument("--dedupe-distance", type=distance_arg, default=0,
+                        help="Treat images whose perceptual hashes differ in at most this many bits as duplicates "
+                             f"(0 to {MAX_DISTANCE})")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    phrases = list(args.phrases)
+    if args.phrases_file:
+        phrases.extend(read_phrases_file(args.phrases_file))
+    if not phrases:
+        parser.error("no phrases given")
+    if not os.path.isfile(args.db):
+        logging.error(f"The index '{args.db}' does not exist. Build it with 'scan-image index FOLDER'.")
+        exit(1)
+
+    index = TextIndex(args.db)
+    try:
+        found = index.query(phrases, report_duplicates=args.all_duplicates, dedupe_distance=args.dedupe_distance)
+    finally:
+        index.close()
+    if found:
+        count = len(found)
+        word = "image" if count == 1 else "images"
+        if len(phrases) == 1:
+            paths_str = "\n".join(f"- {img}" for img in found)
+        else:
+            paths_str = "\n".join(f"- {img}: {', '.join(matched)}" for img, matched in found.items())
+        logging.success(f"Query complete: {count} indexed {word} matched:\n{paths_str}")
+    elif len(phrases) == 1:
+        logging.warning("No indexed images contain the phrase.")
+    else:
+        logging.warning("No indexed images contain any of the phrases.")
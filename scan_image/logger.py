@@ -38,8 +38,8 @@ class ColorFormatter(logging.Formatter):
         color = self.COLORS.get(record.levelno, "")
         return f"{color}{base}{Style.RESET_ALL}"
 
-def setup_logging():
+def setup_logging(level=logging.INFO):
     handler = logging.StreamHandler()
     formatter = ColorFormatter("%(asctime)s [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S")
     handler.setFormatter(formatter)
-    logging.basicConfig(level=logging.INFO, handlers=[handler])
+    logging.basicConfig(level=level, handlers=[handler])
@@ -0,0 +1,167 @@
+from collections import deque
+from functools import lru_cache
+
+class PhraseMatcher:
+    """Case-insensitive Aho-Corasick matcher: finds every phrase in a single pass over the text."""
+
+    def __init__(self, phrases):
+        # Keep the caller's order but drop repeats
+        self.phrases = tuple(dict.fromkeys(phrases))
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [set()]
+        for index, phrase in enumerate(self.phrases):
+            node = 0
+            for char in phrase.lower():
+                nxt = self._goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(set())
+                node = nxt
+            self._out[node].add(index)
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] |= self._out[self._fail[child]]
+
+    def advance(self, node, text):
+        """Run text through the automaton from state node; returns the new state and (offset, phrase index) per match end."""
+        goto, fail, out = self._goto, self._fail, self._out
+        ends = []
+        for offset, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            ends.extend((offset, index) for index in out[node])
+        return node, ends
+
+    def find(self, text):
+        """Return the phrases found in text, in the order they were given."""
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = set(out[0])  # an empty phrase matches any text
+        node = 0
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                hits |= out[node]
+                if len(hits) == len(self.phrases):
+                    break
+        return [self.phrases[index] for index in sorted(hits)]
+
+# Characters a word may end with when the OCR'd text hyphenates it at a line end
+HYPHENS = ("-", "\u00ad", "\u2010")
+
+def normalize(text):
+    """Lowercase text and collapse every run of whitespace, line breaks included, into one space."""
+    return " ".join(text.lower().split())
+
+@lru_cache(maxsize=8)
+def _variants_matcher(phrases):
+    """A matcher of the normalized phrases, plus their hyphen-less forms for compounds hyphenated at a line end.
+
+    Returns the matcher and, per variant, the index of its phrase.
+    """
+    variants, owners = [], []
+    for index, phrase in enumerate(phrases):
+        for variant in dict.fromkeys((normalize(phrase), normalize(phrase).replace("-", ""))):
+            variants.append(variant)
+            owners.append(index)
+    return PhraseMatcher(variants), owners
+
+class StreamingMatcher:
+    """Find phrases in OCR words fed one at a time in reading order, recording where each was found.
+
+    Words are joined by one space, and a line break between words counts as
+    a space, so phrases may span lines; a word hyphenated at the end of its
+    line is joined with the first word of the next. found maps each phrase
+    found so far to the union (x0, y0, x1, y1) of its words' boxes, or to
+    None when the words had no boxes.
+    """
+
+    def __init__(self, phrases):
+        self.phrases = tuple(dict.fromkeys(phrases))
+        self.found = {}
+        self._matcher, self._owners = _variants_matcher(self.phrases)
+        self._lengths = [len(variant) for variant in self._matcher.phrases]
+        self._longest = max(self._lengths, default=0)
+        self._node = 0
+        self._offset = 0
+        # (start offset, end offset, box) of the words a match may still cover
+        self._words = deque()
+        self._line = None
+        self._hyphen = False
+
+    @property
+    def done(self):
+        return len(self.found) == len(self.phrases)
+
+    def feed(self, word, box=None, line=None):
+        """Add the next word, its box and the key of its line; returns True once every phrase is found."""
+        word = word.lower()
+        if self._offset:
+            if self._hyphen and line != self._line:
+                # "exam-" at a line end and "ple" on the next line read "example"
+                separator = ""
+            else:
+                separator = "-" if self._hyphen else ""
+                separator += " "
+            self._push(separator, None)
+        self._line = line
+        self._hyphen = len(word) > 1 and word.endswith(HYPHENS)
+        self._push(word[:-1] if self._hyphen else word, box)
+        return self.done
+
+    def feed_text(self, text):
+        """Feed plain OCR text, one word at a time with its line, without boxes."""
+        for number, line in enumerate(text.splitlines()):
+            for word in line.split():
+                if self.feed(word, line=number):
+                    return True
+        return self.done
+
+    def _push(self, text, box):
+        start = self._offset
+        self._node, ends = self._matcher.advance(self._node, text)
+        self._offset += len(text)
+        if box is not None or text.strip():
+            self._words.append((start, self._offset, box))
+        for offset, variant in ends:
+            phrase = self.phrases[self._owners[variant]]
+            if phrase not in self.found:
+                end = start + offset + 1
+                self.found[phrase] = self._box(end - self._lengths[variant], end)
+        while self._words and self._words[0][1] <= self._offset - self._longest:
+            self._words.popleft()
+
+    def _box(self, start, end):
+        boxes = [box for word_start, word_end, box in self._words
+                 if word_start < end and start < word_end and box is not None]
+        if not boxes:
+            return None
+        return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+                max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+@lru_cache(maxsize=8)
+def get_matcher(phrases):
+    """Build (once per process) the matcher for a tuple of phrases."""
+    return PhraseMatcher(phrases)
+
+def read_phrases_file(path):
+    """Read one phrase per line, ignoring blank lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
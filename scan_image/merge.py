@@ -0,0 +1,80 @@
+import sys
+import json
+import logging
+import argparse
+from .dedupe import MAX_DISTANCE, NearDuplicates, distance_arg
+from .logger import setup_logging
+
+def read_results(paths):
+    """Yield the records of '--output jsonl' result files, skipping lines a crashed run left half written."""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f"Skipping malformed line {number} of '{path}'")
+
+def merge_results(records, dedupe_distance=0):
+    """Combine the records of several shards into one per image group.
+
+    Images whose perceptual hashes differ in at most dedupe_distance bits are
+    reported once, under the first path of the group in path order, with the
+    others listed in its "duplicates". Those include the near-duplicates each
+    shard found itself, given by its {"path", "duplicate_of"} records.
+    """
+    by_path = {}
+    within = {}
+    for record in records:
+        if "duplicate_of" in record:
+            within.setdefault(record["duplicate_of"], []).append(record["path"])
+            continue
+        seen = by_path.get(record["path"])
+        if seen is None:
+            by_path[record["path"]] = dict(record)
+        else:
+            # The same file in two result files, e.g. a shard that was run twice
+            seen["phrases"] += [phrase for phrase in record["phrases"] if phrase not in seen["phrases"]]
+
+    duplicates = NearDuplicates(dedupe_distance)
+    merged = []
+    # Sorted, so the representative does not depend on which shard finished first
+    for path in sorted(by_path):
+        record = by_path[path]
+        if record.get("phash") is None:
+            record["duplicates"] = []
+            merged.append(record)
+        elif duplicates.add(path, record["phash"]) == path:
+            record["duplicates"] = duplicates.groups[path]
+            merged.append(record)
+    for record in merged:
+        members = [member for path in [record["path"]] + record["duplicates"] for member in within.get(path, ())]
+        # A shard that was run twice lists its near-duplicates twice
+        record["duplicates"] = list(dict.fromkeys(record["duplicates"] + members))
+    return merged
+
+def merge_main(argv):
+    parser = argparse.ArgumentParser(prog="scan-image merge",
+                                     description="Combine the '--output jsonl' results of sharded scans, removing "
+                                                 "duplicate images across shards.")
+    parser.add_argument("results", nargs="+", help="Result files written by 'scan-image --shard I/N --output jsonl'")
+    parser.add_argument("--dedupe-distance", type=distance_arg, default=0,
+                        help="Treat images whose perceptual hashes differ in at most this many bits as duplicates "
+                             f"(0 to {MAX_DISTANCE})")
+    parser.add_argument("--output-file", metavar="PATH", help="Write the merged records here instead of stdout")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    records = list(read_results(args.results))
+    merged = merge_results(records, args.dedupe_distance)
+    out = open(args.output_file, "w", encoding="utf-8") if args.output_file else sys.stdout
+    try:
+        for record in merged:
+            out.write(json.dumps(record) + "\n")
+    finally:
+        if args.output_file:
+            out.close()
+    logging.info(f"Merged {len(records)} records from {len(args.results)} files into {len(merged)} images")
@@ -0,0 +1,125 @@
+import json
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Stages in pipeline order, for stable output
+STAGES = ("discovery", "prefetch", "read", "decode", "heuristic", "hash", "ocr", "match")
+COUNTERS = ("files_seen", "bytes_read", "rejected_invalid", "rejected_heuristic", "cache_hits",
+            "ocr_calls", "ocr_images", "matches")
+PROMETHEUS_PREFIX = "scan_image"
+
+class Metrics:
+    """Counters and per-stage timings of a scan; workers send snapshots that the parent merges."""
+
+    def __init__(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        # stage -> [calls, seconds]
+        self.stages = {}
+        # (path, reason) of files that could not be scanned
+        self.skipped = []
+        # The pool's task feeder thread records prefetch times while results are merged
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, stage, seconds, calls=1):
+        with self._lock:
+            totals = self.stages.setdefault(stage, [0, 0.0])
+            totals[0] += calls
+            totals[1] += seconds
+
+    def skip(self, path, reason):
+        with self._lock:
+            self.skipped.append((path, reason))
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        """A picklable/JSON-able copy: {"counters": {...}, "stages": {stage: {"calls", "seconds"}}, "skipped": [...]}."""
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        with self._lock:
+            counters = dict(self.counters)
+            skipped = [list(item) for item in self.skipped]
+            stages = sorted(((stage, tuple(totals)) for stage, totals in self.stages.items()),
+                            key=lambda item: (order.get(item[0], len(order)), item[0]))
+        return {"counters": counters,
+                "stages": {stage: {"calls": calls, "seconds": round(seconds, 6)} for stage, (calls, seconds) in stages},
+                "skipped": skipped}
+
+    def merge(self, snapshot):
+        for name, value in snapshot["counters"].items():
+            self.count(name, value)
+        for stage, totals in snapshot["stages"].items():
+            self.add_time(stage, totals["seconds"], totals["calls"])
+        for path, reason in snapshot.get("skipped", ()):
+            self.skip(path, reason)
+
+    def write_json(self, path, **extra):
+        """Write the snapshot plus extra top-level fields (run time, worker count, ...)."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({**extra, **self.snapshot()}, f, indent=2)
+            f.write("\n")
+
+    def prometheus_text(self, **gauges):
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            metric = f"{PROMETHEUS_PREFIX}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        calls, seconds = f"{PROMETHEUS_PREFIX}_stage_calls_total", f"{PROMETHEUS_PREFIX}_stage_seconds_total"
+        snapshot = self.snapshot()["stages"]
+        lines.append(f"# TYPE {calls} counter")
+        lines += [f'{calls}{{stage="{stage}"}} {totals["calls"]}' for stage, totals in snapshot.items()]
+        lines.append(f"# TYPE {seconds} counter")
+        lines += [f'{seconds}{{stage="{stage}"}} {totals["seconds"]}' for stage, totals in snapshot.items()]
+        for name, value in gauges.items():
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, **gauges):
+        """Write a node_exporter textfile; replaced atomically so the collector never reads half a file."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text(**gauges))
+        os.replace(tmp_path, path)
+
+_metrics = Metrics()
+_profiler = None
+
+def get_metrics():
+    return _metrics
+
+def collect_metrics():
+    """Return the metrics recorded in this process since the last call and start new ones."""
+    global _metrics
+    metrics, _metrics = _metrics, Metrics()
+    return metrics
+
+@contextmanager
+def profiled(profile_dir):
+    """Run the block under this process's cProfile profiler and dump its cumulative stats to profile_dir."""
+    global _profiler
+    if not profile_dir:
+        yield
+        return
+    if _profiler is None:
+        import cProfile
+        os.makedirs(profile_dir, exist_ok=True)
+        _profiler = cProfile.Profile()
+    _profiler.enable()
+    try:
+        yield
+    finally:
+        _profiler.disable()
+        # Dumped after every task, as pool workers are terminated without running exit handlers
+        _profiler.dump_stats(os.path.join(profile_dir, f"worker-{os.getpid()}.prof"))
@@ -0,0 +1,296 @@
+import os
+import queue
+import logging
+import threading
+import subprocess
+import tempfile
+from collections import namedtuple
+from ._lazy import LazyModule
+from .config import configure_tesseract
+from .supervisor import report_page_done
+
+pytesseract = LazyModule("pytesseract")
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+
+ENGINE_NAMES = ("auto", "subprocess", "batch", "tesserocr")
+
+# Seconds one image may take in a tesseract process before it is killed; None waits forever
+_timeout = None
+
+class OcrTimeout(RuntimeError):
+    """Tesseract took longer than the timeout and was killed.
+
+    When a batch timed out, done holds the results of the images before the
+    one tesseract was stuck on, which is images[len(done)]; otherwise None.
+    """
+
+    def __init__(self, message, done=None):
+        super().__init__(message)
+        self.done = done
+
+def set_timeout(seconds):
+    """Set the per-image OCR timeout; also called from the Pool initializer."""
+    global _timeout
+    _timeout = seconds or None
+
+# A word of image_to_data output: its text, (x0, y0, x1, y1) box, and a key
+# shared by the words of one line
+Word = namedtuple("Word", ["text", "box", "line"])
+
+def _tsv_words(tsv):
+    """(page number, Word) of each word row of Tesseract's TSV output; the header row, if any, is skipped."""
+    for row in tsv.splitlines():
+        fields = row.split("\t")
+        # level 5 rows are words; the text is the twelfth column
+        if len(fields) < 12 or fields[0] != "5" or not fields[11].strip():
+            continue
+        block, paragraph, line = (int(value) for value in fields[2:5])
+        left, top, width, height = (int(value) for value in fields[6:10])
+        yield int(fields[1]), Word(fields[11].strip(), (left, top, left + width, top + height),
+                                   (block, paragraph, line))
+
+def parse_tsv(tsv):
+    """Words of Tesseract's TSV output in reading order."""
+    return [word for _, word in _tsv_words(tsv)]
+
+def parse_tsv_pages(tsv, pages):
+    """Words of the TSV output of a multi-page run, one list per page; pages are numbered from 1."""
+    words = [[] for _ in range(pages)]
+    for page, word in _tsv_words(tsv):
+        if not 1 <= page <= pages:
+            raise RuntimeError(f"expected {pages} pages, got page {page}")
+        words[page - 1].append(word)
+    return words
+
+def _as_pil(image):
+    """Engines accept PIL images and preprocessed uint8 arrays."""
+    return Image.fromarray(image) if isinstance(image, np.ndarray) else image
+
+class OcrEngine:
+    """Turns PIL images or uint8 arrays into text. Subclasses amortize Tesseract's startup cost differently."""
+
+    name = "base"
+    # True when every call starts a tesseract process: callers should then
+    # send their images in as few calls as they can
+    starts_process = False
+
+    def image_to_string(self, image, psm=None):
+        raise NotImplementedError
+
+    def image_to_data(self, image, psm=None):
+        """The Words of an image in reading order."""
+        raise NotImplementedError
+
+    def images_to_strings(self, images, psm=None):
+        """OCR several images; psm overrides Tesseract's page segmentation mode for all of them."""
+        return [self.image_to_string(image, psm) for image in images]
+
+    def images_to_data(self, images, psm=None):
+        """The Words of several images, one list per image."""
+        return [self.image_to_data(image, psm) for image in images]
+
+    def close(self):
+        pass
+
+class SubprocessEngine(OcrEngine):
+    """One tesseract process per image through pytesseract."""
+
+    name = "subprocess"
+    starts_process = True
+
+    def image_to_string(self, image, psm=None):
+        return self._run(pytesseract.image_to_string, image, psm)
+
+    def image_to_data(self, image, psm=None):
+        return parse_tsv(self._run(pytesseract.image_to_data, image, psm))
+
+    def _run(self, func, image, psm=None):
+        kwargs = {"config": f"--psm {psm}"} if psm is not None else {}
+        if _timeout:
+            kwargs["timeout"] = _timeout
+        try:
+            result = func(image, **kwargs)
+        except RuntimeError as e:
+            if str(e) == "Tesseract process timeout":
+                raise OcrTimeout(f"tesseract killed after {_timeout}s") from None
+            raise
+        report_page_done()
+        return result
+
+class BatchEngine(SubprocessEngine):
+    """OCR many images with a single tesseract process, using its list-file input."""
+
+    name = "batch"
+
+    def images_to_strings(self, images, psm=None):
+        if len(images) < 2:
+            return super().images_to_strings(images, psm)
+        try:
+            output, complete = self._run_batch(images, psm)
+            if not complete:
+                raise OcrTimeout(f"tesseract killed after {_timeout}s on one image", done=_text_pages(output))
+            return _text_pages(output, len(images))
+        except OcrTimeout:
+            # Retrying would wait for the stuck image again
+            raise
+        except Exception as e:
+            logging.debug(f"Batch OCR of {len(images)} images failed, retrying one by one: {e}")
+            return super().images_to_strings(images, psm)
+
+    def images_to_data(self, images, psm=None):
+        if len(images) < 2:
+            return super().images_to_data(images, psm)
+        try:
+            output, complete = self._run_batch(images, psm, "tsv")
+            if not complete:
+                # Every page starts with its level 1 row
+                pages = sum(row.startswith("1\t") for row in output.splitlines())
+                raise OcrTimeout(f"tesseract killed after {_timeout}s on one image",
+                                 done=parse_tsv_pages(output, pages))
+            return parse_tsv_pages(output, len(images))
+        except OcrTimeout:
+            raise
+        except Exception as e:
+            logging.debug(f"Batch OCR of {len(images)} images failed, retrying one by one: {e}")
+            return super().images_to_data(images, psm)
+
+    def _run_batch(self, images, psm=None, renderer=None):
+        """One tesseract run over images, listed in a file; renderer is e.g. "tsv" (default: text).
+
+        Returns (output, complete): complete is False when tesseract spent the
+        timeout on one image and was killed, output then holding the pages
+        before it and what it wrote of that one.
+        """
+        with tempfile.TemporaryDirectory(prefix="scan_image_") as tmp:
+            paths = []
+            for i, image in enumerate(images):
+                path = os.path.join(tmp, f"{i}.png")
+                _as_pil(image).save(path, compress_level=1)
+                paths.append(path)
+            list_path = os.path.join(tmp, "images.txt")
+            with open(list_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(paths) + "\n")
+            options = ["--psm", str(psm)] if psm is not None else []
+            if renderer:
+                options.append(renderer)
+            command = [pytesseract.pytesseract.tesseract_cmd, list_path, "stdout", *options]
+            with open(os.path.join(tmp, "stderr.txt"), "w+b") as stderr:
+                proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+                output, complete = _read_pages(proc, _timeout)
+                if complete and proc.returncode:
+                    stderr.seek(0)
+                    raise subprocess.CalledProcessError(proc.returncode, command, output, stderr.read())
+        return output.decode("utf-8", errors="replace"), complete
+
+def _text_pages(output, count=None):
+    """Split the text renderer's output into pages; count is the number of pages of a complete run.
+
+    Depending on its version, tesseract writes a form feed after every page
+    or only between pages. Without count, output is what a killed run wrote
+    of whole pages, and only those are returned.
+    """
+    pages = output.split("\f")
+    if count is None:
+        # A trailing form feed ends the last finished page; a trailing text
+        # is one written with its separator in front
+        return pages[:-1] if pages[-1] == "" else pages
+    if len(pages) == count + 1 and pages[-1] == "":
+        return pages[:-1]
+    if len(pages) == count:
+        return pages
+    raise RuntimeError(f"expected {count} pages, got {len(pages)} parts")
+
+def _read_pages(proc, timeout):
+    """Read proc's stdout to the end; returns (output, complete).
+
+    Tesseract writes and flushes each page as soon as it is recognized, so
+    the timeout restarts with every page: proc is killed, and complete is
+    False, once timeout seconds pass without output.
+    """
+    chunks = queue.Queue()
+
+    def read():
+        # A thread rather than select(), which does not take pipes on Windows
+        for chunk in iter(lambda: proc.stdout.read1(65536), b""):
+            chunks.put(chunk)
+        chunks.put(None)
+
+    threading.Thread(target=read, daemon=True).start()
+    output = bytearray()
+    try:
+        while True:
+            try:
+                chunk = chunks.get(timeout=timeout)
+            except queue.Empty:
+                proc.kill()
+                return bytes(output), False
+            if chunk is None:
+                return bytes(output), True
+            output += chunk
+            report_page_done()
+    finally:
+        proc.wait()
+        proc.stdout.close()
+
+class TesserocrEngine(OcrEngine):
+    """Long-lived in-process Tesseract API, available when tesserocr is installed."""
+
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr
+        self._api = tesserocr.PyTessBaseAPI()
+        self._default_psm = self._api.GetPageSegMode()
+
+    def image_to_string(self, image, psm=None):
+        self._api.SetPageSegMode(self._default_psm if psm is None else psm)
+        self._api.SetImage(_as_pil(image))
+        text = self._api.GetUTF8Text()
+        report_page_done()
+        return text
+
+    def image_to_data(self, image, psm=None):
+        self._api.SetPageSegMode(self._default_psm if psm is None else psm)
+        self._api.SetImage(_as_pil(image))
+        words = parse_tsv(self._api.GetTSVText(0))
+        report_page_done()
+        return words
+
+    def close(self):
+        self._api.End()
+
+_ENGINES = {
+    "subprocess": SubprocessEngine,
+    "batch": BatchEngine,
+    "tesserocr": TesserocrEngine,
+}
+
+_default_name = "auto"
+_instances = {}
+
+def _create_engine(name):
+    if name not in ENGINE_NAMES:
+        raise ValueError(f"Unknown OCR engine '{name}', expected one of {', '.join(ENGINE_NAMES)}")
+    configure_tesseract()
+    if name != "auto":
+        return _ENGINES[name]()
+    try:
+        return TesserocrEngine()
+    except Exception:
+        return BatchEngine()
+
+def get_engine(name=None):
+    """Return the engine for this process, creating it on first use."""
+    name = name or _default_name
+    if name not in _instances:
+        _instances[name] = _create_engine(name)
+        logging.debug(f"Using OCR engine '{_instances[name].name}'")
+    return _instances[name]
+
+def set_default_engine(name):
+    """Select the engine used by get_engine(); workers call it from _init_worker."""
+    global _default_name
+    if name not in ENGINE_NAMES:
+        raise ValueError(f"Unknown OCR engine '{name}', expected one of {', '.join(ENGINE_NAMES)}")
+    _default_name = name
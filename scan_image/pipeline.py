@@ -0,0 +1,109 @@
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from operator import itemgetter
+from .archives import is_tar, iter_members, read_bytes
+from .discovery import filter_shard, iter_image_sizes
+
+# "pool" hands paths to the workers in discovery order; "pipeline" orders
+# files largest first and reads their bytes in parent threads ahead of the
+# workers
+SCHEDULERS = ("pool", "pipeline")
+DEFAULT_PREFETCH_THREADS = 4
+# A batch is closed early once its files add up to this many bytes, so large
+# files are spread over the workers instead of queuing up in one task
+BATCH_MAX_BYTES = 16 * 1024 * 1024
+
+def largest_first(folder, shard=None, archives=False):
+    """Every image under folder (and with archives, inside its zip files) as (path, size), biggest first.
+
+    The whole folder is walked before the first task starts; in exchange the
+    slowest files start first instead of stalling the end of the scan. With
+    archives, tar files are listed whole, by their own size, and sharded
+    member by member when read_batches reads them.
+    """
+    files = []
+    tars = []
+    for item in iter_image_sizes(folder, archives=archives):
+        (tars if archives and is_tar(item[0]) else files).append(item)
+    files = list(filter_shard(files, folder, shard, key=itemgetter(0))) + tars
+    files.sort(key=itemgetter(1), reverse=True)
+    return files
+
+def cost_batches(files, size, max_bytes=BATCH_MAX_BYTES):
+    """Batch (path, size) pairs into lists of at most size paths and, unless a single file is larger, max_bytes."""
+    batch, total = [], 0
+    for path, nbytes in files:
+        if batch and (len(batch) == size or total + nbytes > max_bytes):
+            yield batch
+            batch, total = [], 0
+        batch.append(path)
+        total += nbytes
+    if batch:
+        yield batch
+
+def read_batches(files, size, folder=None, shard=None, max_bytes=BATCH_MAX_BYTES):
+    """cost_batches of largest_first's files, a tar file becoming batches of its members at its place in the order.
+
+    The members of a tar are (member path, bytes) pairs read in one pass, in
+    archive order: one by one, each member of a compressed tar would
+    decompress the archive up to itself again.
+    """
+    run = []
+    for path, nbytes in files:
+        if not is_tar(path):
+            run.append((path, nbytes))
+            continue
+        yield from cost_batches(run, size, max_bytes)
+        run = []
+        members = filter_shard(iter_members(path), folder, shard, key=itemgetter(0))
+        yield from cost_batches(((member, len(member[1])) for member in members), size, max_bytes)
+    yield from cost_batches(run, size, max_bytes)
+
+def _read(path):
+    start = time.perf_counter()
+    try:
+        data = read_bytes(path)
+    except OSError:
+        # The worker tries again and reports the failure
+        data = None
+    return data, time.perf_counter() - start
+
+def _already_read(data):
+    future = Future()
+    future.set_result((data, 0.0))
+    return future
+
+def _collect(batch, futures, metrics):
+    entries = []
+    for path, future in zip(batch, futures):
+        data, seconds = future.result()
+        if metrics is not None:
+            metrics.add_time("prefetch", seconds)
+            metrics.count("bytes_read", len(data or b""))
+        entries.append((path, data))
+    return entries
+
+def prefetched(batches, threads=DEFAULT_PREFETCH_THREADS, ahead=1, metrics=None):
+    """Yield each batch of paths as (path, bytes) pairs, read by a thread pool up to ahead batches in advance.
+
+    Pairs already in a batch, such as tar members from read_batches, are
+    passed on as they are.
+    """
+    pending = deque()
+    with ThreadPoolExecutor(threads, thread_name_prefix="prefetch") as executor:
+        try:
+            for batch in batches:
+                if isinstance(batch[0], tuple):
+                    pending.append(([path for path, _ in batch], [_already_read(data) for _, data in batch]))
+                else:
+                    pending.append((batch, [executor.submit(_read, path) for path in batch]))
+                if len(pending) > ahead:
+                    yield _collect(*pending.popleft(), metrics)
+            while pending:
+                yield _collect(*pending.popleft(), metrics)
+        finally:
+            # Stopped early: do not read files nobody will process
+            for _, futures in pending:
+                for future in futures:
+                    future.cancel()
@@ -0,0 +1,77 @@
+from collections import namedtuple
+from ._lazy import LazyModule
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+
+# scale: "none", "x-height" (resize so the estimated x-height is x_height px)
+# or "dpi" (resize from the DPI stored in the file to dpi); max_side: longest side Tesseract may see when scaling is
+# on; binarize: "none", "otsu" or "adaptive"
+PreprocessConfig = namedtuple("PreprocessConfig", ["scale", "x_height", "dpi", "max_side", "binarize"])
+SCALE_MODES = ("none", "x-height", "dpi")
+BINARIZE_MODES = ("none", "otsu", "adaptive")
+DEFAULT_PREPROCESS = PreprocessConfig("none", 20, 300, 4000, "none")
+
+MIN_SCALE = 0.25
+MAX_SCALE = 3.0
+# Images are measured on a copy no larger than this
+MEASURE_MAX_SIDE = 1600
+MIN_GLYPHS = 5
+
+_preprocess = DEFAULT_PREPROCESS
+
+def set_preprocess(config):
+    """Select the preprocessing applied before OCR; also called from the Pool initializer."""
+    global _preprocess
+    _preprocess = config or DEFAULT_PREPROCESS
+
+def preprocessing_enabled(config=None):
+    config = config or _preprocess
+    return config.scale != "none" or config.binarize != "none"
+
+def estimate_x_height(gray):
+    """Median height of glyph-sized blobs, which for lowercase text is close to the x-height; None without text."""
+    height, width = gray.shape[:2]
+    factor = max(1.0, max(width, height) / MEASURE_MAX_SIDE)
+    if factor > 1:
+        gray = cv2.resize(gray, (round(width / factor), round(height / factor)), interpolation=cv2.INTER_AREA)
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    # Glyphs are the minority colour
+    if np.count_nonzero(mask) > mask.size // 2:
+        mask = 255 - mask
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    w, h, area = stats[1:, 2], stats[1:, 3], stats[1:, 4]
+    glyphs = h[(h >= 3) & (area >= 6) & (w <= h * 3) & (h <= gray.shape[0] * 0.2)]
+    if len(glyphs) < MIN_GLYPHS:
+        return None
+    return float(np.median(glyphs)) * factor
+
+def _scale_factor(gray, config, dpi):
+    if config.scale == "x-height":
+        x_height = estimate_x_height(gray)
+        factor = config.x_height / x_height if x_height else 1.0
+    elif config.scale == "dpi" and dpi:
+        factor = config.dpi / dpi
+    else:
+        factor = 1.0
+    factor = min(MAX_SCALE, max(MIN_SCALE, factor))
+    return min(factor, config.max_side / max(gray.shape[:2]))
+
+def preprocess(gray, config=None, dpi=None):
+    """Rescale and binarize a grayscale array for Tesseract; returns a new uint8 array."""
+    config = config or _preprocess
+    if config.scale != "none":
+        factor = _scale_factor(gray, config, dpi)
+        # Leave small corrections alone, resizing costs more than it brings
+        if abs(factor - 1) > 0.15:
+            height, width = gray.shape[:2]
+            size = (max(1, round(width * factor)), max(1, round(height * factor)))
+            interpolation = cv2.INTER_AREA if factor < 1 else cv2.INTER_CUBIC
+            gray = cv2.resize(gray, size, interpolation=interpolation)
+    if config.binarize == "otsu":
+        _, gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    elif config.binarize == "adaptive":
+        # Neighbourhood of about a line of target-sized text, forced odd
+        block = max(3, int(config.x_height * 2) | 1)
+        gray = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block, 15)
+    return gray
@@ -0,0 +1,125 @@
+import logging
+from ._lazy import LazyModule
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+
+# Tesseract page segmentation modes used for crops
+PSM_SINGLE_LINE = 7
+PSM_SINGLE_BLOCK = 6
+
+DETECT_MAX_SIDE = 1024
+# Dense pages are OCR'd in up to this many horizontal bands, none lower than
+# MIN_BAND_HEIGHT pixels, so phrase search can stop after the first few
+MAX_BANDS = 6
+MIN_BAND_HEIGHT = 200
+# OCR the whole image when the crops would cover more than this share of it
+MAX_COVERAGE = 0.5
+MAX_REGIONS = 64
+
+class Region:
+    """A box (x0, y0, x1, y1) in full-image pixels and the page segmentation mode to OCR it with."""
+
+    __slots__ = ("box", "psm", "line_height")
+
+    def __init__(self, box, psm, line_height):
+        self.box = box
+        self.psm = psm
+        self.line_height = line_height
+
+    def __repr__(self):
+        return f"Region({self.box}, psm={self.psm})"
+
+def _candidate_boxes(gray):
+    """Word- and line-shaped blobs of strong local contrast, as (x, y, w, h) rows."""
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, kernel)
+    _, mask = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    # Join the characters of a word or line horizontally
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1)))
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    stats = stats[1:]
+    x, y, w, h, area = (stats[:, i] for i in range(5))
+    fill = area / np.maximum(w * h, 1)
+    keep = (h >= 5) & (w >= 8) & (h <= gray.shape[0] * 0.5) & (w >= h * 0.3) & (fill >= 0.3)
+    return stats[keep, :4]
+
+def _merge(boxes):
+    """Union boxes that overlap until none do; boxes are lists [x0, y0, x1, y1, line_height]."""
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for box in boxes:
+            for other in result:
+                if box[0] <= other[2] and other[0] <= box[2] and box[1] <= other[3] and other[1] <= box[3]:
+                    other[0], other[1] = min(box[0], other[0]), min(box[1], other[1])
+                    other[2], other[3] = max(box[2], other[2]), max(box[3], other[3])
+                    other[4] = max(box[4], other[4])
+                    merged = True
+                    break
+            else:
+                result.append(list(box))
+        boxes = result
+    return boxes
+
+def find_text_regions(gray, max_side=DETECT_MAX_SIDE, max_coverage=MAX_COVERAGE):
+    """Merged candidate text boxes of a grayscale image in reading order.
+
+    Returns [] when nothing looks like text and None when cropping would not
+    save much (the boxes cover most of the image or there are too many), in
+    which case the whole image should be OCR'd.
+    """
+    height, width = gray.shape[:2]
+    scale = max(1.0, max(width, height) / max_side)
+    small = gray
+    if scale > 1:
+        size = (max(1, round(width / scale)), max(1, round(height / scale)))
+        small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+    boxes = []
+    for x, y, w, h in _candidate_boxes(small):
+        # Pad so ascenders, descenders and the first and last letters are kept
+        pad = h * 0.4 + 2
+        boxes.append([max(0, int((x - pad) * scale)), max(0, int((y - pad) * scale)),
+                      min(width, int((x + w + pad) * scale)), min(height, int((y + h + pad) * scale)),
+                      h * scale])
+    boxes = _merge(boxes)
+    if len(boxes) > MAX_REGIONS:
+        return None
+    covered = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1, _ in boxes)
+    if covered > max_coverage * width * height:
+        return None
+
+    regions = []
+    for x0, y0, x1, y1, line_height in sorted(boxes, key=lambda box: (box[1], box[0])):
+        psm = PSM_SINGLE_LINE if y1 - y0 < 2.5 * line_height else PSM_SINGLE_BLOCK
+        regions.append(Region((x0, y0, x1, y1), psm, line_height))
+    logging.debug(f"{len(regions)} text regions covering {covered / (width * height):.1%} of the image")
+    return regions
+
+def text_bands(gray, max_bands=MAX_BANDS, min_height=MIN_BAND_HEIGHT):
+    """(x0, y0, x1, y1) full-width bands covering a grayscale image from top to bottom.
+
+    Bands are cut only in rows without ink, so no text line is split; where
+    no such row is near a cut the band grows to the next one, or to the end.
+    """
+    height, width = gray.shape[:2]
+    band = max(min_height, height // max_bands)
+    if height < 2 * band:
+        return [(0, 0, width, height)]
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    # A few specks of noise still count as a blank row
+    blank = np.flatnonzero(np.count_nonzero(ink, axis=1) <= max(1, width // 500))
+    bands = []
+    start = 0
+    while height - start >= 2 * band:
+        target = start + band
+        candidates = blank[(blank > start + band // 2) & (blank < height - band // 2)]
+        if not len(candidates):
+            break
+        cut = int(candidates[np.argmin(np.abs(candidates - target))])
+        bands.append((0, start, width, cut))
+        start = cut
+    bands.append((0, start, width, height))
+    return bands
@@ -1,82 +1,1092 @@
 import os
+import sys
+import json
 import time
 import logging
+import argparse
+import queue
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from contextlib import contextmanager
+from itertools import count, islice
+from multiprocessing import Pool, SimpleQueue, active_children, cpu_count
 from . import __version__
-from .config import setup_tesseract
+from .config import configure_tesseract, setup_tesseract, tesseract_version
 from .logger import setup_logging
+from .archives import read_bytes, read_tar_members, stat_path
+from .discovery import filter_shard, item_path, iter_image_files
+from .cache import CacheEntry, DEFAULT_MAX_BYTES, OcrCache, content_key, get_cache, make_fingerprint, open_cache
+from .dedupe import MAX_DISTANCE, NearDuplicates, check_distance, distance_arg, group_near_duplicates
+from .matcher import StreamingMatcher, get_matcher, read_phrases_file
+from .metrics import Metrics, collect_metrics, get_metrics, profiled
+from .pipeline import DEFAULT_PREFETCH_THREADS, SCHEDULERS, largest_first, prefetched, read_batches
+from .ocr import ENGINE_NAMES, set_default_engine, set_timeout
+from .supervisor import EXIT_GRACE, POLL_INTERVAL, deadline, kill_worker, report_progress, supervised_task
+from .supervisor import init_worker as init_supervision
+from .preprocess import BINARIZE_MODES, DEFAULT_PREPROCESS, SCALE_MODES, PreprocessConfig, set_preprocess
+from .utils import (DEFAULT_PREFILTER, PREFILTER_METHODS, ImageContext, PrefilterConfig, load_image,
+                    has_text_heuristic, compute_perceptual_hash, locate_phrases, locating, ocr_text_batch,
+                    ocr_text_tiled, set_locate, set_prefilter, set_text_regions)
 
-setup_logging()
-setup_tesseract()
+# Images per pool task (batching engines OCR them in one call), and how
+# many tasks may wait per worker
+BATCH_SIZE = 8
+PENDING_TASKS_PER_WORKER = 2
+# Command line defaults: seconds of OCR per image before giving up on it, and
+# the worker memory above which a worker is replaced
+DEFAULT_TIMEOUT = 300
+DEFAULT_MAX_WORKER_RSS_MB = 2048
 
-import argparse
-from multiprocessing import Pool, cpu_count
-from .utils import is_valid_image, has_text_heuristic, compute_perceptual_hash, contains_phrase
+# A matching image: its perceptual hash, the phrases found, the seconds its
+# worker spent on it per stage (an OCR batch's time is shared evenly) and,
+# when scanning with locate, {phrase: (x0, y0, x1, y1) box or None}
+Match = namedtuple("Match", ["path", "phash", "phrases", "timings", "boxes"], defaults=(None,))
 
-def process_file(args):
-    image_path, phrase = args
-    if not is_valid_image(image_path):
-        return None
-    if not has_text_heuristic(image_path):
-        return None
-    img_hash = compute_perceptual_hash(image_path)
-    if contains_phrase(image_path, phrase):
-        return (image_path, img_hash)
-    return None
+class _Throttle:
+    """Stop the pool's task feeder from running far ahead of consumed results.
+
+    imap_unordered drains its input in a background thread, so without a bound
+    a lazy file generator would still be pulled into memory all at once.
+    """
+
+    def __init__(self, limit):
+        self._slots = threading.Semaphore(limit)
+        self._stopped = threading.Event()
+
+    def feed(self, iterable):
+        for item in iterable:
+            while not self._slots.acquire(timeout=0.1):
+                if self._stopped.is_set():
+                    return
+            if self._stopped.is_set():
+                return
+            yield item
+
+    def release(self):
+        self._slots.release()
+
+    def stop(self):
+        self._stopped.set()
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _timed(iterable, metrics, stage):
+    """Yield from iterable, adding the time spent producing each item to a stage."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            metrics.add_time(stage, time.perf_counter() - start)
+        yield item
+
+def _measured_task(task):
+    """Pool task wrapper: run func(args) and return its result with the worker's metrics for it.
 
-def scan_images_for_phrase(folder, phrase):
-    all_files = []
-    for root, _, files in os.walk(folder):
-        for file in files:
-            all_files.append((os.path.join(root, file), phrase))
+    settings are _init_worker arguments, applied first in workers that were
+    not started with them (a pool or executor supplied by the caller).
+    """
+    func, args, profile_dir, settings = task
+    if settings is not None and settings != _worker_settings:
+        _init_worker(*settings)
+    collect_metrics()
+    with profiled(profile_dir):
+        result = func(args)
+    return result, collect_metrics().snapshot()
 
-    found_images = []
-    seen_hashes = set()
+def _submit_unordered(executor, func, tasks, limit):
+    """imap_unordered for a concurrent.futures Executor, with at most limit tasks submitted at a time."""
+    tasks = iter(tasks)
+    pending = set()
+    try:
+        while True:
+            pending.update(executor.submit(func, task) for task in islice(tasks, limit - len(pending)))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        # The consumer stopped early: drop work that has not started
+        for future in pending:
+            future.cancel()
 
-    logging.info(f"Starting scan of {len(all_files)} files using {cpu_count()} cores")
+def _task_files(args):
+    """The batch in a pool function's arguments, and a function rebuilding the arguments for other files."""
+    if isinstance(args, tuple):
+        return args[0], lambda files: (files,) + args[1:]
+    return args, lambda files: files
 
-    with Pool(processes=cpu_count()) as pool:
-        for result in pool.imap_unordered(process_file, all_files):
-            if result is None:
+def _imap_supervised(pool, func, iterable, processes, supervision, metrics=None, profile_dir=None):
+    """_imap_bounded on a Pool started by _init_supervised_worker, killing workers that overrun their deadline.
+
+    Workers report the files they start on and every page they OCR. One
+    that reports nothing for the timeout (plus a grace period) is killed and
+    the pool starts a replacement; one that dies, e.g. killed for running out
+    of memory, is replaced by the pool. Either way a single file is recorded
+    in metrics as skipped, the files of a batch are queued again one per task
+    to find the culprit, and the rest of the task is queued again. Tasks of
+    workers that retired for using too much memory are queued again unchanged.
+    """
+    progress, timeout = supervision
+    limit = processes * PENDING_TASKS_PER_WORKER
+    done = queue.Queue()
+    iterable = iter(iterable)
+    retry = deque()
+    # task id -> args of every task handed to the pool and not given up on
+    pending = {}
+    # worker pid -> (task id, files, deadline)
+    working = {}
+    # worker pid -> when it was first found gone while holding a task
+    gone = {}
+    ids = count()
+
+    def submit(args):
+        task_id = next(ids)
+        pending[task_id] = args
+        pool.apply_async(supervised_task, ((task_id, _measured_task, (func, args, profile_dir, None)),),
+                         callback=done.put, error_callback=lambda error: done.put((task_id, None, error)))
+
+    while True:
+        while len(pending) < limit:
+            args = retry.popleft() if retry else next(iterable, None)
+            if args is None:
+                break
+            submit(args)
+        if not pending:
+            return
+
+        try:
+            task_id, pid, outcome = done.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            pass
+        else:
+            # None when the task was given up on: a late result of a killed worker
+            args = pending.pop(task_id, None)
+            if pid is None:
+                if args is not None:
+                    raise outcome
+            else:
+                if working.get(pid, (None,))[0] == task_id:
+                    del working[pid]
+                if args is not None:
+                    result, snapshot = outcome
+                    if metrics is not None:
+                        metrics.merge(snapshot)
+                    yield result
+
+        while not progress.empty():
+            pid, task_id, paths, reported = progress.get()
+            if task_id not in pending:
                 continue
-            image_path, img_hash = result
-            if img_hash in seen_hashes:
+            if paths is None:
+                working.pop(pid, None)
+                retry.append(pending.pop(task_id))
+            else:
+                working[pid] = (task_id, paths, deadline(reported, paths, timeout))
+
+        # Pool workers are children of this process; a dead one is no longer listed
+        alive = {process.pid for process in active_children()}
+        now = time.time()
+        for pid, (task_id, paths, limit_time) in list(working.items()):
+            if pid not in alive:
+                gone.setdefault(pid, now)
+            # A worker that exited after its last task has sent its result: give it time to arrive
+            crashed = now - gone.get(pid, now) >= EXIT_GRACE
+            if now < limit_time and not crashed:
                 continue
-            seen_hashes.add(img_hash)
-            found_images.append(image_path)
+            del working[pid]
+            gone.pop(pid, None)
+            files, rebuild = _task_files(pending.pop(task_id))
+            if crashed:
+                reason = "worker died"
+            else:
+                reason = "timeout"
+                kill_worker(pid)
+            # A worker that died before naming its files may have died on any of them
+            stuck = set(paths) or {item_path(item) for item in files}
+            rest = [item for item in files if item_path(item) not in stuck]
+            if len(stuck) == 1:
+                path = next(iter(stuck))
+                logging.warning(f"Gave up on {path} ({reason}), replacing its worker")
+                if metrics is not None:
+                    metrics.skip(path, reason)
+            else:
+                logging.warning(f"Lost a batch of {len(stuck)} images ({reason}), retrying them one by one")
+                retry.extend(rebuild([item]) for item in files if item_path(item) in stuck)
+            if rest:
+                retry.append(rebuild(rest))
+        for pid in [pid for pid in gone if pid not in working]:
+            del gone[pid]
+
+def _imap_bounded(pool, func, iterable, processes, metrics=None, profile_dir=None, settings=None,
+                  supervision=None):
+    """imap_unordered on a Pool or Executor with a bounded feeder; merges worker metrics into metrics when given.
+
+    supervision is (progress queue, timeout) for a Pool started with _init_supervised_worker.
+    """
+    limit = processes * PENDING_TASKS_PER_WORKER
+    if supervision is not None:
+        yield from _imap_supervised(pool, func, iterable, processes, supervision, metrics, profile_dir)
+        return
+    if isinstance(pool, Executor):
+        tasks = ((func, args, profile_dir, settings) for args in iterable)
+        for result, snapshot in _submit_unordered(pool, _measured_task, tasks, limit):
+            if metrics is not None:
+                metrics.merge(snapshot)
+            yield result
+        return
+    throttle = _Throttle(limit)
+    try:
+        if metrics is None and not profile_dir and settings is None:
+            for result in pool.imap_unordered(func, throttle.feed(iterable)):
+                throttle.release()
+                yield result
+            return
+        tasks = ((func, args, profile_dir, settings) for args in throttle.feed(iterable))
+        for result, snapshot in pool.imap_unordered(_measured_task, tasks):
+            throttle.release()
+            if metrics is not None:
+                metrics.merge(snapshot)
+            yield result
+    finally:
+        throttle.stop()
+
+_worker_settings = None
+
+def _init_worker(ocr_engine, log_level, cache_settings=None, prefilter=None, text_regions=False, preprocess=None,
+                 omp_threads=None, ocr_timeout=None, locate=False):
+    """Pool initializer: set up logging, Tesseract, the OCR engine, the filters and the cache once per worker.
+
+    omp_threads caps the OpenMP threads of each Tesseract run, unless
+    OMP_THREAD_LIMIT is already set, so that workers do not oversubscribe the CPUs.
+    ocr_timeout is the seconds after which a tesseract process OCR'ing one image is killed.
+    """
+    global _worker_settings
+    _worker_settings = (ocr_engine, log_level, cache_settings, prefilter, text_regions, preprocess, omp_threads,
+                        ocr_timeout, locate)
+    set_timeout(ocr_timeout)
+    if omp_threads:
+        os.environ.setdefault("OMP_THREAD_LIMIT", str(omp_threads))
+    setup_logging(log_level)
+    configure_tesseract()
+    set_default_engine(ocr_engine)
+    set_prefilter(prefilter)
+    set_text_regions(text_regions)
+    set_locate(locate)
+    set_preprocess(preprocess)
+    if cache_settings:
+        open_cache(*cache_settings)
+
+class _Record:
+    """A file as seen by a worker: its results so far plus the bytes/decoded image if they were needed."""
+
+    def __init__(self, path, entry, key=None, data=None, image=None, timings=None):
+        self.path = path
+        self.entry = entry
+        self.key = key
+        self.data = data
+        self.image = image
+        self.timings = {} if timings is None else timings
+        # {phrase: box} found by locate_phrases
+        self.located = None
+
+@contextmanager
+def _stage(name, timings):
+    """Add the block's run time to the worker metrics and to one file's timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        get_metrics().add_time(name, elapsed)
+        timings[name] = timings.get(name, 0.0) + elapsed
+
+def _evaluate(image_path, data=None, filtered=False, timings=None):
+    metrics = get_metrics()
+    timings = {} if timings is None else timings
+    # Read once and decode at most once; every later stage works on the same context
+    with _stage("read", timings):
+        image = load_image(image_path, data, decode=False)
+    if image is None:
+        metrics.count("rejected_invalid")
+        return CacheEntry(False, False, None, None), None
+    if data is None:
+        metrics.count("bytes_read", len(image.data))
+    if not filtered:
+        with _stage("heuristic", timings):
+            has_text = has_text_heuristic(image)
+        if not has_text:
+            # Rejected on a reduced preview, the full image was never decoded
+            metrics.count("rejected_heuristic")
+            return CacheEntry(True, False, None, None), image
+    try:
+        with _stage("decode", timings):
+            image.image
+    except Exception:
+        metrics.count("rejected_invalid")
+        return CacheEntry(False, False, None, None), None
+    if filtered:
+        # Already through the heuristic in an earlier phase of this scan
+        return CacheEntry(True, True, None, None), image
+    with _stage("hash", timings):
+        phash = str(compute_perceptual_hash(image))
+    return CacheEntry(True, True, phash, None), image
+
+def _analyze(image_path, cache=None, filtered=False, data=None, stamped=True):
+    """Validate, filter and hash one file, answering from the OCR cache when possible.
+
+    data are the file's bytes when the parent already read them. Bytes that
+    are not stamped have no file behind them, e.g. an upload, and are cached
+    by their content only.
+    """
+    report_progress((image_path,))
+    metrics = get_metrics()
+    if not filtered:
+        # Filtered files were already counted in the first phase of a hash-first scan
+        metrics.count("files_seen")
+    timings = {}
+    if cache is None:
+        entry, image = _evaluate(image_path, data, filtered=filtered, timings=timings)
+        return _Record(image_path, entry, image=image, timings=timings)
+
+    try:
+        if stamped:
+            st = stat_path(image_path)
+            stamp = (image_path, st.st_size, st.st_mtime_ns)
+            # Fast path: an unchanged file is not even read
+            key = cache.lookup_path(*stamp)
+            entry = cache.get(key) if key else None
+            if entry is not None:
+                metrics.count("cache_hits")
+                return _Record(image_path, entry, key, timings=timings)
+        if data is None:
+            with _stage("read", timings):
+                data = read_bytes(image_path)
+            metrics.count("bytes_read", len(data))
+    except OSError:
+        metrics.count("rejected_invalid")
+        return _Record(image_path, CacheEntry(False, False, None, None), timings=timings)
+
+    key = content_key(data)
+    if stamped:
+        cache.link_path(*stamp, key)
+    entry = cache.get(key)
+    if entry is not None:
+        metrics.count("cache_hits")
+        return _Record(image_path, entry, key, data, timings=timings)
+    entry, image = _evaluate(image_path, data, timings=timings)
+    cache.put(key, entry)
+    return _Record(image_path, entry, key, data, image, timings)
+
+def _analyze_item(item, cache=None, filtered=False):
+    """_analyze for a path or a (path, bytes) pair."""
+    if isinstance(item, tuple):
+        return _analyze(item[0], cache, filtered=filtered, data=item[1])
+    return _analyze(item, cache, filtered=filtered)
+
+def _ocr_tiled(record, cache=None, matcher=None):
+    """OCR a huge or multi-page image tile by tile; text cut short by the matcher is not cached."""
+    metrics = get_metrics()
+    metrics.count("ocr_calls")
+    metrics.count("ocr_images")
+    report_progress((record.path,))
+    with _stage("ocr", record.timings):
+        text, complete = ocr_text_tiled(record.image, matcher)
+    if text is None:
+        return
+    record.entry = record.entry._replace(text=text)
+    if cache is not None and complete:
+        cache.put(record.key, record.entry)
+
+def _locate(record, cache=None, matcher=None):
+    """OCR an image part by part until the matcher's phrases are found; text cut short is not cached."""
+    metrics = get_metrics()
+    metrics.count("ocr_calls")
+    metrics.count("ocr_images")
+    report_progress((record.path,))
+    with _stage("ocr", record.timings):
+        found, text, complete = locate_phrases(record.image, matcher.phrases)
+    if text is None:
+        return
+    record.entry = record.entry._replace(text=text)
+    record.located = found
+    if cache is not None and complete:
+        cache.put(record.key, record.entry)
+
+def _ocr_records(records, cache=None, matcher=None):
+    """Fill in the OCR text of every record that does not have it yet, in one engine call.
+
+    Huge and multi-page images are OCR'd on their own, tile by tile, stopping
+    once matcher (if given) finds all of its phrases, and get no boxes. When
+    locating, the other images are each OCR'd on their own with locate_phrases.
+    """
+    pending = [record for record in records if record.entry.text is None]
+    for record in pending:
+        if record.image is None:
+            with _stage("decode", record.timings):
+                record.image = load_image(record.path, record.data)
+    pending = [record for record in pending if record.image is not None]
+    tiled = [record for record in pending if isinstance(record.image, ImageContext) and record.image.tiled]
+    for record in tiled:
+        if matcher is not None and locating():
+            logging.info(f"{record.path} is OCR'd in tiles, so its matches carry no boxes")
+        _ocr_tiled(record, cache, matcher)
+    pending = [record for record in pending if record not in tiled]
+    if matcher is not None and locating():
+        for record in pending:
+            _locate(record, cache, matcher)
+        return
+    if not pending:
+        return
+    metrics = get_metrics()
+    metrics.count("ocr_calls")
+    metrics.count("ocr_images", len(pending))
+    report_progress([record.path for record in pending])
+    with metrics.timer("ocr"):
+        start = time.perf_counter()
+        texts = ocr_text_batch([record.image for record in pending])
+        share = (time.perf_counter() - start) / len(pending)
+    for record, text in zip(pending, texts):
+        record.timings["ocr"] = record.timings.get("ocr", 0.0) + share
+        if text is None:
+            continue
+        record.entry = record.entry._replace(text=text)
+        if cache is not None:
+            cache.put(record.key, record.entry)
+
+def _as_phrases(phrases):
+    return (phrases,) if isinstance(phrases, str) else tuple(phrases)
+
+def _match_records(records, phrases):
+    """(record, matched phrases) for every record whose OCR text contains at least one phrase.
+
+    When locating, phrases also match across line breaks and hyphenation, and
+    record.located maps them to their boxes (None for text from the cache).
+    """
+    metrics = get_metrics()
+    matcher = get_matcher(_as_phrases(phrases))
+    matches = []
+    with metrics.timer("match"):
+        for record in records:
+            if record.entry.text is None:
+                continue
+            if locating():
+                if record.located is None:
+                    stream = StreamingMatcher(matcher.phrases)
+                    stream.feed_text(record.entry.text)
+                    record.located = stream.found
+                matched = [phrase for phrase in matcher.phrases if phrase in record.located]
+            else:
+                matched = matcher.find(record.entry.text)
+            if matched:
+                matches.append((record, matched))
+    metrics.count("matches", len(matches))
+    return matches
+
+def process_files(args):
+    """Process a batch of images, OCR'ing the ones that pass the filters in one engine call.
+
+    The batch holds paths, or (path, bytes) pairs for files the parent read
+    ahead; bytes of None make the worker read the file itself.
+    """
+    image_paths, phrases = args
+    cache = get_cache()
+    return _find_phrases([_analyze_item(item, cache) for item in image_paths], phrases, cache)
+
+def process_uploads(args):
+    """process_files for (name, bytes) pairs with no file behind them, e.g. images sent to 'scan-image serve'."""
+    uploads, phrases = args
+    cache = get_cache()
+    return _find_phrases([_analyze(name, cache, data=data, stamped=False) for name, data in uploads], phrases, cache)
+
+def _find_phrases(records, phrases, cache=None):
+    """OCR the records that passed the filters in one engine call; a Match for each one containing a phrase."""
+    records = [record for record in records if record.entry.has_text]
+    _ocr_records(records, cache, get_matcher(_as_phrases(phrases)))
+    return [Match(record.path, record.entry.phash, matched, record.timings, _boxes(record, matched))
+            for record, matched in _match_records(records, phrases)]
+
+def _boxes(record, matched):
+    if record.located is None:
+        return None
+    return {phrase: record.located[phrase] for phrase in matched}
+
+def process_file(args):
+    image_path, phrases = args
+    results = process_files(([image_path], phrases))
+    return results[0] if results else None
+
+def hash_files(image_paths):
+    """First phase of a hash-first scan: filter and hash images without OCR."""
+    cache = get_cache()
+    records = [_analyze_item(item, cache) for item in image_paths]
+    return [(record.path, record.entry.phash) for record in records if record.entry.has_text]
+
+def ocr_files(args):
+    """Second phase of a hash-first scan: OCR group representatives, given as paths or (path, bytes) pairs."""
+    image_paths, phrases = args
+    cache = get_cache()
+    records = [_analyze_item(item, cache, filtered=True) for item in image_paths]
+    records = [record for record in records if record.entry.has_text]
+    _ocr_records(records, cache, get_matcher(_as_phrases(phrases)))
+    return [Match(record.path, None, matched, record.timings, _boxes(record, matched))
+            for record, matched in _match_records(records, phrases)]
 
-    return found_images
+def extract_texts(image_paths):
+    """Filter, hash and OCR a batch of images; returns (path, size, mtime_ns, CacheEntry) for each."""
+    cache = get_cache()
+    stamped = []
+    for image_path in image_paths:
+        try:
+            st = os.stat(image_path)
+        except OSError:
+            continue
+        stamped.append((_analyze(image_path, cache), st))
+    _ocr_records([record for record, _ in stamped if record.entry.has_text], cache)
+    return [(record.path, st.st_size, st.st_mtime_ns, record.entry) for record, st in stamped]
+
+def _scan_hash_first(pool, image_paths, phrases, report_duplicates, processes, dedupe_distance=0, groups=None,
+                     metrics=None, profile_dir=None, settings=None, supervision=None):
+    hashed = []
+    for results in _imap_bounded(pool, hash_files, _batched(image_paths, BATCH_SIZE), processes, metrics,
+                                 profile_dir, settings, supervision):
+        hashed.extend(results)
+
+    # Sorted, so the first path of each group is its representative
+    representatives = group_near_duplicates(sorted(hashed), dedupe_distance)
+    logging.info(f"Hashed {len(hashed)} candidate images into {len(representatives)} groups, "
+                 f"running OCR on one image per group")
+
+    phashes = dict(hashed)
+    # Representatives inside a tar are read in one pass per tar rather than one decompression each
+    tasks = ((batch, phrases) for batch in _batched(read_tar_members(representatives), BATCH_SIZE))
+    for results in _imap_bounded(pool, ocr_files, tasks, processes, metrics, profile_dir, settings, supervision):
+        for match in results:
+            if groups is not None:
+                groups[match.path] = representatives[match.path]
+            yield match._replace(phash=phashes[match.path])
+            if report_duplicates:
+                for member in representatives[match.path]:
+                    yield Match(member, phashes[member], match.phrases, {})
+
+def _fingerprint(ocr_engine, prefilter=None, text_regions=False, preprocess=None, locate=False):
+    """Fingerprint of the settings that decide cached and indexed results."""
+    prefilter = prefilter or DEFAULT_PREFILTER
+    preprocess = preprocess or DEFAULT_PREPROCESS
+    # Only named when on, so caches filled without it stay valid
+    extra = {"locate": True} if locate else {}
+    return make_fingerprint(tesseract_version(), engine=ocr_engine, prefilter=",".join(map(str, prefilter)),
+                            text_regions=bool(text_regions), preprocess=",".join(map(str, preprocess)), **extra)
+
+def _prepare_cache(cache_dir, cache_max_bytes, ocr_engine, prefilter=None, text_regions=False, preprocess=None,
+                   locate=False):
+    """Validate and trim the cache once in the parent; returns the settings workers open it with."""
+    if not cache_dir:
+        return None
+    fingerprint = _fingerprint(ocr_engine, prefilter, text_regions, preprocess, locate)
+    # Only open it briefly here: workers must not inherit a live SQLite connection
+    cache = OcrCache(cache_dir, fingerprint, cache_max_bytes)
+    try:
+        cache.evict()
+    finally:
+        cache.close()
+    return (cache_dir, fingerprint, cache_max_bytes)
+
+def _worker_initargs(ocr_engine, cache_dir, cache_max_bytes, prefilter=None, text_regions=False, preprocess=None,
+                     processes=None, timeout=None, locate=False):
+    """Arguments for _init_worker, preparing the cache on the way; the CPUs are shared among processes workers."""
+    cache_settings = _prepare_cache(cache_dir, cache_max_bytes, ocr_engine, prefilter, text_regions, preprocess,
+                                    locate)
+    omp_threads = max(1, cpu_count() // processes) if processes else None
+    return (ocr_engine, logging.getLogger().getEffectiveLevel(), cache_settings, prefilter, text_regions, preprocess,
+            omp_threads, timeout, locate)
+
+def _init_supervised_worker(initargs, progress, max_rss_mb=None):
+    """Pool initializer for _imap_supervised: _init_worker, then report progress on the given queue."""
+    _init_worker(*initargs)
+    init_supervision(progress, max_rss_mb)
+
+def _pipeline_batches(folder, shard, processes, prefetch_threads, metrics, archives=False):
+    """Batches of (path, bytes) pairs, largest files first, read by parent threads ahead of the workers.
+
+    The members of a tar are read in one pass, in archive order, when the
+    order reaches the tar.
+    """
+    if metrics is not None:
+        with metrics.timer("discovery"):
+            files = largest_first(folder, shard, archives)
+    else:
+        files = largest_first(folder, shard, archives)
+    # A worker's next batch is already read when it finishes the current one
+    return prefetched(read_batches(files, BATCH_SIZE, folder, shard), prefetch_threads or DEFAULT_PREFETCH_THREADS,
+                      processes, metrics)
+
+def _scan_on(pool, folder, phrases, hash_first, report_duplicates, dedupe_distance, groups, processes, metrics,
+             profile_dir, shard=None, scheduler="pool", prefetch_threads=None, archives=False, settings=None,
+             supervision=None):
+    if scheduler == "pipeline" and not hash_first:
+        batches = _pipeline_batches(folder, shard, processes, prefetch_threads, metrics, archives)
+    else:
+        # Archive members arrive with their bytes, so workers never open the archives
+        image_paths = filter_shard(iter_image_files(folder, archives=archives), folder, shard, key=item_path)
+        if metrics is not None:
+            image_paths = _timed(image_paths, metrics, "discovery")
+        if hash_first:
+            # Group perceptual duplicates before OCR so each group is OCR'd only once
+            yield from _scan_hash_first(pool, image_paths, phrases, report_duplicates, processes, dedupe_distance,
+                                        groups, metrics, profile_dir, settings, supervision)
+            return
+        batches = _batched(image_paths, BATCH_SIZE)
+    duplicates = NearDuplicates(dedupe_distance)
+    tasks = ((batch, phrases) for batch in batches)
+    for results in _imap_bounded(pool, process_files, tasks, processes, metrics, profile_dir, settings,
+                                 supervision):
+        for match in results:
+            if duplicates.add(match.path, match.phash) == match.path:
+                if groups is not None:
+                    # The group's list keeps growing as later near-duplicates arrive
+                    groups[match.path] = duplicates.groups[match.path]
+                yield match
+
+def iter_matches(folder, phrases, limit=None, executor=None, hash_first=False, report_duplicates=False,
+                 ocr_engine="auto", cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES, prefilter=None,
+                 text_regions=False, preprocess=None, dedupe_distance=0, groups=None, processes=None, metrics=None,
+                 profile_dir=None, shard=None, scheduler="pool", prefetch_threads=None, archives=False,
+                 timeout=None, max_tasks_per_worker=None, max_worker_rss_mb=None, locate=False):
+    """Yield a Match for every reported image as soon as its batch completes, stopping after limit (>= 1) matches.
+
+    executor is a multiprocessing Pool or a concurrent.futures ProcessPoolExecutor
+    to run on instead of a new Pool, so warm workers can be reused across calls;
+    the scan settings are applied in each worker on its first task. When the
+    consumer stops early, queued work is dropped: a pool started here is
+    terminated, tasks not yet started on an executor are cancelled, and a
+    caller's Pool only finishes the few batches already handed to it.
+
+    The other arguments are those of scan_images_for_phrases; processes also
+    bounds how many batches are queued on an executor, whose workers are not
+    supervised: they only get the OCR engine's timeout.
+    """
+    phrases = _as_phrases(phrases)
+    if limit is not None and limit < 1:
+        raise ValueError(f"limit must be at least 1, got {limit}")
+    check_distance(dedupe_distance)
+    processes = processes or cpu_count()
+    initargs = _worker_initargs(ocr_engine, cache_dir, cache_max_bytes, prefilter, text_regions, preprocess,
+                                processes, timeout, locate)
+    options = (hash_first, report_duplicates, dedupe_distance, groups, processes, metrics, profile_dir, shard,
+               scheduler, prefetch_threads, archives)
+
+    if executor is not None:
+        logging.info(f"Starting scan of '{folder}' for {len(phrases)} phrase(s) on the given executor")
+        matches = _scan_on(executor, folder, phrases, *options, settings=initargs)
+        try:
+            yield from islice(matches, limit)
+        finally:
+            matches.close()
+        return
+
+    logging.info(f"Starting scan of '{folder}' for {len(phrases)} phrase(s) using {processes} cores")
+    supervision = None
+    initializer = _init_worker
+    if timeout or max_worker_rss_mb:
+        progress = SimpleQueue()
+        supervision = (progress, timeout)
+        initializer = _init_supervised_worker
+        initargs = (initargs, progress, max_worker_rss_mb)
+    with Pool(processes=processes, initializer=initializer, initargs=initargs,
+              maxtasksperchild=max_tasks_per_worker or None) as pool:
+        matches = _scan_on(pool, folder, phrases, *options, supervision=supervision)
+        try:
+            yield from islice(matches, limit)
+        finally:
+            matches.close()
+
+def scan_images_for_phrases(folder, phrases, hash_first=False, report_duplicates=False, ocr_engine="auto",
+                            cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES, prefilter=None, text_regions=False,
+                            preprocess=None, dedupe_distance=0, groups=None, processes=None, metrics=None,
+                            profile_dir=None, limit=None, executor=None, shard=None, scheduler="pool",
+                            prefetch_threads=None, archives=False, timeout=None, max_tasks_per_worker=None,
+                            max_worker_rss_mb=None, locate=False):
+    """Scan a folder once for several phrases; returns {image_path: [matched phrases]}.
+
+    prefilter is a PrefilterConfig for the cheap check that skips images without text;
+    text_regions OCRs only detected text regions instead of whole images; preprocess
+    is a PreprocessConfig for rescaling and binarizing what Tesseract sees.
+
+    Images whose perceptual hashes differ in at most dedupe_distance bits (0 to
+    MAX_DISTANCE, else ValueError) are near-duplicates and only the group's
+    representative is reported. If groups
+    is a dict it receives {representative: [near-duplicate paths]} for every
+    reported representative. processes defaults to the number of CPUs.
+
+    metrics is a Metrics that receives the counters and stage timings of
+    every worker; with profile_dir each worker writes its cProfile stats there.
+    limit and executor are as for iter_matches. shard, an (index, count) pair,
+    limits the scan to the files whose relative path hashes to that shard.
+
+    scheduler "pipeline" walks the whole folder first, then hands out the
+    largest files first with their bytes read ahead by prefetch_threads
+    threads in this process; it does not apply to hash-first scans.
+
+    With archives, images inside zip and tar files are scanned too, without
+    extracting them, and reported as "archive.zip!/inner/path.png".
+
+    timeout is the seconds one image may take: a tesseract process running
+    longer is killed, and so is a worker stuck on one image, which the pool
+    replaces. Workers are also replaced after max_tasks_per_worker batches,
+    or before their next batch once they use more than max_worker_rss_mb MB
+    (Linux only). Images given up on are in metrics.skipped with the reason.
+
+    With locate, each image is OCR'd part by part in reading order into words
+    with their boxes, stopping once all phrases are found; phrases then also
+    match across line breaks and hyphenation, and iter_matches reports the
+    box of each phrase in Match.boxes.
+    """
+    matches = iter_matches(folder, phrases, limit, executor, hash_first, report_duplicates, ocr_engine, cache_dir,
+                           cache_max_bytes, prefilter, text_regions, preprocess, dedupe_distance, groups, processes,
+                           metrics, profile_dir, shard, scheduler, prefetch_threads, archives, timeout,
+                           max_tasks_per_worker, max_worker_rss_mb, locate)
+    return {match.path: match.phrases for match in matches}
+
+def scan_images_for_phrase(folder, phrase, **kwargs):
+    return list(scan_images_for_phrases(folder, [phrase], **kwargs))
+
+def _add_stage_arguments(parser):
+    parser.add_argument("--prefilter", choices=PREFILTER_METHODS, default=DEFAULT_PREFILTER.method,
+                        help="Cheap check that skips images without text before OCR: 'edges' uses edge density, "
+                             "'regions' also requires character-like shapes lined up in rows, 'off' OCRs every image "
+                             "(default: %(default)s)")
+    parser.add_argument("--min-edge-fraction", type=float, default=DEFAULT_PREFILTER.min_edge_fraction,
+                        help="Fraction of preview pixels that must be edges for an image to be OCR'd "
+                             "(default: %(default)s)")
+    parser.add_argument("--prefilter-size", type=int, default=DEFAULT_PREFILTER.max_side,
+                        help="Longest side in pixels of the reduced preview the prefilter runs on "
+                             "(default: %(default)s)")
+    parser.add_argument("--text-regions", action="store_true",
+                        help="Detect text regions and OCR only those crops, falling back to the whole image "
+                             "when none are found; much faster on photos and screenshots with little text")
+    parser.add_argument("--ocr-scale", choices=SCALE_MODES, default=DEFAULT_PREPROCESS.scale,
+                        help="Resize images before OCR: 'x-height' so lowercase letters are --x-height "
+                             "pixels tall, 'dpi' from the resolution stored in the file to --ocr-dpi "
+                             "(default: %(default)s)")
+    parser.add_argument("--x-height", type=int, default=DEFAULT_PREPROCESS.x_height,
+                        help="Target x-height in pixels for --ocr-scale x-height (default: %(default)s)")
+    parser.add_argument("--ocr-dpi", type=int, default=DEFAULT_PREPROCESS.dpi,
+                        help="Target resolution for --ocr-scale dpi (default: %(default)s)")
+    parser.add_argument("--binarize", choices=BINARIZE_MODES, default=DEFAULT_PREPROCESS.binarize,
+                        help="Convert to black and white before OCR with a global Otsu or a local adaptive "
+                             "threshold (default: %(default)s)")
+
+def _prefilter_from_args(args):
+    return PrefilterConfig(args.prefilter, args.prefilter_size, args.min_edge_fraction,
+                           DEFAULT_PREFILTER.min_text_regions)
+
+def _preprocess_from_args(args):
+    return PreprocessConfig(args.ocr_scale, args.x_height, args.ocr_dpi, DEFAULT_PREPROCESS.max_side,
+                            args.binarize)
+
+def _run_subcommand(argv):
+    """Dispatch 'scan-image <command> ...'; returns False when argv is a plain scan."""
+    if not argv or argv[0] not in ("index", "query", "merge", "serve", "client"):
+        return False
+    # Imported here because these modules build on this one
+    from .index import index_main, query_main
+    from .merge import merge_main
+    from .serve import client_main, serve_main
+    commands = {"index": index_main, "query": query_main, "merge": merge_main, "serve": serve_main,
+                "client": client_main}
+    commands[argv[0]](argv[1:])
+    return True
+
+def _shard_arg(value):
+    """argparse type for INDEX/COUNT, e.g. 0/4 to 3/4."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT such as 0/4, got '{value}'")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 0 and {count - 1}, got {index}")
+    return index, count
+
+def _number_arg(convert, minimum):
+    """argparse type for a number, int or float as convert, of at least minimum."""
+    def parse(value):
+        try:
+            number = convert(value)
+        except ValueError:
+            number = None
+        # Written so that NaN fails too
+        if number is None or not number >= minimum:
+            raise argparse.ArgumentTypeError(f"expected a number of at least {minimum}, got '{value}'")
+        return number
+    return parse
+
+def _duplicates_note(groups, image_path):
+    duplicates = groups.get(image_path) if groups else None
+    if not duplicates:
+        return ""
+    return "".join(f"\n    ~ {duplicate}" for duplicate in duplicates)
+
+def _match_record(match):
+    record = {"path": match.path, "phash": match.phash, "phrases": list(match.phrases),
+              "timings_ms": {stage: round(seconds * 1000, 3) for stage, seconds in match.timings.items()}}
+    if match.boxes is not None:
+        record["boxes"] = {phrase: list(box) if box else None for phrase, box in match.boxes.items()}
+    return record
+
+def _write_jsonl(matches, output_file=None, groups=None):
+    """Write one JSON line per match as it arrives, flushed so consumers can act on it at once; returns the count.
+
+    groups fill up as the scan goes, so the near-duplicates of the matches
+    follow at the end, one {"path", "duplicate_of"} line each.
+    """
+    out = open(output_file, "w", encoding="utf-8") if output_file else sys.stdout
+    count = 0
+    try:
+        for match in matches:
+            out.write(json.dumps(_match_record(match)) + "\n")
+            out.flush()
+            count += 1
+        for representative, members in (groups or {}).items():
+            for member in members:
+                out.write(json.dumps({"path": member, "duplicate_of": representative}) + "\n")
+        out.flush()
+    finally:
+        if output_file:
+            out.close()
+    return count
+
+def _write_metrics(metrics, args, elapsed, found):
+    run = {"seconds": round(elapsed, 3), "workers": cpu_count(), "images_found": found}
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json, **run)
+        logging.info(f"Metrics written to '{args.metrics_json}'")
+    if args.prometheus_textfile:
+        metrics.write_prometheus(args.prometheus_textfile, run_seconds=run["seconds"], workers=run["workers"],
+                                 images_found=found)
+        logging.info(f"Prometheus metrics written to '{args.prometheus_textfile}'")
+
+def _report_skipped(skipped):
+    if skipped:
+        lines = "\n".join(f"- {path}: {reason}" for path, reason in skipped)
+        logging.warning(f"{len(skipped)} image(s) were skipped:\n{lines}")
+
+def _watch(folder_path, phrases, args):
+    from .watch import watch_images_for_phrases
+
+    def report(image_path, matched):
+        suffix = f": {', '.join(matched)}" if len(phrases) > 1 else ""
+        logging.success(f"Match: {image_path}{suffix}")
+
+    try:
+        watch_images_for_phrases(folder_path, phrases, report,
+                                 ocr_engine=args.ocr_engine,
+                                 cache_dir=args.cache_dir,
+                                 cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+                                 poll_interval=args.poll_interval,
+                                 prefilter=_prefilter_from_args(args),
+                                 text_regions=args.text_regions,
+                                 preprocess=_preprocess_from_args(args),
+                                 dedupe_distance=args.dedupe_distance,
+                                 timeout=args.timeout or None,
+                                 max_tasks_per_worker=args.max_tasks_per_worker,
+                                 locate=args.locate)
+    except KeyboardInterrupt:
+        logging.info("Watch stopped.")
 
 def main():
-    parser = argparse.ArgumentParser(description="Scan a folder of images and detect a specific text phrase using OCR (Tesseract).")
+    if _run_subcommand(sys.argv[1:]):
+        return
+
+    parser = argparse.ArgumentParser(description="Scan a folder of images and detect specific text phrases using OCR (Tesseract).")
     parser.add_argument("--version", action="version", version=f"scan-image {__version__}")
     parser.add_argument("-f", "--folder", help="Folder path to scan")
-    parser.add_argument("-p", "--phrase", help="Phrase to search for")
+    parser.add_argument("-p", "--phrase", dest="phrases", action="append", default=[],
+                        help="Phrase to search for (repeat to search for several in one pass)")
+    parser.add_argument("--phrases-file", help="File with one phrase per line to search for")
+    parser.add_argument("--hash-first", action="store_true",
+                        help="Group duplicate images by perceptual hash before OCR and OCR one image per group")
+    parser.add_argument("--all-duplicates", action="store_true",
+                        help="With --hash-first, report every image of a matching group instead of one")
+    parser.add_argument("--dedupe-distance", type=distance_arg, default=0,
+                        help="Treat images whose perceptual hashes differ in at most this many of 64 bits as "
+                             "near-duplicates and list them under one representative; 0 only merges identical "
+                             "hashes, 4-10 catches recompressed, resized or slightly cropped copies; at most "
+                             f"{MAX_DISTANCE} (default: %(default)s)")
+    parser.add_argument("--ocr-engine", choices=ENGINE_NAMES, default="auto",
+                        help="OCR backend: 'tesserocr' keeps Tesseract loaded in-process, 'batch' OCRs several "
+                             "images per tesseract run, 'subprocess' runs tesseract once per image "
+                             "(default: tesserocr if installed, otherwise batch)")
+    parser.add_argument("--cache-dir", default=os.getenv("SCAN_IMAGE_CACHE_DIR"),
+                        help="Directory for the persistent OCR result cache (default: $SCAN_IMAGE_CACHE_DIR, "
+                             "caching is off when neither is set)")
+    parser.add_argument("--watch", action="store_true",
+                        help="After the initial scan keep running and scan new or changed images as they arrive")
+    parser.add_argument("--poll-interval", type=float, default=2.0,
+                        help="Seconds between checks in --watch mode when inotify is not available")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Evict least recently used cache entries above this size")
+    parser.add_argument("--shard", type=_shard_arg, metavar="INDEX/COUNT",
+                        help="Scan only shard INDEX (0 to COUNT-1) of COUNT, chosen by a stable hash of each file's "
+                             "path relative to the folder, so COUNT machines can split a scan without overlap; "
+                             "combine their --output jsonl files with 'scan-image merge'")
+    parser.add_argument("--archives", action="store_true",
+                        help="Also scan the images inside .zip and .tar(.gz/.bz2/.xz) files, reading them from "
+                             "memory without extracting; matches are reported as archive.zip!/inner/path.png")
+    parser.add_argument("--scheduler", choices=SCHEDULERS, default="pool",
+                        help="'pool' hands files to the workers as they are found, 'pipeline' lists the folder "
+                             "first and hands out the largest files first, their bytes read ahead by threads so "
+                             "workers only decode and OCR; ignored with --hash-first (default: %(default)s)")
+    parser.add_argument("--prefetch-threads", type=int, default=DEFAULT_PREFETCH_THREADS, metavar="N",
+                        help="Threads reading files ahead of the workers with --scheduler pipeline "
+                             "(default: %(default)s)")
+    parser.add_argument("--timeout", type=_number_arg(float, 0), default=DEFAULT_TIMEOUT, metavar="SECONDS",
+                        help="Give up on an image after this many seconds of OCR, killing its tesseract process or "
+                             "its worker, and list it as skipped at the end; 0 waits forever (default: %(default)s)")
+    parser.add_argument("--max-tasks-per-worker", type=_number_arg(int, 1), metavar="N",
+                        help="Replace each worker process after N batches to return the memory leaked by "
+                             "decoders and OCR (default: keep workers for the whole scan)")
+    parser.add_argument("--max-worker-memory-mb", type=_number_arg(int, 0), default=DEFAULT_MAX_WORKER_RSS_MB,
+                        metavar="MB",
+                        help="Replace a worker before its next batch once its resident memory is above this "
+                             "(Linux only); 0 disables the check (default: %(default)s)")
+    parser.add_argument("--locate", action="store_true",
+                        help="OCR each image region by region, or band by band on dense pages, and stop as soon as "
+                             "all phrases are found; phrases may then span line breaks and hyphenated words, and "
+                             "--output jsonl gives each phrase's bounding box in pixels")
+    parser.add_argument("--limit", type=_number_arg(int, 1), metavar="N",
+                        help="Stop the scan after N matching images and cancel the work still queued")
+    parser.add_argument("--first", action="store_const", const=1, dest="limit",
+                        help="Stop at the first matching image (same as --limit 1)")
+    parser.add_argument("--output", choices=("text", "jsonl"), default="text",
+                        help="'text' logs a summary when the scan ends, 'jsonl' writes one JSON record per match "
+                             "(path, phash, phrases, timings_ms) as soon as it is found (default: %(default)s)")
+    parser.add_argument("--output-file", metavar="PATH",
+                        help="With --output jsonl, write the records to this file instead of stdout")
+    parser.add_argument("--metrics-json", metavar="PATH",
+                        help="Write per-stage timings and counters (files seen, rejected per stage, cache hits, "
+                             "OCR calls, bytes read) of the scan to this JSON file")
+    parser.add_argument("--prometheus-textfile", metavar="PATH",
+                        help="Also write the metrics in Prometheus text format, e.g. for node_exporter's "
+                             "textfile collector")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="Write cProfile stats of every worker to DIR/worker-<pid>.prof")
+    _add_stage_arguments(parser)
     args = parser.parse_args()
+    if args.watch:
+        # Watch mode logs each match as it comes and never ends by itself
+        unsupported = {"--shard": args.shard, "--archives": args.archives, "--hash-first": args.hash_first,
+                       "--all-duplicates": args.all_duplicates, "--limit/--first": args.limit,
+                       "--output jsonl": args.output == "jsonl", "--output-file": args.output_file,
+                       "--scheduler pipeline": args.scheduler == "pipeline", "--metrics-json": args.metrics_json,
+                       "--prometheus-textfile": args.prometheus_textfile, "--profile": args.profile}
+        for option, given in unsupported.items():
+            if given:
+                parser.error(f"{option} cannot be combined with --watch")
+
+    setup_logging()
+    setup_tesseract()
 
     # If not provided, ask interactively
+    interactive = not args.folder or not (args.phrases or args.phrases_file)
     folder_path = os.path.normpath(args.folder) if args.folder else input("Enter the folder path to scan: ").strip()
-    target_phrase = args.phrase if args.phrase else input("Enter the phrase to search for: ").strip()
+    phrases = list(args.phrases)
+    if args.phrases_file:
+        phrases.extend(read_phrases_file(args.phrases_file))
+    if not phrases:
+        phrases = [input("Enter the phrase to search for: ").strip()]
 
     if not os.path.isdir(folder_path):
         logging.error(f"The folder '{folder_path}' does not exist.")
         exit(1)
 
-    logging.info(f"Scanning images in '{folder_path}' for phrase '{target_phrase}'...")
+    if len(phrases) == 1:
+        logging.info(f"Scanning images in '{folder_path}' for phrase '{phrases[0]}'...")
+    else:
+        logging.info(f"Scanning images in '{folder_path}' for {len(phrases)} phrases...")
+
+    if args.watch:
+        _watch(folder_path, phrases, args)
+        return
 
     start_time = time.time()
-    found_images = scan_images_for_phrase(folder_path, target_phrase)
+    # With --all-duplicates they are listed as matches of their own instead
+    groups = None if args.all_duplicates else {}
+    # Always collected: skipped images are reported at the end
+    metrics = Metrics()
+    options = dict(hash_first=args.hash_first,
+                   report_duplicates=args.all_duplicates,
+                   ocr_engine=args.ocr_engine,
+                   cache_dir=args.cache_dir,
+                   cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+                   prefilter=_prefilter_from_args(args),
+                   text_regions=args.text_regions,
+                   preprocess=_preprocess_from_args(args),
+                   dedupe_distance=args.dedupe_distance,
+                   groups=groups,
+                   metrics=metrics,
+                   profile_dir=args.profile,
+                   limit=args.limit,
+                   shard=args.shard,
+                   scheduler=args.scheduler,
+                   prefetch_threads=args.prefetch_threads,
+                   archives=args.archives,
+                   timeout=args.timeout or None,
+                   max_tasks_per_worker=args.max_tasks_per_worker,
+                   max_worker_rss_mb=args.max_worker_memory_mb or None,
+                   locate=args.locate)
+    if args.output == "jsonl":
+        found_images = None
+        found = _write_jsonl(iter_matches(folder_path, phrases, **options), args.output_file, groups)
+    else:
+        found_images = scan_images_for_phrases(folder_path, phrases, **options)
+        found = len(found_images)
     elapsed = time.time() - start_time
+    if args.limit and found >= args.limit:
+        logging.info(f"Stopped after {found} match(es) as requested by --limit/--first")
+    if args.metrics_json or args.prometheus_textfile:
+        _write_metrics(metrics, args, elapsed, found)
+    _report_skipped(metrics.skipped)
+    if args.profile:
+        logging.info(f"Worker profiles written to '{args.profile}' (view with: python -m pstats <file>)")
+
+    if found_images is None:
+        # Records are already out, keep stdout clean for them
+        logging.info(f"Scan complete: {found} matching image(s) in {elapsed:.2f} seconds")
+        return
 
     if found_images:
         count = len(found_images)
         word = "image" if count == 1 else "images"
-        paths_str = "\n".join(f"- {img}" for img in found_images)
-        logging.success(f"Scan complete: The phrase was found in {count} {word}:\n{paths_str}")
-    else:
+        if len(phrases) == 1:
+            paths_str = "\n".join(f"- {img}{_duplicates_note(groups, img)}" for img in found_images)
+            logging.success(f"Scan complete: The phrase was found in {count} {word}:\n{paths_str}")
+        else:
+            paths_str = "\n".join(f"- {img}: {', '.join(matched)}{_duplicates_note(groups, img)}"
+                                  for img, matched in found_images.items())
+            logging.success(f"Scan complete: Phrases were found in {count} {word}:\n{paths_str}")
+    elif len(phrases) == 1:
         logging.warning("No images contain the phrase.")
+    else:
+        logging.warning("No images contain any of the phrases.")
 
     logging.info(f"Time taken: {elapsed:.2f} seconds")
-    time.sleep(5)
+    if interactive:
+        # Keep a console window opened just for this run readable
+        time.sleep(5)
 
 if __name__ == "__main__":
     main()
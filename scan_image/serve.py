@@ -0,0 +1,498 @@
+import io
+import os
+import sys
+import json
+import queue
+import logging
+import argparse
+import threading
+import http.client
+from collections import deque
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+from urllib.parse import parse_qs, urlencode, urlsplit
+from . import __version__
+from .cache import DEFAULT_MAX_BYTES
+from .config import setup_tesseract
+from .dedupe import MAX_DISTANCE, NearDuplicates
+from .discovery import iter_image_files
+from .logger import setup_logging
+from .metrics import Metrics
+from .ocr import ENGINE_NAMES, get_engine
+from .scanner import (DEFAULT_TIMEOUT, _add_stage_arguments, _batched, _init_worker, _match_record, _measured_task,
+                      _number_arg, _prefilter_from_args, _preprocess_from_args, _worker_initargs, process_files,
+                      process_uploads)
+from .utils import Image, compute_perceptual_hash, has_text_heuristic, load_image
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Requests served at once; more are refused with 503 until one ends
+DEFAULT_MAX_REQUESTS = 16
+# Images per task of a folder scan: fewer than a CLI scan's, so that a check
+# arriving meanwhile waits for at most a few images to get a worker
+SCAN_BATCH_SIZE = 4
+MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+MAX_REQUEST_BYTES = 1024 * 1024
+
+_DONE = object()
+
+class ServiceError(RuntimeError):
+    """The scan service refused or failed a request."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class Job:
+    """The tasks of one request and the results they produced, in completion order."""
+
+    def __init__(self, scheduler, tasks):
+        # Tasks ready to start; a folder scan's are added by its producer thread as the walk finds them
+        self.pending = deque()
+        self.in_flight = 0
+        # Results delivered to the job and not yet taken by its consumer
+        self.unread = 0
+        self.exhausted = False
+        # Raised by the task iterator; reported after the results of the tasks before it
+        self.error = None
+        self.cancelled = False
+        self.finished = False
+        self._scheduler = scheduler
+        self._results = queue.Queue()
+        if isinstance(tasks, (list, tuple)):
+            # Ready at once, e.g. a check's upload: no thread, and it gets the next free worker
+            self.pending.extend(tasks)
+            self.exhausted = True
+        else:
+            self._tasks = tasks
+            threading.Thread(target=scheduler._produce, args=(self,), name="scan-image-producer", daemon=True).start()
+
+    def __iter__(self):
+        """Yield (result, metrics snapshot) per task; re-raises a task's exception."""
+        while True:
+            outcome = self._results.get()
+            if outcome is _DONE:
+                return
+            self._scheduler._consumed(self)
+            if isinstance(outcome, BaseException):
+                raise outcome
+            yield outcome
+
+    def close(self):
+        """Drop the tasks not started yet; results still running are discarded."""
+        self._scheduler._cancel(self)
+
+class FairScheduler:
+    """Feed the tasks of concurrent requests to one warm pool, taking turns between the requests.
+
+    At most slots tasks are on the pool at once and a request whose consumer
+    has slots results waiting gets no more tasks until it reads them, so a
+    slow client holds back only its own scan. A request gets a worker as soon
+    as one finishes a task, however long the scans ahead of it are. Folders
+    are walked by a producer thread per request, never by the dispatcher, so
+    a slow walk delays only its own scan.
+    """
+
+    def __init__(self, pool, slots, max_requests=DEFAULT_MAX_REQUESTS):
+        self._pool = pool
+        self._slots = slots
+        self._max_requests = max_requests
+        self._free = slots
+        self._jobs = deque()
+        self._changed = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._dispatch, name="scan-image-scheduler", daemon=True)
+        self._thread.start()
+
+    @property
+    def active(self):
+        with self._changed:
+            return len(self._jobs)
+
+    def submit(self, tasks):
+        """Queue the (func, args) tasks of a request; returns its Job, or None when max_requests are active.
+
+        A list of tasks is ready at once, any other iterable is consumed by a
+        producer thread.
+        """
+        with self._changed:
+            if len(self._jobs) >= self._max_requests:
+                return None
+            job = Job(self, tasks)
+            # First in line: the next free worker goes to a request that has none yet
+            self._jobs.appendleft(job)
+            self._finish_if_done(job)
+            self._changed.notify_all()
+        return job
+
+    def stop(self):
+        with self._changed:
+            self._stopped = True
+            self._changed.notify_all()
+        self._thread.join()
+
+    def _ready(self, job):
+        return job.pending and job.in_flight + job.unread < self._slots
+
+    def _next_job(self):
+        """The next request in turn that may start a task, moved to the back of the line."""
+        for _ in range(len(self._jobs)):
+            job = self._jobs[0]
+            self._jobs.rotate(-1)
+            if self._ready(job):
+                return job
+        return None
+
+    def _produce(self, job):
+        """Producer thread of a request: move its tasks to pending, at most slots ahead of the workers."""
+        try:
+            for task in job._tasks:
+                with self._changed:
+                    while not job.cancelled and not self._stopped and len(job.pending) >= self._slots:
+                        self._changed.wait()
+                    if job.cancelled or self._stopped:
+                        return
+                    job.pending.append(task)
+                    self._changed.notify_all()
+        except Exception as e:
+            job.error = e
+        finally:
+            with self._changed:
+                job.exhausted = True
+                self._finish_if_done(job)
+                self._changed.notify_all()
+
+    def _dispatch(self):
+        while True:
+            with self._changed:
+                job = None
+                while not self._stopped and (not self._free or (job := self._next_job()) is None):
+                    self._changed.wait()
+                if self._stopped:
+                    return
+                self._free -= 1
+                job.in_flight += 1
+                func, args = job.pending.popleft()
+                self._changed.notify_all()
+            self._pool.apply_async(_measured_task, ((func, args, None, None),), callback=partial(self._finished, job),
+                                   error_callback=partial(self._finished, job))
+
+    def _finished(self, job, outcome):
+        """Pool callback: hand a task's result or exception to its job and start the next task."""
+        with self._changed:
+            if not job.cancelled:
+                job.unread += 1
+                job._results.put(outcome)
+            self._free += 1
+            job.in_flight -= 1
+            self._finish_if_done(job)
+            self._changed.notify_all()
+
+    def _finish_if_done(self, job):
+        # Called with the lock held
+        if job.exhausted and not job.pending and not job.in_flight and not job.finished:
+            # The request stays active until its consumer closes it
+            job.finished = True
+            if job.error is not None and not job.cancelled:
+                job.unread += 1
+                job._results.put(job.error)
+            job._results.put(_DONE)
+
+    def _consumed(self, job):
+        with self._changed:
+            job.unread -= 1
+            self._changed.notify_all()
+
+    def _cancel(self, job):
+        with self._changed:
+            job.cancelled = True
+            job.pending.clear()
+            if job in self._jobs:
+                self._jobs.remove(job)
+            if not job.finished:
+                job.finished = True
+                job._results.put(_DONE)
+            self._changed.notify_all()
+
+def _warm_up():
+    """Run a blank image through decoding, the prefilter and hashing, importing what they load lazily."""
+    out = io.BytesIO()
+    Image.new("L", (64, 64), 255).save(out, format="PNG")
+    image = load_image("warm-up.png", out.getvalue())
+    has_text_heuristic(image)
+    compute_perceptual_hash(image)
+
+def _init_serve_worker(*initargs):
+    """Pool initializer: _init_worker, then load the OCR engine and image libraries before the first request."""
+    _init_worker(*initargs)
+    get_engine()
+    _warm_up()
+
+def _count(request, name, default, minimum, maximum=None):
+    """The integer request[name] (default when missing or null); ServiceError 400 when out of minimum..maximum."""
+    value = request.get(name)
+    if value is None:
+        return default
+    if (isinstance(value, bool) or not isinstance(value, int) or value < minimum
+            or (maximum is not None and value > maximum)):
+        bounds = f"from {minimum} to {maximum}" if maximum is not None else f"of at least {minimum}"
+        raise ServiceError(f'"{name}" must be an integer {bounds}', 400)
+    return value
+
+class _Handler(BaseHTTPRequestHandler):
+    """POST /scan and POST /check stream JSON lines, one per match, then a {"done": ...} summary."""
+
+    server_version = f"scan-image/{__version__}"
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status, record, **headers):
+        body = (json.dumps(record) + "\n").encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name.replace("_", "-"), value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self, max_bytes):
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise ServiceError("Content-Length required", 411)
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ServiceError("Content-Length must be a number of bytes", 400)
+        if length > max_bytes:
+            raise ServiceError(f"request body above {max_bytes} bytes", 413)
+        return self.rfile.read(length)
+
+    def _scan_request(self, query):
+        try:
+            request = json.loads(self._read_body(MAX_REQUEST_BYTES))
+            folder, phrases = request["folder"], request["phrases"]
+        except (ValueError, KeyError, TypeError):
+            raise ServiceError('expected a JSON object with "folder" and "phrases"', 400) from None
+        if (not isinstance(phrases, list) or not phrases
+                or not all(isinstance(phrase, str) and phrase for phrase in phrases)):
+            raise ServiceError('"phrases" must be a non-empty list of non-empty strings', 400)
+        if not isinstance(folder, str) or not os.path.isabs(folder) or not os.path.isdir(folder):
+            raise ServiceError(f"not an absolute path to a folder: {folder}", 400)
+        # Checked before the response starts: errors after that can only end the stream
+        limit = _count(request, "limit", None, minimum=1)
+        dedupe_distance = _count(request, "dedupe_distance", 0, minimum=0, maximum=MAX_DISTANCE)
+        tasks = ((process_files, (batch, phrases)) for batch in _batched(iter_image_files(folder), SCAN_BATCH_SIZE))
+        return tasks, phrases, limit, dedupe_distance
+
+    def _check_request(self, query):
+        phrases = query.get("phrase")
+        if not phrases:
+            raise ServiceError("at least one phrase parameter required", 400)
+        name = query.get("name", ["upload.png"])[0]
+        data = self._read_body(MAX_UPLOAD_BYTES)
+        return [(process_uploads, ([(name, data)], phrases))], phrases, None, 0
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/status":
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(200, {"version": __version__, "workers": self.server.processes,
+                              "requests": self.server.scheduler.active})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        handlers = {"/scan": self._scan_request, "/check": self._check_request}
+        if url.path not in handlers:
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            tasks, phrases, limit, dedupe_distance = handlers[url.path](parse_qs(url.query))
+        except ServiceError as e:
+            self._send_json(e.status, {"error": str(e)})
+            return
+        job = self.server.scheduler.submit(tasks)
+        if job is None:
+            # Backpressure: the client retries later instead of queueing behind every other request
+            self._send_json(503, {"error": "too many requests in progress"}, Retry_After="1")
+            return
+        try:
+            self._stream(job, limit, dedupe_distance)
+        finally:
+            job.close()
+
+    def _stream(self, job, limit, dedupe_distance):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        metrics = Metrics()
+        duplicates = NearDuplicates(dedupe_distance)
+
+        def matches():
+            for results, snapshot in job:
+                metrics.merge(snapshot)
+                for match in results:
+                    if duplicates.add(match.path, match.phash) == match.path:
+                        yield match
+
+        found = 0
+        try:
+            for match in islice(matches(), limit):
+                self._write_line(_match_record(match))
+                found += 1
+            self._write_line({"done": True, "found": found, "skipped": [list(item) for item in metrics.skipped]})
+        except (BrokenPipeError, ConnectionResetError):
+            logging.info(f"Client {self.address_string()} went away, cancelling its request")
+        except Exception as e:
+            logging.error(f"Request from {self.address_string()} failed: {e}")
+            self._write_line({"error": str(e)})
+
+    def _write_line(self, record):
+        # Flushed line by line so clients can act on each match at once
+        self.wfile.write((json.dumps(record) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, processes=None, max_requests=DEFAULT_MAX_REQUESTS, ocr_engine="auto",
+          cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES, prefilter=None, text_regions=False, preprocess=None,
+          timeout=None, max_tasks_per_worker=None, locate=False, ready=None):
+    """Serve scan and check requests on host:port with a warm pool of processes workers until interrupted.
+
+    The settings apply to every request; with locate, match records carry
+    the box of each phrase. ready, if given, is called with the server once
+    it listens, e.g. to learn the port when port is 0.
+    """
+    processes = processes or cpu_count()
+    initargs = _worker_initargs(ocr_engine, cache_dir, cache_max_bytes, prefilter, text_regions, preprocess,
+                                processes, timeout, locate)
+    with Pool(processes, _init_serve_worker, initargs, maxtasksperchild=max_tasks_per_worker or None) as pool:
+        # One task per worker: a new request never waits behind tasks queued inside the pool
+        scheduler = FairScheduler(pool, processes, max_requests)
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+        server.scheduler = scheduler
+        server.processes = processes
+        try:
+            logging.info(f"Serving on http://{host}:{server.server_address[1]} with {processes} workers")
+            if ready is not None:
+                ready(server)
+            server.serve_forever()
+        finally:
+            server.server_close()
+            scheduler.stop()
+
+def _records(response):
+    """Yield the JSON lines of a response, raising ServiceError for an error."""
+    if response.status != 200:
+        try:
+            message = json.loads(response.read())["error"]
+        except (ValueError, KeyError, TypeError):
+            message = response.reason
+        raise ServiceError(message, response.status)
+    for line in response:
+        record = json.loads(line)
+        if "error" in record:
+            raise ServiceError(record["error"], response.status)
+        if record.get("done"):
+            for path, reason in record["skipped"]:
+                logging.warning(f"Skipped by the server: {path}: {reason}")
+            return
+        yield record
+
+def remote_scan(folder, phrases, limit=None, dedupe_distance=0, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+    """Yield the match records of a folder scan run by 'scan-image serve' as the server finds them."""
+    body = json.dumps({"folder": os.path.abspath(folder), "phrases": list(phrases), "limit": limit,
+                       "dedupe_distance": dedupe_distance})
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request("POST", "/scan", body, {"Content-Type": "application/json"})
+        # Closing the connection early cancels the rest of the scan on the server
+        yield from _records(connection.getresponse())
+    finally:
+        connection.close()
+
+def remote_check(data, phrases, name="upload.png", host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+    """The phrases 'scan-image serve' finds in one image's bytes; name's extension tells the image format."""
+    query = urlencode({"name": name, "phrase": list(phrases)}, doseq=True)
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request("POST", f"/check?{query}", data, {"Content-Type": "application/octet-stream"})
+        records = list(_records(connection.getresponse()))
+    finally:
+        connection.close()
+    return records[0]["phrases"] if records else []
+
+def serve_main(argv):
+    parser = argparse.ArgumentParser(prog="scan-image serve",
+                                     description="Keep a warm pool of OCR workers and serve scan and phrase-check "
+                                                 "requests over HTTP; see 'scan-image client'.")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="Address to listen on; requests are not authenticated, so keep it on loopback "
+                             "(default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on (default: %(default)s)")
+    parser.add_argument("--processes", type=int, help="Worker processes (default: the number of CPUs)")
+    parser.add_argument("--max-requests", type=int, default=DEFAULT_MAX_REQUESTS,
+                        help="Requests served at once; more are answered with 503 (default: %(default)s)")
+    parser.add_argument("--ocr-engine", choices=ENGINE_NAMES, default="auto", help="OCR backend")
+    parser.add_argument("--cache-dir", default=os.getenv("SCAN_IMAGE_CACHE_DIR"),
+                        help="Directory for the persistent OCR result cache")
+    parser.add_argument("--timeout", type=_number_arg(float, 0), default=DEFAULT_TIMEOUT, metavar="SECONDS",
+                        help="Kill a tesseract process OCR'ing one image for longer than this; 0 waits forever "
+                             "(default: %(default)s)")
+    parser.add_argument("--max-tasks-per-worker", type=_number_arg(int, 1), metavar="N",
+                        help="Replace each worker after N tasks (default: keep them)")
+    parser.add_argument("--locate", action="store_true",
+                        help="Stop OCR'ing an image once its phrases are found and report each phrase's bounding box")
+    _add_stage_arguments(parser)
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    setup_tesseract()
+    if args.host not in ("127.0.0.1", "::1", "localhost"):
+        logging.warning(f"Listening on {args.host}: anyone who can reach it can scan this machine's folders")
+    try:
+        serve(args.host, args.port, args.processes, args.max_requests, args.ocr_engine, args.cache_dir,
+              prefilter=_prefilter_from_args(args), text_regions=args.text_regions,
+              preprocess=_preprocess_from_args(args), timeout=args.timeout or None,
+              max_tasks_per_worker=args.max_tasks_per_worker, locate=args.locate)
+    except KeyboardInterrupt:
+        logging.info("Server stopped.")
+
+def client_main(argv):
+    parser = argparse.ArgumentParser(prog="scan-image client",
+                                     description="Scan a folder or check images with a running 'scan-image serve', "
+                                                 "writing one JSON line per match.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-f", "--folder", help="Folder for the server to scan")
+    source.add_argument("-i", "--image", dest="images", action="append", help="Image file to send (repeatable)")
+    parser.add_argument("-p", "--phrase", dest="phrases", action="append", required=True,
+                        help="Phrase to search for (repeatable)")
+    parser.add_argument("--limit", type=_number_arg(int, 1), metavar="N",
+                        help="With --folder, stop after N matching images")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Server address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Server port (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    try:
+        if args.folder:
+            records = remote_scan(args.folder, args.phrases, args.limit, host=args.host, port=args.port)
+        else:
+            records = _check_files(args.images, args.phrases, args.host, args.port)
+        for record in records:
+            sys.stdout.write(json.dumps(record) + "\n")
+            sys.stdout.flush()
+    except (OSError, ServiceError) as e:
+        logging.error(f"Request to {args.host}:{args.port} failed: {e}")
+        exit(1)
+
+def _check_files(paths, phrases, host, port):
+    for path in paths:
+        with open(path, "rb") as f:
+            found = remote_check(f.read(), phrases, os.path.basename(path), host, port)
+        if found:
+            yield {"path": path, "phrases": found}
@@ -0,0 +1,89 @@
+import os
+import time
+import signal
+import logging
+
+# Seconds a worker may overrun its deadline before it is killed. The OCR
+# engine's own timeout kills a stuck tesseract process first, so this
+# catches workers stuck in-process: decoding, OpenCV or tesserocr
+KILL_GRACE = 10.0
+# Seconds a task's result may take to arrive after its worker is gone before
+# the worker is taken for dead, e.g. killed by the kernel for lack of memory
+EXIT_GRACE = 1.0
+POLL_INTERVAL = 0.2
+
+# Set in supervised workers
+_progress = None
+_max_rss_mb = None
+_task_id = None
+_tasks_done = 0
+# The files last reported by this worker's task
+_paths = None
+
+def current_rss_mb():
+    """Resident memory of this process in MB, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def init_worker(progress, max_rss_mb=None):
+    """Pool initializer part: the queue to report progress on and the memory to retire at."""
+    global _progress, _max_rss_mb
+    _progress = progress
+    _max_rss_mb = max_rss_mb
+
+def report_progress(paths):
+    """Tell the supervisor which files this worker is working on from now on."""
+    global _paths
+    if _progress is not None and _task_id is not None:
+        _paths = tuple(paths)
+        _progress.put((os.getpid(), _task_id, _paths, time.time()))
+
+def report_page_done():
+    """Tell the supervisor the OCR engine finished a page or image, restarting this worker's deadline."""
+    if _progress is not None and _task_id is not None and _paths:
+        _progress.put((os.getpid(), _task_id, _paths, time.time()))
+
+def supervised_task(task):
+    """Pool task wrapper: run func(args) and return (task id, worker pid, result).
+
+    A worker above the memory limit exits before starting the task instead,
+    and the supervisor hands the task to the replacement the pool starts. A
+    fresh worker always runs its first task, so a limit below what a worker
+    needs to start cannot stall the scan.
+    """
+    global _task_id, _tasks_done, _paths
+    task_id, func, args = task
+    rss = current_rss_mb() if _max_rss_mb and _tasks_done else None
+    if rss is not None and rss > _max_rss_mb:
+        logging.info(f"Worker {os.getpid()} uses {rss:.0f} MB, above the limit of {_max_rss_mb} MB; replacing it")
+        _progress.put((os.getpid(), task_id, None, time.time()))
+        os._exit(0)
+    _task_id = task_id
+    # Named before any file, so the supervisor notices if the worker dies early
+    _progress.put((os.getpid(), task_id, (), time.time()))
+    try:
+        return task_id, os.getpid(), func(args)
+    finally:
+        _task_id = _paths = None
+        _tasks_done += 1
+
+def deadline(reported, paths, timeout):
+    """When a worker that last reported progress on paths at reported is considered stuck.
+
+    The timeout applies per image: the OCR engine reports every page it
+    finishes, so a batch gets its whole timeout again after each image.
+    """
+    if not timeout or not paths:
+        return float("inf")
+    return reported + timeout + KILL_GRACE
+
+def kill_worker(pid):
+    try:
+        os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+    except OSError:
+        # Already gone
+        pass
@@ -0,0 +1,27 @@
+# Images with more pixels than this, and every multi-page image, are OCR'd
+# page by page and tile by tile instead of in one engine call
+TILE_MIN_PIXELS = 25_000_000
+TILE_SIZE = 4096
+# Neighbouring tiles share this many pixels: several lines of text, or a few
+# words, at scanning resolutions, so a phrase cut by one tile's edge is whole
+# in its neighbour
+TILE_OVERLAP = 512
+
+def needs_tiling(width, height, pages=1):
+    return pages > 1 or width * height > TILE_MIN_PIXELS
+
+def _starts(length, size, overlap):
+    if length <= size:
+        return [0]
+    starts = list(range(0, length - size, size - overlap))
+    # The last tile ends on the image edge, overlapping its neighbour by at least overlap
+    starts.append(length - size)
+    return starts
+
+def tile_boxes(width, height, size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """(x0, y0, x1, y1) boxes of at most size pixels a side covering an image in reading order.
+
+    Neighbouring boxes overlap by at least overlap pixels.
+    """
+    return [(x, y, min(x + size, width), min(y + size, height))
+            for y in _starts(height, size, overlap) for x in _starts(width, size, overlap)]
@@ -1,11 +1,163 @@
+import io
 import os
-import cv2
-import pytesseract
-import imagehash
-from PIL import Image
-from .config import IMAGE_EXTENSIONS, MIN_WIDTH, MIN_HEIGHT
+from collections import namedtuple
+from ._lazy import LazyModule
+from .archives import read_bytes
+from .config import IMAGE_EXTENSIONS, MAX_DECODE_BYTES, MAX_PIXELS, MIN_WIDTH, MIN_HEIGHT
+from .matcher import StreamingMatcher
+from .metrics import get_metrics
+from .ocr import OcrTimeout, get_engine
+from .preprocess import preprocess, preprocessing_enabled
+from .regions import find_text_regions, text_bands
+from .tiles import needs_tiling, tile_boxes
 import logging
 
+# Heavy dependencies are imported on first use so the CLI and workers start fast
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+pytesseract = LazyModule("pytesseract")
+imagehash = LazyModule("imagehash")
+
+def _raise_pixel_limit(module):
+    # PIL's decompression bomb limit, raised to the one load_image checks
+    module.MAX_IMAGE_PIXELS = MAX_PIXELS
+
+Image = LazyModule("PIL.Image", on_load=_raise_pixel_limit)
+
+# method: "edges" (edge density only), "regions" (edge density, then a count of
+# character-like edge components lined up with a neighbour) or "off"; max_side:
+# longest side of the preview the prefilter runs on; min_edge_fraction: share of
+# preview pixels that must be Canny edges; min_text_regions: components required
+# by the "regions" method
+PrefilterConfig = namedtuple("PrefilterConfig", ["method", "max_side", "min_edge_fraction", "min_text_regions"])
+PREFILTER_METHODS = ("edges", "regions", "off")
+DEFAULT_PREFILTER = PrefilterConfig("regions", 640, 0.002, 3)
+
+_prefilter = DEFAULT_PREFILTER
+_text_regions = False
+_locate = False
+
+def set_prefilter(config):
+    """Select the prefilter used by has_text_heuristic(); also called from the Pool initializer."""
+    global _prefilter
+    _prefilter = config or DEFAULT_PREFILTER
+
+def set_text_regions(enabled):
+    """Make ocr_text_batch() OCR only detected text regions by default; also called from the Pool initializer."""
+    global _text_regions
+    _text_regions = bool(enabled)
+
+def set_locate(enabled):
+    """Make scans find phrases with locate_phrases(); also called from the Pool initializer."""
+    global _locate
+    _locate = bool(enabled)
+
+def locating():
+    return _locate
+
+class ImageContext:
+    """An image read once and decoded at most once, shared by every stage of process_file."""
+
+    def __init__(self, path, data, image, loaded=True):
+        self.path = path
+        self.data = data
+        self._image = image
+        self._loaded = loaded
+        self._gray = None
+        self.pages = getattr(image, "n_frames", 1)
+        # Huge and multi-page images are OCR'd with ocr_text_tiled and only ever decoded as grayscale
+        self.tiled = needs_tiling(*image.size, self.pages)
+
+    @property
+    def image(self):
+        if not self._loaded:
+            if self.tiled:
+                self._image = self._decode_gray()
+            else:
+                self._image.load()
+            self._loaded = True
+        return self._image
+
+    def _decode_gray(self):
+        """The first page as grayscale, without holding on to a colour copy."""
+        img = self._image
+        if img.format == "JPEG":
+            # Decodes straight to one channel
+            img.draft("L", img.size)
+        img.load()
+        return img if img.mode == "L" else img.convert("L")
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            image = self.image
+            self._gray = np.asarray(image if image.mode == "L" else image.convert("L"))
+            if self.tiled:
+                # Keep one copy of the pixels: the image becomes a view of the array
+                info = image.info
+                self._image = Image.fromarray(self._gray)
+                self._image.info = info
+        return self._gray
+
+    def preview(self, max_side):
+        """Grayscale array scaled so its longer side is at most max_side, decoded as cheaply as possible."""
+        width, height = self._image.size
+        scale = max(width, height) / max_side
+        if scale <= 1:
+            return self.gray
+        if self._image.format == "JPEG" and not self._loaded:
+            # JPEG can decode straight to grayscale at 1/2, 1/4 or 1/8 scale
+            img = Image.open(io.BytesIO(self.data))
+            img.draft("L", (int(width / scale), int(height / scale)))
+            gray = np.asarray(img.convert("L"))
+        else:
+            gray = self.gray
+        return _downscale(gray, max_side)
+
+def _decode_bytes(img):
+    """Memory taken at its peak by decoding an opened image as grayscale, as ImageContext does."""
+    if img.mode == "L" or (img.format == "JPEG" and img.mode != "CMYK"):
+        # JPEG decodes straight to one channel
+        return img.width * img.height
+    # PIL keeps most modes at 4 bytes per pixel; the grayscale copy takes one more
+    pixel = 1 if img.mode in ("1", "P") else 2 if img.mode.startswith("I;16") else 4
+    return img.width * img.height * (pixel + 1)
+
+def _too_large(img):
+    return img.width * img.height > MAX_PIXELS or _decode_bytes(img) > MAX_DECODE_BYTES
+
+def _path_of(image):
+    return image.path if isinstance(image, ImageContext) else image
+
+def load_image(image_path, data=None, decode=True):
+    """Read (unless data is given), verify and decode an image once; return None if it should be skipped.
+
+    With decode=False the pixels are only decoded when first needed, so a cheap
+    preview can reject the image first.
+    """
+    ext = os.path.splitext(image_path)[1].lower()
+    if ext not in IMAGE_EXTENSIONS:
+        return None
+    try:
+        if data is None:
+            data = read_bytes(image_path)
+        Image.open(io.BytesIO(data)).verify()
+        img = Image.open(io.BytesIO(data))
+        # The size is known from the header, so small images are never decoded
+        if img.width < MIN_WIDTH or img.height < MIN_HEIGHT:
+            return None
+        if _too_large(img):
+            logging.warning(f"Skipping {image_path}: {img.width}x{img.height} {img.mode} pixels would not fit in "
+                            f"the memory limits")
+            get_metrics().skip(image_path, "too large")
+            return None
+        image = ImageContext(image_path, data, img, loaded=False)
+        if decode:
+            image.image
+    except Exception:
+        return None
+    return image
+
 def is_valid_image(file_path):
     ext = os.path.splitext(file_path)[1].lower()
     if ext not in IMAGE_EXTENSIONS:
@@ -20,27 +172,282 @@ def is_valid_image(file_path):
             return False
     return True
 
-def has_text_heuristic(image_path, edge_thresh=0.02):
+def _downscale(gray, max_side):
+    height, width = gray.shape[:2]
+    scale = max(width, height) / max_side
+    if scale <= 1:
+        return gray
+    size = (max(1, round(width / scale)), max(1, round(height / scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+def count_text_regions(gray, edges=None, max_components=1500):
+    """Number of character-sized edge components that sit next to a similar one on the same line."""
+    if edges is None:
+        edges = cv2.Canny(gray, 100, 200)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(edges, connectivity=8)
+    x, y, w, h = (stats[1:, i] for i in range(4))
+    keep = (h >= 4) & (h <= gray.shape[0] * 0.3) & (w <= h * 5)
+    x, y, w, h = (a[keep][:max_components].astype(np.float32) for a in (x, y, w, h))
+    middle = y + h / 2
+    same_line = np.abs(middle[:, None] - middle[None, :]) < 0.3 * h[:, None]
+    similar = (h[None, :] > h[:, None] * 0.6) & (h[None, :] < h[:, None] / 0.6)
+    gap = x[None, :] - (x + w)[:, None]
+    neighbours = same_line & similar & (gap >= -1) & (gap < h[:, None])
+    np.fill_diagonal(neighbours, False)
+    return int(np.count_nonzero(neighbours.any(axis=1)))
+
+def _preview_has_text(img, config):
+    edges = cv2.Canny(img, 100, 200)
+    edge_fraction = np.count_nonzero(edges) / edges.size
+    if edge_fraction <= config.min_edge_fraction:
+        return False
+    if config.method == "regions":
+        return count_text_regions(img, edges) >= config.min_text_regions
+    return True
+
+def has_text_heuristic(image, edge_thresh=None, config=None):
+    """Cheap check whether an image may contain text, run on a downscaled grayscale preview.
+
+    edge_thresh is the fraction of preview pixels that must be edges, which
+    makes the decision independent of the image resolution.
+    """
+    config = config or _prefilter
+    if edge_thresh is not None:
+        config = config._replace(min_edge_fraction=edge_thresh)
+    if config.method == "off":
+        return True
+    if isinstance(image, ImageContext) and image.pages > 1:
+        # Text may start on any page; ocr_text_tiled checks each page before OCR'ing it
+        return True
     try:
-        img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        if img is None:
-            return False
-        edges = cv2.Canny(img, 100, 200)
-        edge_density = edges.sum() / (edges.shape[0] * edges.shape[1])
-        return edge_density > edge_thresh
+        if isinstance(image, ImageContext):
+            img = image.preview(config.max_side)
+        else:
+            img = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                return False
+            img = _downscale(img, config.max_side)
+        return _preview_has_text(img, config)
     except Exception as e:
-        logging.error((f"Text heuristic failed for {image_path}: {e}"))
+        logging.error((f"Text heuristic failed for {_path_of(image)}: {e}"))
         return False
 
-def compute_perceptual_hash(image_path):
-    with Image.open(image_path) as img:
+def compute_perceptual_hash(image):
+    if isinstance(image, ImageContext):
+        # phash converts to grayscale itself, so reuse the array we already have
+        return imagehash.phash(Image.fromarray(image.gray))
+    with Image.open(image) as img:
         return imagehash.phash(img)
 
-def contains_phrase(image_path, phrase):
+def contains_phrase(image, phrase, engine=None):
+    image_path = _path_of(image)
     try:
-        text = pytesseract.image_to_string(Image.open(image_path))
-        logging.debug(f"OCR text for {image_path}: {text[:100]}...")
+        img = image.image if isinstance(image, ImageContext) else Image.open(image_path)
+        text = (engine or get_engine()).image_to_string(img)
+        # Lazy formatting: OCR text can be long and debug logging is usually off
+        logging.debug("OCR text for %s: %.100s...", image_path, text)
         return phrase.lower() in text.lower()
     except Exception as e:
         logging.error((f"OCR failed for {image_path}: {e}"))
         return False
+
+def ocr_text(image, engine=None):
+    """OCR one image; returns None (not "") when OCR fails, so failures are never cached."""
+    image_path = _path_of(image)
+    try:
+        img = _ocr_input(image) if isinstance(image, ImageContext) else Image.open(image_path)
+        text = (engine or get_engine()).image_to_string(img)
+        logging.debug("OCR text for %s: %.100s...", image_path, text)
+        return text
+    except Exception as e:
+        _ocr_failed(image_path, e)
+        return None
+
+def _ocr_input(image, box=None):
+    """What the engine sees: the decoded image, or its preprocessed grayscale array."""
+    if not preprocessing_enabled():
+        return image.image if box is None else image.image.crop(box)
+    gray = image.gray
+    if box is not None:
+        x0, y0, x1, y1 = box
+        gray = gray[y0:y1, x0:x1]
+    dpi = image.image.info.get("dpi")
+    return preprocess(gray, dpi=dpi[0] if dpi else None)
+
+def _ocr_regions(images, engine):
+    # One engine call per page segmentation mode: line crops, block crops and whole images
+    jobs = {}
+    parts = []
+    for index, image in enumerate(images):
+        regions = find_text_regions(image.gray)
+        if not regions:
+            # Nothing found, or the text covers most of the image
+            crops = [(None, _ocr_input(image))]
+        else:
+            crops = [(region.psm, _ocr_input(image, region.box)) for region in regions]
+        parts.append([""] * len(crops))
+        for slot, (psm, crop) in enumerate(crops):
+            jobs.setdefault(psm, []).append((index, slot, crop))
+    for psm, group in jobs.items():
+        texts = engine.images_to_strings([crop for _, _, crop in group], psm)
+        for (index, slot, _), text in zip(group, texts):
+            parts[index][slot] = text.strip()
+    # Crops are in reading order, so the text reads like a full-page OCR
+    return ["\n".join(part) for part in parts]
+
+def _chunks(image):
+    """(box, page segmentation mode) of the parts of an image to OCR one by one, in reading order."""
+    regions = find_text_regions(image.gray)
+    if regions:
+        return [(region.box, region.psm) for region in regions]
+    # A dense page, or nothing that looks like text: bands between text lines
+    return [(box, None) for box in text_bands(image.gray)]
+
+def _chunk_words(image, chunks, engine):
+    """(crop, words) of each chunk in order.
+
+    An engine that starts a tesseract process per call gets every crop in one
+    call per page segmentation mode; any other OCRs a chunk only when the
+    caller asks for it, so the caller can stop early.
+    """
+    if not engine.starts_process:
+        for box, psm in chunks:
+            crop = _ocr_input(image, box)
+            yield crop, engine.image_to_data(crop, psm)
+        return
+    crops = [_ocr_input(image, box) for box, _ in chunks]
+    words = [None] * len(chunks)
+    groups = {}
+    for index, (_, psm) in enumerate(chunks):
+        groups.setdefault(psm, []).append(index)
+    for psm, indexes in groups.items():
+        for index, found in zip(indexes, engine.images_to_data([crops[index] for index in indexes], psm)):
+            words[index] = found
+    yield from zip(crops, words)
+
+def locate_phrases(image, phrases, engine=None):
+    """OCR an image part by part in reading order, stopping once every phrase is found.
+
+    The parts are the detected text regions or, on dense pages, horizontal
+    bands cut between text lines, and each is OCR'd into words with their
+    boxes. Phrases match across line breaks and words hyphenated at a line
+    end. Engines that start a tesseract process per call OCR all the parts at
+    once instead, so they never stop early. Returns (found, text, complete):
+    found maps each phrase found to its (x0, y0, x1, y1) box in image pixels,
+    text is the text OCR'd so far (None when OCR failed) and complete is False
+    when OCR stopped early.
+    """
+    engine = engine or get_engine()
+    stream = StreamingMatcher(phrases)
+    lines = {}
+    try:
+        chunks = _chunks(image)
+        ocr_results = _chunk_words(image, chunks, engine)
+        for index, ((x0, y0, x1, y1), _) in enumerate(chunks):
+            crop, words = next(ocr_results)
+            # Preprocessing may have rescaled the crop
+            width = crop.shape[1] if isinstance(crop, np.ndarray) else crop.width
+            scale = (x1 - x0) / width
+            for word in words:
+                line = (index, word.line)
+                lines.setdefault(line, []).append(word.text)
+                box = tuple(round(value * scale) for value in word.box)
+                stream.feed(word.text, (box[0] + x0, box[1] + y0, box[2] + x0, box[3] + y0), line)
+            if stream.done and index < len(chunks) - 1 and not engine.starts_process:
+                logging.debug(f"All phrases found in {image.path} after {index + 1} of {len(chunks)} parts")
+                return stream.found, _joined(lines), False
+    except Exception as e:
+        _ocr_failed(image.path, e)
+        return {}, None, False
+    return stream.found, _joined(lines), True
+
+def _joined(lines):
+    return "\n".join(" ".join(words) for words in lines.values())
+
+def _iter_pages(image):
+    """Each page of an image as a grayscale array, decoding one page at a time."""
+    yield image.gray
+    if image.pages == 1:
+        return
+    with Image.open(io.BytesIO(image.data)) as img:
+        for index in range(1, image.pages):
+            img.seek(index)
+            if _too_large(img):
+                logging.warning(f"Skipping page {index + 1} of {image.path}: {img.width}x{img.height} pixels")
+                get_metrics().skip(image.path, f"page {index + 1} too large")
+                continue
+            yield np.asarray(img.convert("L"))
+
+def ocr_text_tiled(image, matcher=None, engine=None):
+    """OCR a huge or multi-page image page by page, in overlapping tiles, one engine call per tile.
+
+    Pages the prefilter rejects are skipped. With a matcher, OCR stops as soon
+    as the text so far contains all of its phrases. Returns (text, complete),
+    text being None when OCR failed and complete False when it stopped early.
+    """
+    engine = engine or get_engine()
+    dpi = image.image.info.get("dpi")
+    parts = []
+    try:
+        for page in _iter_pages(image):
+            if image.pages > 1 and _prefilter.method != "off":
+                if not _preview_has_text(_downscale(page, _prefilter.max_side), _prefilter):
+                    continue
+            height, width = page.shape
+            for x0, y0, x1, y1 in tile_boxes(width, height):
+                tile = page[y0:y1, x0:x1]
+                if preprocessing_enabled():
+                    tile = preprocess(tile, dpi=dpi[0] if dpi else None)
+                parts.append(engine.image_to_string(tile).strip())
+                if matcher is not None and len(matcher.find("\n".join(parts))) == len(matcher.phrases):
+                    return "\n".join(parts), False
+            # Drop the page before decoding the next one
+            del page
+    except Exception as e:
+        _ocr_failed(image.path, e)
+        return None, False
+    text = "\n".join(parts)
+    logging.debug("OCR text for %s: %.100s...", image.path, text)
+    return text, True
+
+def _ocr_failed(path, error):
+    """Log an OCR failure and record the file as skipped in this process's metrics."""
+    logging.error((f"OCR failed for {path}: {error}"))
+    get_metrics().skip(path, "timeout" if isinstance(error, OcrTimeout) else "ocr failed")
+
+def ocr_text_batch(images, engine=None, text_regions=None):
+    """Like ocr_text for several decoded images, using one engine call.
+
+    With text_regions (default: the value given to set_text_regions) only the
+    detected text regions are OCR'd; images without any are OCR'd whole.
+    """
+    if not images:
+        return []
+    text_regions = _text_regions if text_regions is None else text_regions
+    try:
+        engine = engine or get_engine()
+        if text_regions:
+            return _ocr_regions(images, engine)
+        return engine.images_to_strings([_ocr_input(image) for image in images])
+    except Exception as e:
+        done = getattr(e, "done", None) if not text_regions else None
+        if done is not None and len(done) < len(images):
+            # The engine names the image it was stuck on: skip it, OCR the rest
+            _ocr_failed(images[len(done)].path, e)
+            return done + [None] + ocr_text_batch(images[len(done) + 1:], engine, text_regions)
+        if len(images) > 1:
+            # Find the image that failed, so the others still get their text
+            logging.debug(f"OCR of a batch of {len(images)} images failed, retrying one by one: {e}")
+            return [ocr_text_batch([image], engine, text_regions)[0] for image in images]
+        _ocr_failed(images[0].path, e)
+        return [None]
+
+def find_phrases(image, matcher, engine=None):
+    """OCR an image once and return every phrase of the matcher found in it."""
+    text = ocr_text(image, engine)
+    return matcher.find(text) if text is not None else []
+
+def find_phrases_batch(images, matcher, engine=None):
+    """Like find_phrases for several decoded images, using one engine call."""
+    return [matcher.find(text) if text is not None else []
+            for text in ocr_text_batch(images, engine)]
@@ -0,0 +1,259 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+from multiprocessing import Pool, cpu_count
+from .cache import DEFAULT_MAX_BYTES
+from .config import IMAGE_EXTENSIONS
+from .dedupe import NearDuplicates
+from .discovery import iter_image_files
+from .scanner import (BATCH_SIZE, PENDING_TASKS_PER_WORKER, _as_phrases, _batched, _init_worker,
+                      _worker_initargs, process_files)
+
+DEFAULT_POLL_INTERVAL = 2.0
+# The polling watcher only sees new and renamed files through directory mtimes,
+# so every so often it also re-stats every known file to catch in-place edits
+FULL_RESCAN_INTERVAL = 300.0
+
+def _is_image(path):
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+class PollingWatcher:
+    """Find new and changed images by polling directory mtimes.
+
+    A file is only reported once its size and mtime stayed the same for one
+    poll, so files that are still being copied are not picked up half-written.
+    """
+
+    def __init__(self, folder, interval=DEFAULT_POLL_INTERVAL, full_rescan_interval=FULL_RESCAN_INTERVAL):
+        self.folder = folder
+        self.interval = interval
+        self.full_rescan_interval = full_rescan_interval
+        self._dirs = {}
+        self._files = {}
+        self._pending = {}
+        self._last_full_scan = time.monotonic()
+        self._scan_dir(folder, baseline=True)
+
+    def _stamp(self, path):
+        st = os.stat(path)
+        return (st.st_size, st.st_mtime_ns)
+
+    def _scan_dir(self, path, baseline=False):
+        try:
+            self._dirs[path] = os.stat(path).st_mtime_ns
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.path not in self._dirs:
+                            self._scan_dir(entry.path, baseline)
+                    elif _is_image(entry.name):
+                        self._check_file(entry.path, baseline)
+        except OSError:
+            self._dirs.pop(path, None)
+
+    def _check_file(self, path, baseline=False):
+        try:
+            stamp = self._stamp(path)
+        except OSError:
+            self._files.pop(path, None)
+            return
+        if baseline:
+            self._files[path] = stamp
+        elif self._files.get(path) != stamp and path not in self._pending:
+            self._pending[path] = stamp
+
+    def poll(self, timeout=None):
+        """Wait up to one interval (or timeout) and return the set of settled new/changed image paths."""
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        ready = set()
+        for path, stamp in list(self._pending.items()):
+            try:
+                current = self._stamp(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            if current == stamp:
+                ready.add(path)
+                self._files[path] = stamp
+                del self._pending[path]
+            else:
+                self._pending[path] = current
+
+        full_scan = time.monotonic() - self._last_full_scan >= self.full_rescan_interval
+        if full_scan:
+            self._last_full_scan = time.monotonic()
+            for path in list(self._files):
+                self._check_file(path)
+        for path, mtime_ns in list(self._dirs.items()):
+            try:
+                changed = os.stat(path).st_mtime_ns != mtime_ns
+            except OSError:
+                # Directory removed: forget it and everything below it
+                prefix = os.path.join(path, "")
+                self._dirs = {d: m for d, m in self._dirs.items() if d != path and not d.startswith(prefix)}
+                self._files = {f: s for f, s in self._files.items() if not f.startswith(prefix)}
+                continue
+            if changed:
+                self._scan_dir(path)
+        return ready
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """Find new and changed images with Linux inotify (close-after-write and move-in events)."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    _EVENT = struct.Struct("iIII")
+    _MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, folder):
+        self.folder = folder
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._paths = {}
+        self._watch_tree(folder)
+
+    def _watch_tree(self, folder):
+        """Watch folder and its subdirectories; returns images already present in them."""
+        found = set()
+        pending = [folder]
+        while pending:
+            path = pending.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self._MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    raise OSError(err, "inotify watch limit reached (fs.inotify.max_user_watches)")
+                continue
+            self._paths[wd] = path
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif _is_image(entry.name):
+                            found.add(entry.path)
+            except OSError:
+                continue
+        return found
+
+    def poll(self, timeout=None):
+        """Wait up to timeout seconds for events and return the set of new/changed image paths."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                buf = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, length = self._EVENT.unpack_from(buf, offset)
+                offset += self._EVENT.size
+                name = os.fsdecode(buf[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    logging.warning("inotify queue overflowed, rescanning the whole folder")
+                    changed.update(iter_image_files(self.folder, progress_interval=0))
+                    continue
+                parent = self._paths.get(wd)
+                if parent is None or not name:
+                    continue
+                path = os.path.join(parent, name)
+                if mask & self.IN_ISDIR:
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        # Files may have landed before the watch was added
+                        changed.update(self._watch_tree(path))
+                elif mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO) and _is_image(name):
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+def open_watcher(folder, poll_interval=DEFAULT_POLL_INTERVAL, use_inotify=True):
+    """Use inotify where available, polling otherwise."""
+    if use_inotify and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folder)
+        except (OSError, AttributeError) as e:
+            logging.warning(f"inotify unavailable ({e}), falling back to polling every {poll_interval}s")
+    return PollingWatcher(folder, poll_interval)
+
+def watch_images_for_phrases(folder, phrases, on_match, ocr_engine="auto", cache_dir=None,
+                             cache_max_bytes=DEFAULT_MAX_BYTES, poll_interval=DEFAULT_POLL_INTERVAL,
+                             initial_scan=True, use_inotify=True, stop_event=None, prefilter=None,
+                             text_regions=False, preprocess=None, dedupe_distance=0, timeout=None,
+                             max_tasks_per_worker=None, locate=False):
+    """Scan folder, then keep a warm pool and scan new or changed images until stop_event is set.
+
+    on_match(image_path, matched_phrases) is called as soon as a match comes back. The
+    perceptual-hash dedupe (within dedupe_distance bits) lives for the whole session.
+    Workers are not supervised: timeout only bounds each tesseract process.
+    """
+    phrases = _as_phrases(phrases)
+    stop_event = stop_event or threading.Event()
+    duplicates = NearDuplicates(dedupe_distance)
+    lock = threading.Lock()
+
+    processes = cpu_count()
+    # Bound the work queued in the pool, mainly for the initial scan of a large folder
+    slots = threading.Semaphore(processes * PENDING_TASKS_PER_WORKER)
+
+    def handle(results):
+        # Runs on the pool's result thread
+        slots.release()
+        for match in results:
+            with lock:
+                if duplicates.add(match.path, match.phash) != match.path:
+                    continue
+            on_match(match.path, match.phrases)
+
+    def failed(error):
+        slots.release()
+        logging.error(f"Processing failed: {error}")
+
+    def submit(pool, image_paths):
+        for batch in _batched(image_paths, BATCH_SIZE):
+            slots.acquire()
+            pool.apply_async(process_files, ((batch, phrases),), callback=handle, error_callback=failed)
+
+    initargs = _worker_initargs(ocr_engine, cache_dir, cache_max_bytes, prefilter, text_regions, preprocess,
+                                processes, timeout, locate)
+    # Start watching before the initial scan so nothing landing in between is missed
+    watcher = open_watcher(folder, poll_interval, use_inotify)
+    try:
+        with Pool(processes=processes, initializer=_init_worker, initargs=initargs,
+                  maxtasksperchild=max_tasks_per_worker) as pool:
+            if initial_scan:
+                submit(pool, iter_image_files(folder))
+            logging.info(f"Watching '{folder}' for new images with {type(watcher).__name__} (Ctrl+C to stop)")
+            while not stop_event.is_set():
+                changed = watcher.poll(timeout=poll_interval)
+                if changed:
+                    logging.debug(f"{len(changed)} new or changed images")
+                    submit(pool, sorted(changed))
+            # Stopped on request: let queued work finish and report
+            pool.close()
+            pool.join()
+    finally:
+        watcher.close()
@@ -0,0 +1,85 @@
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+from scan_image import archives
+
+class TestArchives(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.members = {"a.png": b"aaaa", "scans/b.JPG": b"bb", "notes.txt": b"text"}
+        self.zip_path = os.path.join(self.root, "bundle.zip")
+        with zipfile.ZipFile(self.zip_path, "w") as archive:
+            archive.writestr("scans/", b"")
+            for name, data in self.members.items():
+                archive.writestr(name, data)
+        self.tar_path = os.path.join(self.root, "bundle.tar.gz")
+        with tarfile.open(self.tar_path, "w:gz") as archive:
+            for name, data in self.members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_is_archive(self):
+        for name in ("a.zip", "A.ZIP", "b.tar", "c.tar.gz", "d.tgz", "e.tar.xz"):
+            self.assertTrue(archives.is_archive(name), name)
+        for name in ("a.png", "b.gz", "zip"):
+            self.assertFalse(archives.is_archive(name), name)
+
+    def test_split_member_path(self):
+        self.assertEqual(archives.split_member_path("/f/a.zip!/x/y.png"), ("/f/a.zip", "x/y.png"))
+        # "!/" only separates a member after an archive name
+        self.assertEqual(archives.split_member_path("/f/wow!/a.tar!/y.png"), ("/f/wow!/a.tar", "y.png"))
+        self.assertIsNone(archives.split_member_path("/f/wow!/y.png"))
+        self.assertIsNone(archives.split_member_path("/f/y.png"))
+
+    def test_iter_members(self):
+        for path in (self.zip_path, self.tar_path):
+            expected = [(f"{path}!/a.png", b"aaaa"), (f"{path}!/scans/b.JPG", b"bb")]
+            self.assertEqual(list(archives.iter_members(path)), expected)
+
+    def test_member_sizes(self):
+        for path in (self.zip_path, self.tar_path):
+            self.assertEqual(list(archives.member_sizes(path)), [(f"{path}!/a.png", 4), (f"{path}!/scans/b.JPG", 2)])
+
+    def test_read_bytes(self):
+        for path in (self.zip_path, self.tar_path):
+            self.assertEqual(archives.read_bytes(f"{path}!/scans/b.JPG"), b"bb")
+            with self.assertRaises(FileNotFoundError):
+                archives.read_bytes(f"{path}!/missing.png")
+        plain = os.path.join(self.root, "plain.png")
+        with open(plain, "wb") as f:
+            f.write(b"plain")
+        self.assertEqual(archives.read_bytes(plain), b"plain")
+        self.assertEqual(archives.stat_path(f"{self.zip_path}!/a.png").st_size, os.path.getsize(self.zip_path))
+
+    def test_read_tar_members(self):
+        paths = [f"{self.tar_path}!/scans/b.JPG", f"{self.zip_path}!/a.png", "/f/c.png"]
+        with patch("scan_image.archives.read_member") as mock_read:
+            items = list(archives.read_tar_members(paths))
+        # Zip members and files pass through; the tar is read once, for its wanted members only
+        self.assertEqual(items, [f"{self.zip_path}!/a.png", "/f/c.png", (f"{self.tar_path}!/scans/b.JPG", b"bb")])
+        mock_read.assert_not_called()
+
+    @patch("scan_image.archives.logging")
+    def test_damaged_archive_warns(self, mock_logging):
+        broken = os.path.join(self.root, "broken.zip")
+        with open(broken, "wb") as f:
+            f.write(b"not a zip")
+        self.assertEqual(list(archives.iter_members(broken)), [])
+        self.assertEqual(list(archives.member_sizes(broken)), [])
+        self.assertEqual(mock_logging.warning.call_count, 2)
+        with self.assertRaises(OSError):
+            archives.read_member(f"{broken}!/a.png")
+
+
+if __name__ == "__main__":
+    unittest.main()
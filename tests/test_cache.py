@@ -0,0 +1,74 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+from scan_image import cache
+
+class TestOcrCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def open(self, fingerprint="fp1", max_bytes=cache.DEFAULT_MAX_BYTES):
+        db = cache.OcrCache(self.tmp.name, fingerprint, max_bytes)
+        self.addCleanup(db.close)
+        return db
+
+    def test_roundtrip_and_fast_path(self):
+        db = self.open()
+        key = cache.content_key(b"image bytes")
+        entry = cache.CacheEntry(True, True, "ffee", "some text")
+        db.put(key, entry)
+        db.link_path("/a.png", 11, 123, key)
+
+        self.assertEqual(db.get(key), entry)
+        self.assertEqual(db.lookup_path("/a.png", 11, 123), key)
+        self.assertIsNone(db.lookup_path("/a.png", 11, 456), "changed mtime must miss")
+        self.assertIsNone(db.lookup_path("/b.png", 11, 123))
+
+    def test_content_key_is_shared_by_identical_files(self):
+        self.assertEqual(cache.content_key(b"same"), cache.content_key(b"same"))
+        self.assertNotEqual(cache.content_key(b"same"), cache.content_key(b"other"))
+
+    def test_persists_across_opens(self):
+        self.open().put("k", cache.CacheEntry(True, False, None, None))
+        self.assertEqual(self.open().get("k"), cache.CacheEntry(True, False, None, None))
+
+    @patch("scan_image.cache.logging")
+    def test_fingerprint_change_clears(self, mock_logging):
+        db = self.open("tesseract 5.3")
+        db.put("k", cache.CacheEntry(True, True, "ab", "text"))
+        db.link_path("/a.png", 1, 1, "k")
+        db.close()
+
+        db = self.open("tesseract 5.4")
+        self.assertIsNone(db.get("k"))
+        self.assertIsNone(db.lookup_path("/a.png", 1, 1))
+        mock_logging.info.assert_called_once()
+
+    def test_evicts_least_recently_used(self):
+        db = self.open(max_bytes=1000)
+        for i in range(10):
+            db.put(f"k{i}", cache.CacheEntry(True, True, "ab", "x" * 200))
+            db.link_path(f"/{i}.png", 1, 1, f"k{i}")
+        db.get("k0")  # recently used, must survive
+
+        self.assertGreater(db.evict(), 0)
+        self.assertLessEqual(db.total_size(), 1000)
+        self.assertIsNotNone(db.get("k0"))
+        self.assertIsNone(db.get("k1"))
+        self.assertIsNone(db.lookup_path("/1.png", 1, 1), "paths of evicted entries are dropped")
+
+    def test_make_fingerprint(self):
+        self.assertEqual(cache.make_fingerprint("5.4.0", engine="batch"),
+                         cache.make_fingerprint("5.4.0", engine="batch"))
+        self.assertNotEqual(cache.make_fingerprint("5.4.0", engine="batch"),
+                            cache.make_fingerprint("5.5.0", engine="batch"))
+
+    def test_open_cache_disabled_without_dir(self):
+        self.assertIsNone(cache.open_cache(None, "fp"))
+        self.assertIsNone(cache.get_cache())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import random
+import argparse
+import unittest
+from scan_image import dedupe
+
+def flip(phash, bits):
+    value = int(phash, 16)
+    for bit in bits:
+        value ^= 1 << bit
+    return f"{value:016x}"
+
+class TestHammingIndex(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        rng = random.Random(3)
+        stored = [f"{rng.getrandbits(64):016x}" for _ in range(2000)]
+        index = dedupe.HammingIndex(max_distance=6)
+        for i, phash in enumerate(stored):
+            index.add(phash, i)
+        queries = [flip(stored[rng.randrange(len(stored))], rng.sample(range(64), rng.randint(0, 9)))
+                   for _ in range(300)]
+        for query in queries:
+            distances = {i: bin(int(phash, 16) ^ int(query, 16)).count("1") for i, phash in enumerate(stored)}
+            nearest = min(distances.values())
+            found = index.find(query)
+            if nearest <= 6:
+                self.assertEqual(distances[found], nearest, query)
+            else:
+                self.assertIsNone(found, query)
+
+    def test_empty_index(self):
+        self.assertIsNone(dedupe.HammingIndex(4).find("ffffffffffffffff"))
+
+
+class TestNearDuplicates(unittest.TestCase):
+
+    def test_groups_under_first_seen(self):
+        base = "c3a5e0f01e0f3c78"
+        items = [("a.png", base), ("b.png", flip(base, [1, 40])), ("c.png", "0000000000000000"),
+                 ("d.png", flip(base, [2, 3, 4, 5, 6, 7, 8, 9, 10]))]
+        self.assertEqual(dedupe.group_near_duplicates(items, max_distance=4),
+                         {"a.png": ["b.png"], "c.png": [], "d.png": []})
+        # Distance 0 keeps the exact behaviour
+        self.assertEqual(dedupe.group_near_duplicates(items + [("e.png", base)]),
+                         {"a.png": ["e.png"], "b.png": [], "c.png": [], "d.png": []})
+
+    def test_add_returns_representative(self):
+        duplicates = dedupe.NearDuplicates(2)
+        self.assertEqual(duplicates.add("a.png", "00000000000000ff"), "a.png")
+        self.assertEqual(duplicates.add("b.png", "00000000000000fe"), "a.png")
+        self.assertEqual(duplicates.add("c.png", None), "c.png")
+
+    def test_readded_path_is_not_its_own_duplicate(self):
+        for distance in (0, 2):
+            duplicates = dedupe.NearDuplicates(distance)
+            duplicates.add("a.png", "00000000000000ff")
+            self.assertEqual(duplicates.add("a.png", "00000000000000ff"), "a.png")
+            self.assertEqual(duplicates.groups, {"a.png": []}, distance)
+
+    def test_distance_range(self):
+        for distance in (-1, dedupe.MAX_DISTANCE + 1, 2.5, True):
+            with self.assertRaises(ValueError):
+                dedupe.NearDuplicates(distance)
+        self.assertEqual(dedupe.distance_arg("12"), 12)
+        for value in ("-1", "24", "x"):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                dedupe.distance_arg(value)
+
+
+if __name__ == "__main__":
+    unittest.main()
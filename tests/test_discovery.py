@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+from scan_image import discovery
+
+class TestIterImageFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        os.makedirs(os.path.join(self.root, "sub", "deeper"))
+        for name in ["a.png", "b.JPG", "notes.txt", "sub/c.tiff", "sub/deeper/d.bmp", "sub/deeper/e.gif"]:
+            with open(os.path.join(self.root, name), "w") as f:
+                f.write("x")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch("scan_image.discovery.logging")
+    def test_yields_only_images_recursively(self, mock_logging):
+        found = sorted(os.path.relpath(p, self.root) for p in discovery.iter_image_files(self.root))
+        expected = sorted(["a.png", "b.JPG", os.path.join("sub", "c.tiff"),
+                           os.path.join("sub", "deeper", "d.bmp")])
+        self.assertEqual(found, expected)
+
+    @patch("scan_image.discovery.logging")
+    def test_is_lazy_and_reports_running_total(self, mock_logging):
+        """Files are yielded before the walk finishes and progress is logged."""
+        files = discovery.iter_image_files(self.root, progress_interval=2)
+        next(files)
+        mock_logging.info.assert_not_called()
+        list(files)
+        messages = [c.args[0] for c in mock_logging.info.call_args_list]
+        self.assertIn("Found 2 image files so far...", messages)
+        self.assertEqual(messages[-1], "Discovery complete: found 4 image files")
+
+    @patch("scan_image.discovery.logging")
+    def test_missing_folder_warns(self, mock_logging):
+        self.assertEqual(list(discovery.iter_image_files(os.path.join(self.root, "missing"))), [])
+        mock_logging.warning.assert_called_once()
+
+    @patch("scan_image.discovery.logging")
+    def test_sizes(self, mock_logging):
+        with open(os.path.join(self.root, "a.png"), "w") as f:
+            f.write("x" * 10)
+        sizes = {os.path.relpath(p, self.root): size for p, size in discovery.iter_image_sizes(self.root)}
+        self.assertEqual(sizes["a.png"], 10)
+        self.assertEqual(sizes[os.path.join("sub", "c.tiff")], 1)
+        self.assertEqual(len(sizes), 4)
+
+    @patch("scan_image.discovery.logging")
+    def test_archives(self, mock_logging):
+        archive_path = os.path.join(self.root, "sub", "bundle.zip")
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            archive.writestr("inner/x.png", b"xx")
+            archive.writestr("readme.txt", b"text")
+        # Off by default: the archive is not an image
+        self.assertNotIn(archive_path, list(discovery.iter_image_files(self.root)))
+        found = list(discovery.iter_image_files(self.root, archives=True))
+        self.assertIn((f"{archive_path}!/inner/x.png", b"xx"), found)
+        self.assertEqual(len(found), 5)
+        sizes = dict(discovery.iter_image_sizes(self.root, archives=True))
+        self.assertEqual(sizes[f"{archive_path}!/inner/x.png"], 2)
+        self.assertEqual([discovery.item_path(item) for item in found if isinstance(item, tuple)],
+                         [f"{archive_path}!/inner/x.png"])
+
+
+class TestShards(unittest.TestCase):
+
+    def test_shards_partition_paths(self):
+        root = os.path.join("data", "scans")
+        paths = [os.path.join(root, "batch", f"{i}.png") for i in range(2000)]
+        shards = [list(discovery.filter_shard(paths, root, (index, 4))) for index in range(4)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(paths))
+        # Roughly even split
+        self.assertTrue(all(400 < len(shard) < 600 for shard in shards), [len(shard) for shard in shards])
+        self.assertEqual(list(discovery.filter_shard(paths, root, None)), paths)
+        sized = [(path, 1) for path in paths]
+        self.assertEqual(list(discovery.filter_shard(sized, root, (1, 4), key=lambda item: item[0])),
+                         [(path, 1) for path in shards[1]])
+
+    def test_shard_is_stable(self):
+        # Fixed across runs, machines and path separators
+        self.assertEqual(discovery.shard_of("sub/a.png", 1000), discovery.shard_of(os.path.join("sub", "a.png"), 1000))
+        self.assertEqual([discovery.shard_of(f"{i}.png", 7) for i in range(8)], [4, 1, 1, 3, 2, 3, 1, 6])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from scan_image import index
+from scan_image.cache import CacheEntry
+
+class FakePool:
+    """Runs pool work inline so index building can be tested without worker processes."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def imap_unordered(self, func, iterable):
+        return map(func, iterable)
+
+class TestTextIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.index = index.TextIndex(os.path.join(self.tmp.name, "index.sqlite3"))
+        self.addCleanup(self.index.close)
+        self.index.add("/img/a.png", 1, 1, "aaaa", True, "Invoice TOTAL: 42\nPaid")
+        self.index.add("/img/b.png", 1, 1, "bbbb", True, "Say \"hi\" to the world")
+        self.index.add("/img/copy_of_a.png", 1, 1, "aaaa", True, "Invoice TOTAL: 42\nPaid")
+        self.index.add("/img/blank.png", 1, 1, None, False, None)
+        self.index.commit()
+
+    def test_substring_case_insensitive(self):
+        self.assertEqual(self.index.query(["total: 4"]), {"/img/a.png": ["total: 4"]})
+        self.assertEqual(self.index.query(["VOICE"]), {"/img/a.png": ["VOICE"]})
+        self.assertEqual(self.index.query(["missing"]), {})
+
+    def test_short_phrases_and_quotes(self):
+        self.assertEqual(self.index.query(['"hi"']), {"/img/b.png": ['"hi"']})
+        self.assertEqual(set(self.index.query(["hi"])), {"/img/b.png"})
+
+    def test_multiple_phrases_and_duplicates(self):
+        found = self.index.query(["paid", "world"])
+        self.assertEqual(found, {"/img/a.png": ["paid"], "/img/b.png": ["world"]})
+        found = self.index.query(["paid"], report_duplicates=True)
+        self.assertEqual(set(found), {"/img/a.png", "/img/copy_of_a.png"})
+
+    def test_remove_and_stamps(self):
+        self.index.remove("/img/b.png")
+        self.assertEqual(self.index.query(["world"]), {})
+        self.assertEqual(set(self.index.stamps("/img")), {"/img/a.png", "/img/copy_of_a.png", "/img/blank.png"})
+        self.assertEqual(self.index.stamps("/im"), {})
+
+    @patch("scan_image.index.logging")
+    def test_fingerprint_change_clears(self, mock_logging):
+        self.assertFalse(self.index.check_fingerprint("fp1"))
+        self.assertFalse(self.index.check_fingerprint("fp1"))
+        self.assertTrue(self.index.check_fingerprint("fp2"))
+        self.assertEqual(self.index.query(["paid"]), {})
+
+
+@patch("scan_image.scanner.tesseract_version", return_value="5.4.0")
+@patch("scan_image.index.Pool", FakePool)
+class TestBuildIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.folder = os.path.join(self.tmp.name, "images")
+        os.makedirs(self.folder)
+        self.db = os.path.join(self.tmp.name, "index.sqlite3")
+        for name in ("a.png", "b.png"):
+            self.touch(name)
+
+    def touch(self, name):
+        with open(os.path.join(self.folder, name), "w") as f:
+            f.write(name)
+
+    def fake_extract(self, image_paths):
+        self.extracted.extend(image_paths)
+        return [(p, 1, 1, CacheEntry(True, True, os.path.basename(p), "text")) for p in image_paths]
+
+    def test_first_build_indexes_everything(self, mock_version):
+        self.extracted = []
+        with patch("scan_image.index.extract_texts", self.fake_extract):
+            self.assertEqual(index.build_index(self.folder, self.db), (2, 0, 0))
+        self.assertEqual(len(self.extracted), 2)
+
+    def test_unchanged_files_are_skipped_and_deleted_files_removed(self, mock_version):
+        with patch("scan_image.index.extract_texts", side_effect=lambda paths: [
+                (p, os.stat(p).st_size, os.stat(p).st_mtime_ns, CacheEntry(True, True, p, "text")) for p in paths]):
+            index.build_index(self.folder, self.db)
+            os.remove(os.path.join(self.folder, "b.png"))
+            self.touch("c.png")
+            self.assertEqual(index.build_index(self.folder, self.db), (1, 1, 1))
+
+        db = index.TextIndex(self.db)
+        self.addCleanup(db.close)
+        self.assertEqual(sorted(os.path.basename(p) for p in db.stamps(os.path.abspath(self.folder))),
+                         ["a.png", "c.png"])
+
+    def test_failed_ocr_is_retried(self, mock_version):
+        with patch("scan_image.index.extract_texts", side_effect=lambda paths: [
+                (p, os.stat(p).st_size, os.stat(p).st_mtime_ns, CacheEntry(True, True, p, None)) for p in paths]):
+            self.assertEqual(index.build_index(self.folder, self.db), (0, 0, 0))
+
+
+class TestQueryCli(unittest.TestCase):
+
+    @patch("scan_image.index.setup_logging")
+    @patch("scan_image.index.logging")
+    def test_query_main(self, mock_logging, mock_setup):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "index.sqlite3")
+            db = index.TextIndex(db_path)
+            db.add("/img/a.png", 1, 1, "aaaa", True, "hello world")
+            db.commit()
+            db.close()
+            index.query_main(["hello", "--db", db_path])
+        self.assertIn("/img/a.png", mock_logging.success.call_args[0][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,6 +8,7 @@ class TestLogger(unittest.TestCase):
     def test_success_level(self):
         """Custom SUCCESS level should log correctly."""
         log = logging.getLogger("test_success")
+        log.setLevel(logging.DEBUG)  # don't depend on whoever configured the root logger
         with patch.object(log, "_log") as mock_log:
             log.success("Test success message")
             mock_log.assert_called_once()
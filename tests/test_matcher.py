@@ -0,0 +1,62 @@
+import os
+import random
+import tempfile
+import unittest
+from scan_image import matcher
+
+class TestPhraseMatcher(unittest.TestCase):
+
+    def test_finds_all_phrases_case_insensitively(self):
+        m = matcher.PhraseMatcher(["he", "she", "his", "HERS", "missing"])
+        self.assertEqual(m.find("uSHErs"), ["he", "she", "HERS"])
+        self.assertEqual(m.find("nothing at all"), [])
+
+    def test_overlapping_and_nested_phrases(self):
+        m = matcher.PhraseMatcher(["invoice total", "total", "voice"])
+        self.assertEqual(m.find("INVOICE TOTAL: 42"), ["invoice total", "total", "voice"])
+
+    def test_duplicates_dropped(self):
+        m = matcher.PhraseMatcher(["a", "b", "a"])
+        self.assertEqual(m.phrases, ("a", "b"))
+
+    def test_agrees_with_substring_check(self):
+        """Same semantics as contains_phrase's lower-cased `in` check."""
+        rng = random.Random(0)
+        phrases = ["".join(rng.choice("abAB ") for _ in range(rng.randint(1, 4))) for _ in range(30)]
+        m = matcher.PhraseMatcher(phrases)
+        for _ in range(200):
+            text = "".join(rng.choice("abcAB \n") for _ in range(40))
+            expected = [p for p in m.phrases if p.lower() in text.lower()]
+            self.assertEqual(m.find(text), expected)
+
+    def test_streaming_matcher_spans_lines_and_hyphens(self):
+        m = matcher.StreamingMatcher(["Hello World", "example text", "well-known", "missing"])
+        words = [("Say", (0, 0, 10, 5), 1), ("HELLO", (12, 0, 30, 5), 1), ("world", (0, 10, 20, 15), 2),
+                 ("exam-", (7, 20, 30, 25), 2), ("ple", (0, 30, 10, 35), 3), ("text", (12, 30, 30, 35), 3),
+                 ("well-", (0, 40, 10, 45), 3), ("known", (0, 50, 10, 55), 4)]
+        for word, box, line in words:
+            self.assertFalse(m.feed(word, box, line))
+        self.assertEqual(m.found, {"Hello World": (0, 0, 30, 15), "example text": (0, 20, 30, 35),
+                                   "well-known": (0, 40, 10, 55)})
+        self.assertTrue(m.feed("missing", (0, 60, 10, 65), 5))
+
+    def test_streaming_matcher_keeps_hyphens_within_a_line(self):
+        m = matcher.StreamingMatcher(["example"])
+        m.feed("exam-", line=1)
+        m.feed("ple", line=1)
+        self.assertEqual(m.found, {})
+        self.assertTrue(matcher.StreamingMatcher(["invoice total"]).feed_text("Invoice\n  TOTAL: 42"))
+
+    def test_get_matcher_is_cached(self):
+        self.assertIs(matcher.get_matcher(("x", "y")), matcher.get_matcher(("x", "y")))
+
+    def test_read_phrases_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "phrases.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("first phrase\n\n  second  \n")
+            self.assertEqual(matcher.read_phrases_file(path), ["first phrase", "second"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from scan_image import merge
+
+def record(path, phash, phrases=("hello",)):
+    return {"path": path, "phash": phash, "phrases": list(phrases), "timings_ms": {}}
+
+class TestMerge(unittest.TestCase):
+
+    def test_dedupes_across_shards(self):
+        shard0 = [record("/n1/b.png", "ff00000000000000"), record("/n1/x.png", None)]
+        shard1 = [record("/n2/a.png", "ff00000000000001"), record("/n2/c.png", "00000000000000ff")]
+        merged = merge.merge_results(shard1 + shard0, dedupe_distance=2)
+        self.assertEqual([(r["path"], r["duplicates"]) for r in merged],
+                         [("/n1/b.png", ["/n2/a.png"]), ("/n1/x.png", []), ("/n2/c.png", [])])
+        merged = merge.merge_results(shard1 + shard0, dedupe_distance=0)
+        self.assertEqual(len(merged), 4)
+
+    def test_keeps_duplicates_found_within_a_shard(self):
+        shard0 = [record("/n1/b.png", "ff00000000000000"), {"path": "/n1/b-copy.png", "duplicate_of": "/n1/b.png"}]
+        shard1 = [record("/n2/a.png", "ff00000000000001"), {"path": "/n2/a-copy.png", "duplicate_of": "/n2/a.png"}]
+        merged = merge.merge_results(shard1 + shard0 + shard0, dedupe_distance=2)
+        self.assertEqual([(r["path"], r["duplicates"]) for r in merged],
+                         [("/n1/b.png", ["/n2/a.png", "/n1/b-copy.png", "/n2/a-copy.png"])])
+
+    def test_same_path_twice(self):
+        merged = merge.merge_results([record("/a.png", "ff", ["hello"]), record("/a.png", "ff", ["hello", "bye"])])
+        self.assertEqual(merged, [dict(record("/a.png", "ff", ["hello", "bye"]), duplicates=[])])
+
+    @patch("scan_image.merge.setup_logging")
+    @patch("scan_image.merge.logging")
+    def test_merge_main(self, mock_logging, mock_setup):
+        with tempfile.TemporaryDirectory() as tmp:
+            inputs = []
+            for index, lines in enumerate([[record("/b.png", "00ff")], [record("/a.png", "00ff")]]):
+                path = os.path.join(tmp, f"shard{index}.jsonl")
+                with open(path, "w") as f:
+                    f.writelines(json.dumps(line) + "\n" for line in lines)
+                    # A shard that died mid-write
+                    f.write('{"path": "/c.p')
+                inputs.append(path)
+            out_path = os.path.join(tmp, "merged.jsonl")
+            merge.merge_main(inputs + ["--output-file", out_path])
+            with open(out_path) as f:
+                merged = [json.loads(line) for line in f]
+
+        self.assertEqual([(r["path"], r["duplicates"]) for r in merged], [("/a.png", ["/b.png"])])
+        self.assertEqual(mock_logging.warning.call_count, 2)
+
+if __name__ == "__main__":
+    unittest.main()
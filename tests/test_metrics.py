@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+from scan_image import metrics
+from scan_image.metrics import Metrics
+
+class TestMetrics(unittest.TestCase):
+
+    def test_merge_snapshots(self):
+        worker = Metrics()
+        worker.count("files_seen", 3)
+        worker.add_time("ocr", 1.5)
+        worker.add_time("read", 0.25, calls=3)
+        total = Metrics()
+        total.merge(worker.snapshot())
+        total.merge(worker.snapshot())
+
+        snapshot = total.snapshot()
+        self.assertEqual(snapshot["counters"]["files_seen"], 6)
+        self.assertEqual(snapshot["counters"]["ocr_calls"], 0)
+        # Stages come out in pipeline order
+        self.assertEqual(snapshot["stages"], {"read": {"calls": 6, "seconds": 0.5},
+                                              "ocr": {"calls": 2, "seconds": 3.0}})
+
+    def test_skipped_files_are_merged(self):
+        worker = Metrics()
+        worker.skip("/f/a.png", "timeout")
+        total = Metrics()
+        total.skip("/f/b.png", "ocr failed")
+        total.merge(json.loads(json.dumps(worker.snapshot())))
+        self.assertEqual(total.skipped, [("/f/b.png", "ocr failed"), ("/f/a.png", "timeout")])
+        # Snapshots of older workers have no skipped files
+        total.merge({"counters": {}, "stages": {}})
+        self.assertEqual(len(total.skipped), 2)
+
+    def test_collect_starts_afresh(self):
+        metrics.get_metrics().count("cache_hits")
+        self.assertEqual(metrics.collect_metrics().counters["cache_hits"], 1)
+        self.assertEqual(metrics.get_metrics().counters["cache_hits"], 0)
+
+    def test_outputs(self):
+        m = Metrics()
+        m.count("ocr_images", 4)
+        with m.timer("hash"):
+            pass
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path, prom_path = os.path.join(tmp, "m.json"), os.path.join(tmp, "m.prom")
+            m.write_json(json_path, seconds=2.0)
+            m.write_prometheus(prom_path, workers=2)
+            with open(json_path) as f:
+                data = json.load(f)
+            with open(prom_path) as f:
+                text = f.read()
+            # No temporary file left behind
+            self.assertEqual(sorted(os.listdir(tmp)), ["m.json", "m.prom"])
+        self.assertEqual(data["seconds"], 2.0)
+        self.assertEqual(data["counters"]["ocr_images"], 4)
+        self.assertEqual(data["stages"]["hash"]["calls"], 1)
+        self.assertIn("# TYPE scan_image_ocr_images_total counter\nscan_image_ocr_images_total 4\n", text)
+        self.assertIn('scan_image_stage_calls_total{stage="hash"} 1\n', text)
+        self.assertIn("scan_image_workers 2\n", text)
+
+    def test_profiled_dumps_stats(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            profile_dir = os.path.join(tmp, "profiles")
+            try:
+                with metrics.profiled(profile_dir):
+                    sum(range(1000))
+            finally:
+                metrics._profiler = None
+            self.assertEqual(os.listdir(profile_dir), [f"worker-{os.getpid()}.prof"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import os
+import time
+import unittest
+from unittest.mock import patch
+import numpy as np
+from PIL import Image
+from scan_image import ocr
+
+class FakeTesseract:
+    """Stands in for subprocess.Popen: a process that writes output, then exits or, with hang, waits to be killed."""
+
+    def __init__(self, output, hang=False, returncode=0):
+        self.output = output
+        self.hang = hang
+        self.returncode = None
+        self._exit_code = returncode
+        self.calls = []
+        self.killed = False
+
+    def __call__(self, command, stdout, stderr):
+        self.calls.append(command)
+        read, self._write = os.pipe()
+        os.write(self._write, self.output)
+        if not self.hang:
+            self._close()
+        self.stdout = os.fdopen(read, "rb")
+        return self
+
+    def _close(self):
+        if self._write is not None:
+            os.close(self._write)
+            self._write = None
+
+    def kill(self):
+        self.killed = True
+        self._exit_code = -9
+        self._close()
+
+    def wait(self):
+        self.returncode = self._exit_code
+        return self.returncode
+
+class TestEngines(unittest.TestCase):
+
+    def setUp(self):
+        ocr._instances.clear()
+
+    def tearDown(self):
+        ocr._instances.clear()
+        ocr.set_default_engine("auto")
+
+    @patch("scan_image.ocr.pytesseract.image_to_string", return_value="text")
+    def test_subprocess_engine(self, mock_ocr):
+        img = Image.new("L", (60, 60))
+        self.assertEqual(ocr.get_engine("subprocess").images_to_strings([img, img]), ["text", "text"])
+        self.assertEqual(mock_ocr.call_count, 2)
+
+    def test_batch_engine_uses_one_process(self):
+        """Pages come back separated by form feeds, one per listed image."""
+        tesseract = FakeTesseract(b"first\n\fsecond\n\fthird\n\f")
+        img = Image.new("L", (60, 60))
+
+        with patch("scan_image.ocr.subprocess.Popen", tesseract):
+            texts = ocr.BatchEngine().images_to_strings([img, img, img])
+
+        self.assertEqual(texts, ["first\n", "second\n", "third\n"])
+        self.assertEqual(len(tesseract.calls), 1)
+        self.assertEqual(tesseract.calls[0][-1], "stdout")
+
+    @patch("scan_image.ocr.pytesseract.image_to_string")
+    def test_batch_engine_pages_separated_between(self, mock_ocr):
+        """Some tesseract versions write form feeds only between pages."""
+        img = Image.new("L", (60, 60))
+
+        with patch("scan_image.ocr.subprocess.Popen", FakeTesseract(b"first\n\fsecond\n\f")):
+            self.assertEqual(ocr.BatchEngine().images_to_strings([img, img, img]), ["first\n", "second\n", ""])
+        with patch("scan_image.ocr.subprocess.Popen", FakeTesseract(b"first\fsecond")):
+            self.assertEqual(ocr.BatchEngine().images_to_strings([img, img]), ["first", "second"])
+        mock_ocr.assert_not_called()
+
+    @patch("scan_image.ocr.pytesseract.image_to_string", return_value="line")
+    def test_page_segmentation_mode(self, mock_ocr):
+        tesseract = FakeTesseract(b"a\fb\f")
+        img = Image.new("L", (60, 60))
+
+        with patch("scan_image.ocr.subprocess.Popen", tesseract):
+            ocr.BatchEngine().images_to_strings([img, np.zeros((60, 60), dtype=np.uint8)], psm=7)
+        self.assertEqual(tesseract.calls[0][-2:], ["--psm", "7"])
+        ocr.SubprocessEngine().image_to_string(img, psm=7)
+        mock_ocr.assert_called_once_with(img, config="--psm 7")
+
+    @patch("scan_image.ocr.pytesseract.image_to_string", return_value="single")
+    def test_batch_engine_falls_back_on_page_mismatch(self, mock_ocr):
+        img = Image.new("L", (60, 60))
+
+        with patch("scan_image.ocr.subprocess.Popen", FakeTesseract(b"only one page\f")):
+            self.assertEqual(ocr.BatchEngine().images_to_strings([img] * 3), ["single"] * 3)
+        self.assertEqual(mock_ocr.call_count, 3)
+        # A failing tesseract is retried one image at a time too
+        with patch("scan_image.ocr.subprocess.Popen", FakeTesseract(b"", returncode=1)):
+            self.assertEqual(ocr.BatchEngine().images_to_strings([img, img]), ["single", "single"])
+
+    @patch("scan_image.ocr.pytesseract.image_to_string", side_effect=RuntimeError("Tesseract process timeout"))
+    def test_timeout(self, mock_ocr):
+        img = Image.new("L", (60, 60))
+        try:
+            ocr.set_timeout(0.3)
+            with self.assertRaises(ocr.OcrTimeout):
+                ocr.SubprocessEngine().image_to_string(img)
+            mock_ocr.assert_called_once_with(img, timeout=0.3)
+
+            # The timeout is per image: it restarts with every page tesseract writes
+            tesseract = FakeTesseract(b"first\fsecond\f", hang=True)
+            start = time.monotonic()
+            with patch("scan_image.ocr.subprocess.Popen", tesseract):
+                with self.assertRaises(ocr.OcrTimeout) as raised:
+                    ocr.BatchEngine().images_to_strings([img] * 8)
+            self.assertLess(time.monotonic() - start, 2)
+            self.assertTrue(tesseract.killed)
+            # The third image hung; the first two keep their text and are not OCR'd again
+            self.assertEqual(raised.exception.done, ["first", "second"])
+            self.assertEqual(mock_ocr.call_count, 1)
+            # Written between pages, the separator comes before the next page
+            with patch("scan_image.ocr.subprocess.Popen", FakeTesseract(b"first\fsecond", hang=True)):
+                with self.assertRaises(ocr.OcrTimeout) as raised:
+                    ocr.BatchEngine().images_to_strings([img] * 8)
+            self.assertEqual(raised.exception.done, ["first", "second"])
+            with patch("scan_image.ocr.subprocess.Popen", FakeTesseract(b"", hang=True)):
+                with self.assertRaises(ocr.OcrTimeout) as raised:
+                    ocr.BatchEngine().images_to_strings([img] * 8)
+            self.assertEqual(raised.exception.done, [])
+
+            tsv = (b"level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n"
+                   b"1\t1\t0\t0\t0\t0\t0\t0\t60\t60\t-1\t\n"
+                   b"5\t1\t1\t1\t1\t1\t10\t20\t80\t30\t96\tHello\n")
+            with patch("scan_image.ocr.subprocess.Popen", FakeTesseract(tsv, hang=True)):
+                with self.assertRaises(ocr.OcrTimeout) as raised:
+                    ocr.BatchEngine().images_to_data([img] * 3)
+            self.assertEqual(raised.exception.done, [[ocr.Word("Hello", (10, 20, 90, 50), (1, 1, 1))]])
+        finally:
+            ocr.set_timeout(None)
+
+    @patch("scan_image.ocr.pytesseract.image_to_data")
+    def test_image_to_data(self, mock_data):
+        mock_data.return_value = ("level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\t"
+                                  "conf\ttext\n"
+                                  "4\t1\t1\t1\t1\t0\t10\t20\t200\t30\t-1\t\n"
+                                  "5\t1\t1\t1\t1\t1\t10\t20\t80\t30\t96.5\tHello\n"
+                                  "5\t1\t1\t1\t1\t2\t95\t20\t40\t30\t91\t \n"
+                                  "5\t1\t2\t1\t1\t1\t10\t90\t70\t30\t88\tworld\n")
+        img = Image.new("L", (60, 60))
+
+        words = ocr.SubprocessEngine().image_to_data(img, psm=6)
+
+        self.assertEqual(words, [ocr.Word("Hello", (10, 20, 90, 50), (1, 1, 1)),
+                                 ocr.Word("world", (10, 90, 80, 120), (2, 1, 1))])
+        mock_data.assert_called_once_with(img, config="--psm 6")
+
+    def test_batch_engine_words_of_many_images(self):
+        """TSV rows name the page, i.e. the listed image, they belong to."""
+        tesseract = FakeTesseract(b"level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\t"
+                                                 b"top\twidth\theight\tconf\ttext\n"
+                                                 b"5\t1\t1\t1\t1\t1\t10\t20\t80\t30\t96\tHello\n"
+                                                 b"1\t2\t0\t0\t0\t0\t0\t0\t60\t60\t-1\t\n"
+                                                 b"5\t3\t1\t1\t1\t1\t5\t5\t40\t30\t90\tworld\n")
+        img = Image.new("L", (60, 60))
+
+        with patch("scan_image.ocr.subprocess.Popen", tesseract):
+            words = ocr.BatchEngine().images_to_data([img, img, img], psm=7)
+
+        self.assertEqual(words, [[ocr.Word("Hello", (10, 20, 90, 50), (1, 1, 1))], [],
+                                 [ocr.Word("world", (5, 5, 45, 35), (1, 1, 1))]])
+        self.assertEqual(len(tesseract.calls), 1)
+        self.assertEqual(tesseract.calls[0][-3:], ["--psm", "7", "tsv"])
+
+    @patch("scan_image.ocr.TesserocrEngine", side_effect=ImportError("no tesserocr"))
+    def test_auto_falls_back_to_batch(self, mock_tesserocr):
+        self.assertIsInstance(ocr.get_engine("auto"), ocr.BatchEngine)
+
+    def test_engine_is_created_once_per_process(self):
+        ocr.set_default_engine("subprocess")
+        self.assertIs(ocr.get_engine(), ocr.get_engine("subprocess"))
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            ocr.set_default_engine("nope")
+        with self.assertRaises(ValueError):
+            ocr.get_engine("nope")
+
+
+if __name__ == "__main__":
+    unittest.main()
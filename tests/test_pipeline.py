@@ -0,0 +1,139 @@
+import io
+import os
+import tarfile
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from scan_image import pipeline
+from scan_image.metrics import Metrics
+
+class TestLargestFirst(unittest.TestCase):
+
+    @patch("scan_image.pipeline.iter_image_sizes")
+    def test_sorted_by_size(self, mock_sizes):
+        mock_sizes.return_value = iter([("/f/a.png", 10), ("/f/b.png", 300), ("/f/c.png", 20)])
+        self.assertEqual(pipeline.largest_first("/f"), [("/f/b.png", 300), ("/f/c.png", 20), ("/f/a.png", 10)])
+
+    @patch("scan_image.pipeline.iter_image_sizes")
+    def test_shard(self, mock_sizes):
+        files = [(f"/f/{i}.png", i) for i in range(8)]
+        mock_sizes.side_effect = lambda folder, archives=False: iter(files)
+        # Shards of "0.png" .. "7.png" out of 7 are [4, 1, 1, 3, 2, 3, 1, 6]
+        self.assertEqual(pipeline.largest_first("/f", (1, 7)), [("/f/6.png", 6), ("/f/2.png", 2), ("/f/1.png", 1)])
+
+    @patch("scan_image.pipeline.iter_image_sizes")
+    def test_shards_tar_members_when_read(self, mock_sizes):
+        files = [("/f/0.png", 0), ("/f/a.tar.gz", 50), ("/f/6.png", 6)]
+        mock_sizes.side_effect = lambda folder, archives=False: iter(files)
+        # The tar keeps its place by size; its members are sharded by read_batches
+        self.assertEqual(pipeline.largest_first("/f", (1, 7), archives=True), [("/f/a.tar.gz", 50), ("/f/6.png", 6)])
+
+class TestReadBatches(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tar_path = os.path.join(self.tmp.name, "scans.tar.gz")
+        # Smallest member first, so a size order would differ from archive order
+        self.members = [(f"{i}.png", b"x" * (i + 1)) for i in range(6)]
+        with tarfile.open(self.tar_path, "w:gz") as archive:
+            for name, data in self.members:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_tar_members_read_in_one_pass_in_archive_order(self):
+        files = [("/f/big.png", 100), (self.tar_path, 50), ("/f/small.png", 1)]
+        with patch("scan_image.archives.read_member") as mock_read, \
+                patch("scan_image.pipeline.read_bytes", side_effect=lambda path: path.encode()):
+            batches = list(pipeline.prefetched(pipeline.read_batches(files, 4, max_bytes=100), threads=2))
+        expected = [(f"{self.tar_path}!/{name}", data) for name, data in self.members]
+        self.assertEqual(batches, [[("/f/big.png", b"/f/big.png")], expected[:4], expected[4:],
+                                   [("/f/small.png", b"/f/small.png")]])
+        mock_read.assert_not_called()
+
+    def test_shards_tar_members(self):
+        folder = self.tmp.name
+        names = lambda shard: [path for batch in pipeline.read_batches([(self.tar_path, 50)], 8, folder, shard)
+                               for path, _ in batch]
+        shards = [names((index, 3)) for index in range(3)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(names(None)))
+        self.assertEqual(len(names(None)), 6)
+
+class TestCostBatches(unittest.TestCase):
+
+    def test_splits_on_count_and_bytes(self):
+        files = [("big", 90), ("mid", 40), ("b", 30), ("c", 10), ("d", 5), ("e", 5), ("f", 5)]
+        batches = list(pipeline.cost_batches(files, 3, max_bytes=100))
+        # A file above the budget goes alone; the rest fill up to 3 files or 100 bytes
+        self.assertEqual(batches, [["big"], ["mid", "b", "c"], ["d", "e", "f"]])
+
+    def test_empty(self):
+        self.assertEqual(list(pipeline.cost_batches([], 8)), [])
+
+class TestPrefetched(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i in range(5):
+            path = os.path.join(self.tmp.name, f"{i}.png")
+            with open(path, "wb") as f:
+                f.write(b"x" * (i + 1))
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_reads_batches_in_order(self):
+        missing = os.path.join(self.tmp.name, "missing.png")
+        batches = [self.paths[:2], self.paths[2:], [missing]]
+        metrics = Metrics()
+        result = list(pipeline.prefetched(iter(batches), threads=2, ahead=1, metrics=metrics))
+        self.assertEqual(result, [[(path, b"x" * (i + 1)) for i, path in enumerate(self.paths[:2])],
+                                  [(path, b"x" * (i + 3)) for i, path in enumerate(self.paths[2:])],
+                                  # Left for the worker to fail on and report
+                                  [(missing, None)]])
+        self.assertEqual(metrics.counters["bytes_read"], 15)
+        self.assertEqual(metrics.snapshot()["stages"]["prefetch"]["calls"], 6)
+
+    def test_reads_at_most_ahead_batches_in_advance(self):
+        pulled = []
+        def batches():
+            for path in self.paths:
+                pulled.append(path)
+                yield [path]
+
+        reader = pipeline.prefetched(batches(), threads=2, ahead=2)
+        self.assertEqual(next(reader), [(self.paths[0], b"x")])
+        # The one yielded plus two read ahead
+        self.assertEqual(len(pulled), 3)
+        reader.close()
+        self.assertEqual(len(pulled), 3)
+
+    def test_close_cancels_pending_reads(self):
+        release = threading.Event()
+        calls = []
+        def read(path):
+            calls.append(path)
+            if len(calls) > 1:
+                release.wait(5)
+            return b"", 0.0
+
+        with patch("scan_image.pipeline._read", side_effect=read):
+            reader = pipeline.prefetched(iter([[path] for path in self.paths]), threads=1, ahead=3)
+            next(reader)
+            # Let the read in progress finish while the reader shuts down
+            timer = threading.Timer(0.1, release.set)
+            timer.start()
+            reader.close()
+            timer.join()
+        # Four batches were submitted, but the single thread got to two at most
+        self.assertLessEqual(len(calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
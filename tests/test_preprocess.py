@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from scan_image import preprocess
+
+def text_image(font_size, size=(800, 300), background=255, ink=0):
+    img = Image.new("L", size, color=background)
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=font_size)
+    for i in range(3):
+        draw.text((10, 10 + i * font_size * 1.5), "scan these words now", fill=ink, font=font)
+    return np.asarray(img)
+
+class TestPreprocess(unittest.TestCase):
+
+    def tearDown(self):
+        preprocess.set_preprocess(None)
+
+    def test_estimate_x_height_scales_with_font(self):
+        small = preprocess.estimate_x_height(text_image(16))
+        large = preprocess.estimate_x_height(text_image(48, size=(1600, 600)))
+        self.assertAlmostEqual(large / small, 3, delta=0.5)
+        self.assertIsNone(preprocess.estimate_x_height(np.full((200, 200), 255, dtype=np.uint8)))
+
+    def test_estimate_handles_light_text_on_dark(self):
+        dark = preprocess.estimate_x_height(text_image(24, background=20, ink=230))
+        light = preprocess.estimate_x_height(text_image(24))
+        self.assertAlmostEqual(dark, light, delta=2)
+
+    def test_x_height_scaling(self):
+        config = preprocess.DEFAULT_PREPROCESS._replace(scale="x-height", x_height=20)
+        for font_size in (12, 60):
+            out = preprocess.preprocess(text_image(font_size, size=(1000, 400)), config)
+            self.assertAlmostEqual(preprocess.estimate_x_height(out), 20, delta=3)
+
+    def test_scaling_is_capped(self):
+        config = preprocess.DEFAULT_PREPROCESS._replace(scale="dpi", dpi=300, max_side=1000)
+        out = preprocess.preprocess(text_image(16), config, dpi=72)
+        self.assertEqual(max(out.shape), 1000)
+        # Unknown DPI leaves the size alone
+        self.assertEqual(preprocess.preprocess(text_image(16), config).shape, (300, 800))
+
+    def test_binarize(self):
+        gray = text_image(24)
+        gray = (gray * 0.3 + np.linspace(60, 120, gray.shape[1])).astype(np.uint8)
+        for mode in ("otsu", "adaptive"):
+            out = preprocess.preprocess(gray, preprocess.DEFAULT_PREPROCESS._replace(binarize=mode))
+            self.assertEqual(set(np.unique(out)), {0, 255}, mode)
+
+    def test_disabled_by_default(self):
+        self.assertFalse(preprocess.preprocessing_enabled())
+        preprocess.set_preprocess(preprocess.DEFAULT_PREPROCESS._replace(binarize="otsu"))
+        self.assertTrue(preprocess.preprocessing_enabled())
+
+
+if __name__ == "__main__":
+    unittest.main()
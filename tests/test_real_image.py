@@ -1,5 +1,7 @@
 import os
+import tempfile
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 from unittest.mock import patch
 from scan_image import utils, scanner
 from PIL import Image, ImageDraw
@@ -8,7 +10,17 @@ import shutil  # for checking system executables
 class TestIntegrationOCR(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.test_dir = os.path.dirname(__file__)
+        # Robust check for Tesseract: either env var or system PATH
+        cls.tesseract_path = os.getenv("TESSERACT_PATH") or shutil.which("tesseract")
+        if not cls.tesseract_path:
+            raise unittest.SkipTest(
+                "Tesseract not installed or not found in PATH — skipping full scan test"
+            )
+        # Optionally set environment variable for code that uses TESSERACT_PATH
+        os.environ["TESSERACT_PATH"] = cls.tesseract_path
+
+        # Scanned folder holding only the fixtures below, removed in tearDownClass
+        cls.test_dir = tempfile.mkdtemp()
         cls.sample_image_name = "sample_ocr_test.png"
         cls.sample_image_path = os.path.join(cls.test_dir, cls.sample_image_name)
 
@@ -28,22 +40,9 @@ class TestIntegrationOCR(unittest.TestCase):
         with open(cls.text_file_path, "w") as f:
             f.write("HELLO_TEST")
 
-        # Robust check for Tesseract: either env var or system PATH
-        cls.tesseract_path = os.getenv("TESSERACT_PATH") or shutil.which("tesseract")
-        if not cls.tesseract_path:
-            raise unittest.SkipTest(
-                "Tesseract not installed or not found in PATH — skipping full scan test"
-            )
-        # Optionally set environment variable for code that uses TESSERACT_PATH
-        os.environ["TESSERACT_PATH"] = cls.tesseract_path
-
     @classmethod
     def tearDownClass(cls):
-        for path in [cls.sample_image_path, cls.small_image_path, cls.text_file_path]:
-            try:
-                os.remove(path)
-            except OSError:
-                pass
+        shutil.rmtree(cls.test_dir, ignore_errors=True)
 
     @patch("scan_image.scanner.logging")
     def test_scan_finds_correct_images(self, mock_logging):
@@ -88,3 +87,13 @@ class TestIntegrationOCR(unittest.TestCase):
         # Scan for a phrase that doesn't exist
         found = scanner.scan_images_for_phrase(self.test_dir, "NON_EXISTENT_PHRASE")
         self.assertEqual(found, [], "No images should be found for a phrase that doesn't exist")
+
+    @patch("scan_image.scanner.logging")
+    def test_iter_matches_on_shared_executor(self, mock_logging):
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            first = list(scanner.iter_matches(self.test_dir, ["HELLO_TEST"], limit=1, executor=executor))
+            # The executor's workers are reused for a second scan with other settings
+            again = list(scanner.iter_matches(self.test_dir, ["HELLO_TEST"], executor=executor, prefilter=None,
+                                              text_regions=True))
+        self.assertEqual([match.path for match in first], [self.sample_image_path])
+        self.assertIn(self.sample_image_path, [match.path for match in again])
@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from scan_image import regions
+
+def draw_lines(size, lines):
+    img = Image.new("L", size, color=255)
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=20)
+    for xy, text in lines:
+        draw.text(xy, text, fill=0, font=font)
+    return np.asarray(img)
+
+class TestFindTextRegions(unittest.TestCase):
+
+    def test_sparse_text_is_cropped_in_reading_order(self):
+        gray = draw_lines((1200, 900), [((700, 800), "second line here"), ((40, 40), "first line")])
+        found = regions.find_text_regions(gray)
+        self.assertEqual(len(found), 2)
+        first, second = found
+        self.assertLess(first.box[1], second.box[1])
+        text_box = ImageDraw.Draw(Image.new("L", (1, 1))).textbbox((40, 40), "first line",
+                                                                    font=ImageFont.load_default(size=20))
+        x0, y0, x1, y1 = first.box
+        self.assertTrue(x0 <= text_box[0] and y0 <= text_box[1] and x1 >= text_box[2] and y1 >= text_box[3],
+                        (first.box, text_box))
+        self.assertEqual(first.psm, regions.PSM_SINGLE_LINE)
+        covered = sum((r.box[2] - r.box[0]) * (r.box[3] - r.box[1]) for r in found)
+        self.assertLess(covered, 0.1 * gray.size)
+
+    def test_paragraph_is_one_block(self):
+        gray = draw_lines((800, 600), [((40, 40 + 26 * i), "some words on a line") for i in range(4)])
+        found = regions.find_text_regions(gray)
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found[0].psm, regions.PSM_SINGLE_BLOCK)
+
+    def test_blank_image_has_no_regions(self):
+        self.assertEqual(regions.find_text_regions(np.full((400, 600), 255, dtype=np.uint8)), [])
+
+    def test_dense_image_falls_back_to_full_ocr(self):
+        gray = draw_lines((400, 300), [((5, 5 + 22 * i), "dense text " * 4) for i in range(13)])
+        self.assertIsNone(regions.find_text_regions(gray))
+
+    def test_merge_joins_overlapping_boxes(self):
+        merged = regions._merge([[0, 0, 10, 10, 5], [200, 0, 210, 10, 5], [5, 5, 20, 20, 8]])
+        self.assertEqual(sorted(merged), [[0, 0, 20, 20, 8], [200, 0, 210, 10, 5]])
+
+
+class TestTextBands(unittest.TestCase):
+
+    def test_bands_are_cut_between_lines(self):
+        gray = draw_lines((300, 1300), [((5, 5 + 25 * i), "dense text " * 3) for i in range(50)])
+        bands = regions.text_bands(gray)
+        self.assertEqual(len(bands), 6)
+        self.assertEqual((bands[0][1], bands[-1][3]), (0, 1300))
+        for (_, _, _, bottom), (_, top, _, _) in zip(bands, bands[1:]):
+            self.assertEqual(bottom, top)
+            # The cut row has no ink
+            self.assertTrue((gray[top] == 255).all(), top)
+
+    def test_small_or_inked_image_is_one_band(self):
+        self.assertEqual(regions.text_bands(np.full((300, 200), 255, dtype=np.uint8)), [(0, 0, 200, 300)])
+        noise = np.random.default_rng(0).integers(0, 256, (1300, 200), dtype=np.uint8)
+        self.assertEqual(regions.text_bands(noise), [(0, 0, 200, 1300)])
+
+
+if __name__ == "__main__":
+    unittest.main()
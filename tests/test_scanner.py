@@ -1,28 +1,153 @@
+import io
 import os
 import sys
+import json
+import shutil
+import signal
+import tempfile
+import time
+import subprocess
+import tarfile
 import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool, SimpleQueue
+from PIL import Image
 from unittest.mock import patch, MagicMock, call
-from scan_image import scanner as main
-from scan_image.scanner import scan_images_for_phrase
+from scan_image import archives, scanner as main
+from scan_image.scanner import Match, scan_images_for_phrase
+from scan_image.cache import OcrCache
+from scan_image.metrics import Metrics
+from scan_image.supervisor import init_worker as init_supervision, report_progress
+from scan_image.utils import DEFAULT_PREFILTER
+
+def _stall_on_stuck(args):
+    """Pool function for the supervision test: hangs on files named "stuck"."""
+    files, together = args
+    if together:
+        report_progress(files)
+    done = []
+    for path in files:
+        if not together:
+            report_progress([path])
+        if "stuck" in path:
+            time.sleep(60)
+        done.append(path)
+    return done
+
+def _die_on_crash(args):
+    """Pool function for the supervision test: the worker is killed on files named "crash"."""
+    files, together = args
+    if together:
+        report_progress(files)
+    for path in files:
+        if not together:
+            report_progress([path])
+        if "crash" in path:
+            os.kill(os.getpid(), signal.SIGKILL)
+    return files
 
 class TestMain(unittest.TestCase):
 
+    def setUp(self):
+        # main() probes Tesseract and configures logging; keep tests independent of both
+        for name in ("setup_tesseract", "setup_logging"):
+            patcher = patch(f"scan_image.scanner.{name}")
+            setattr(self, f"mock_{name}", patcher.start())
+            self.addCleanup(patcher.stop)
+
     @patch("scan_image.scanner.os.path.isdir", return_value=True)
-    @patch("scan_image.scanner.scan_images_for_phrase", return_value=["/images/img1.png", "/images/img2.png"])
+    @patch("scan_image.scanner.scan_images_for_phrases",
+           return_value={"/images/img1.png": ["hello"], "/images/img2.png": ["hello"]})
     @patch("scan_image.scanner.logging")
     def test_main_with_arguments(self, mock_logging, mock_scan, mock_isdir):
         """Ensure main() behaves correctly with CLI args."""
         test_args = ["scanner.py", "-f", "/test/path", "-p", "hello"]
-        with patch.object(sys, "argv", test_args):
+        with patch.object(sys, "argv", test_args), patch("scan_image.scanner.time.sleep") as mock_sleep:
             main.main()
 
+        # Nothing to keep on screen for a non-interactive run
+        mock_sleep.assert_not_called()
+
         expected_path = os.path.normpath("/test/path")
         mock_isdir.assert_called_once_with(expected_path)
-        mock_scan.assert_called_once_with(expected_path, "hello")
+        args, kwargs = mock_scan.call_args
+        self.assertEqual(args, (expected_path, ["hello"]))
+        self.assertFalse(kwargs["hash_first"])
+        self.assertFalse(kwargs["report_duplicates"])
+        self.assertEqual(kwargs["ocr_engine"], "auto")
+        self.assertIsNone(kwargs["cache_dir"])
+        self.assertEqual(kwargs["prefilter"], DEFAULT_PREFILTER)
+        self.assertFalse(kwargs["text_regions"])
         self.assertTrue(mock_logging.success.called)
+        self.mock_setup_logging.assert_called_once()
+        self.mock_setup_tesseract.assert_called_once()
+
+    @patch("scan_image.scanner.read_phrases_file", return_value=["from file"])
+    @patch("scan_image.scanner.os.path.isdir", return_value=True)
+    @patch("scan_image.scanner.scan_images_for_phrases", return_value={"/images/a.png": ["one", "from file"]})
+    @patch("scan_image.scanner.logging")
+    def test_main_multiple_phrases(self, mock_logging, mock_scan, mock_isdir, mock_read):
+        """Repeated -p and --phrases-file are combined into one scan."""
+        test_args = ["scanner.py", "-f", "/folder", "-p", "one", "-p", "two", "--phrases-file", "phrases.txt"]
+        with patch.object(sys, "argv", test_args):
+            main.main()
+
+        mock_read.assert_called_once_with("phrases.txt")
+        self.assertEqual(mock_scan.call_args[0][1], ["one", "two", "from file"])
+        self.assertIn("/images/a.png: one, from file", mock_logging.success.call_args[0][0])
+
+    @patch("scan_image.index.index_main")
+    def test_main_dispatches_subcommands(self, mock_index_main):
+        with patch.object(sys, "argv", ["scan-image", "index", "/folder", "--db", "x.sqlite3"]):
+            main.main()
+        mock_index_main.assert_called_once_with(["/folder", "--db", "x.sqlite3"])
+
+    @patch("scan_image.watch.watch_images_for_phrases", side_effect=KeyboardInterrupt)
+    @patch("scan_image.scanner.os.path.isdir", return_value=True)
+    @patch("scan_image.scanner.scan_images_for_phrases")
+    @patch("scan_image.scanner.logging")
+    def test_main_watch(self, mock_logging, mock_scan, mock_isdir, mock_watch):
+        """--watch runs the watch loop instead of a one-off scan and stops cleanly on Ctrl+C."""
+        with patch.object(sys, "argv", ["scanner.py", "-f", "/folder", "-p", "hi", "--watch", "--poll-interval", "1"]):
+            main.main()
+
+        mock_scan.assert_not_called()
+        args, kwargs = mock_watch.call_args
+        self.assertEqual(args[:2], (os.path.normpath("/folder"), ["hi"]))
+        self.assertEqual(kwargs["poll_interval"], 1.0)
+        mock_logging.info.assert_called_with("Watch stopped.")
+
+        with patch.object(sys, "argv", ["scanner.py", "-f", "/folder", "-p", "hi", "--watch", "--locate",
+                                        "--timeout", "5", "--max-tasks-per-worker", "20"]):
+            main.main()
+        kwargs = mock_watch.call_args[1]
+        self.assertEqual((kwargs["locate"], kwargs["timeout"], kwargs["max_tasks_per_worker"]), (True, 5.0, 20))
+
+    def test_main_watch_rejects_options_it_cannot_honour(self):
+        for extra in (["--output", "jsonl"], ["--output-file", "out.jsonl"], ["--hash-first"], ["--first"],
+                      ["--limit", "3"], ["--shard", "0/2"], ["--archives"]):
+            with patch.object(sys, "argv", ["scanner.py", "-f", "/f", "-p", "hi", "--watch"] + extra):
+                with self.assertRaises(SystemExit), patch("sys.stderr") as stderr:
+                    main.main()
+            self.assertIn("cannot be combined with --watch", "".join(c.args[0] for c in stderr.write.call_args_list))
+
+    def test_main_version_skips_setup(self):
+        """--version must not probe Tesseract."""
+        with patch.object(sys, "argv", ["scanner.py", "--version"]):
+            with self.assertRaises(SystemExit):
+                main.main()
+        self.mock_setup_tesseract.assert_not_called()
+
+    def test_import_has_no_side_effects(self):
+        """Importing the scanner must not load heavy dependencies or run Tesseract."""
+        code = ("import sys, scan_image.scanner; "
+                "print(sorted(m for m in ('cv2', 'imagehash', 'pytesseract', 'PIL.Image', 'numpy') if m in sys.modules))")
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), "[]")
 
     @patch("scan_image.scanner.os.path.isdir", return_value=True)
-    @patch("scan_image.scanner.scan_images_for_phrase", return_value=[])
+    @patch("scan_image.scanner.scan_images_for_phrases", return_value={})
     @patch("scan_image.scanner.logging")
     def test_main_no_results(self, mock_logging, mock_scan, mock_isdir):
         """Should warn when no images match."""
@@ -45,31 +170,31 @@ class TestMain(unittest.TestCase):
 
     @patch("scan_image.scanner.input", side_effect=["/folder/interactive", "search phrase"])
     @patch("scan_image.scanner.os.path.isdir", return_value=True)
-    @patch("scan_image.scanner.scan_images_for_phrase", return_value=["/images/a.png"])
+    @patch("scan_image.scanner.scan_images_for_phrases", return_value={"/images/a.png": ["search phrase"]})
     @patch("scan_image.scanner.logging")
     def test_main_interactive(self, mock_logging, mock_scan, mock_isdir, mock_input):
         """Should prompt user for folder + phrase when args missing."""
         test_args = ["scanner.py"]  # no CLI args
-        with patch.object(sys, "argv", test_args):
+        with patch.object(sys, "argv", test_args), patch("scan_image.scanner.time.sleep") as mock_sleep:
             main.main()
 
+        mock_sleep.assert_called_once_with(5)
         mock_input.assert_has_calls([
             call("Enter the folder path to scan: "),
             call("Enter the phrase to search for: ")
         ])
-        mock_scan.assert_called_once_with("/folder/interactive", "search phrase")
+        mock_scan.assert_called_once()
+        self.assertEqual(mock_scan.call_args[0], ("/folder/interactive", ["search phrase"]))
 
-    @patch("scan_image.scanner.os.walk")
+    @patch("scan_image.scanner.iter_image_files")
     @patch("scan_image.scanner.cpu_count", return_value=4)
     @patch("scan_image.scanner.Pool")
     @patch("scan_image.scanner.logging")
-    def test_scan_images_for_phrase(self, mock_logging, mock_pool, mock_cpu, mock_walk):
+    def test_scan_images_for_phrase(self, mock_logging, mock_pool, mock_cpu, mock_discover):
         """Test scan_images_for_phrase logic (without OCR)."""
 
-        # Fake directory listing
-        mock_walk.return_value = [
-            ("/folder", [], ["a.jpg", "b.jpg", "c.txt"])  # only jpg processed
-        ]
+        # Fake directory listing, already filtered to images
+        mock_discover.return_value = iter(["/folder/a.jpg", "/folder/b.jpg"])
 
         # Fake multiprocessing pool
         pool_instance = MagicMock()
@@ -77,17 +202,649 @@ class TestMain(unittest.TestCase):
 
         # imap_unordered simulated behavior
         pool_instance.imap_unordered.return_value = [
-            ("/folder/a.jpg", "hash1"),
-            ("/folder/b.jpg", "hash1"),  # duplicate
-            None
+            # b.jpg is a duplicate
+            [Match("/folder/a.jpg", "hash1", ["hello"], {}), Match("/folder/b.jpg", "hash1", ["hello"], {})],
+            []
         ]
 
         result = scan_images_for_phrase("/folder", "hello")
 
         self.assertEqual(result, ["/folder/a.jpg"])
-        mock_walk.assert_called_once()
+        mock_discover.assert_called_once_with("/folder", archives=False)
         mock_pool.assert_called_once()
 
+    @patch("scan_image.scanner.iter_image_files", return_value=iter([]))
+    @patch("scan_image.scanner.cpu_count", return_value=4)
+    @patch("scan_image.scanner.Pool")
+    @patch("scan_image.scanner.logging")
+    def test_scan_worker_count(self, mock_logging, mock_pool, mock_cpu, mock_discover):
+        mock_pool.return_value.__enter__.return_value.imap_unordered.return_value = []
+        main.scan_images_for_phrases("/f", ["hello"], processes=2)
+        self.assertEqual(mock_pool.call_args[1]["processes"], 2)
+        main.scan_images_for_phrases("/f", ["hello"])
+        self.assertEqual(mock_pool.call_args[1]["processes"], 4)
+
+    @patch("scan_image.scanner.iter_image_files")
+    @patch("scan_image.scanner.Pool")
+    @patch("scan_image.scanner.logging")
+    def test_iter_matches_stops_at_limit(self, mock_logging, mock_pool, mock_discover):
+        mock_discover.return_value = iter(f"/f/{i}.png" for i in range(100))
+        pool_instance = MagicMock()
+        mock_pool.return_value.__enter__.return_value = pool_instance
+        fed = []
+        def fake_imap(func, tasks):
+            for batch, phrases in tasks:
+                fed.append(batch)
+                yield [Match(path, path, ["hello"], {}) for path in batch]
+        pool_instance.imap_unordered.side_effect = fake_imap
+
+        matches = list(main.iter_matches("/f", "hello", limit=3, processes=1))
+
+        self.assertEqual([match.path for match in matches], ["/f/0.png", "/f/1.png", "/f/2.png"])
+        self.assertEqual(len(fed), 1)
+        # Leaving the with block terminates the pool and with it the queued work
+        mock_pool.return_value.__exit__.assert_called_once()
+
+    @patch("scan_image.scanner.iter_image_files")
+    @patch("scan_image.scanner._init_worker")
+    @patch("scan_image.scanner.Pool")
+    @patch("scan_image.scanner.logging")
+    def test_iter_matches_on_executor(self, mock_logging, mock_pool, mock_init, mock_discover):
+        mock_discover.return_value = iter(f"/f/{i}.png" for i in range(200))
+        processed = []
+        def fake_process(args):
+            batch, phrases = args
+            processed.append(batch)
+            return [Match(path, path, list(phrases), {}) for path in batch if path.endswith(("3.png", "7.png"))]
+
+        with ThreadPoolExecutor(max_workers=2) as executor, \
+                patch("scan_image.scanner.process_files", fake_process):
+            matches = list(main.iter_matches("/f", ["hello"], limit=2, executor=executor, processes=2,
+                                             ocr_engine="batch"))
+        # Batches complete in any order
+        self.assertEqual(len(matches), 2)
+        self.assertTrue(all(match.path.endswith(("3.png", "7.png")) for match in matches))
+
+        mock_pool.assert_not_called()
+        # The caller's workers get the scan settings, and the feeder stopped after a few batches
+        self.assertEqual(mock_init.call_args[0][0], "batch")
+        self.assertLessEqual(len(processed), 2 * main.PENDING_TASKS_PER_WORKER + 1)
+
+    @patch("scan_image.scanner.iter_image_files")
+    @patch("scan_image.scanner.Pool")
+    @patch("scan_image.scanner.logging")
+    def test_scan_shard(self, mock_logging, mock_pool, mock_discover):
+        paths = [os.path.join("/f", f"{i}.png") for i in range(40)]
+        pool_instance = MagicMock()
+        mock_pool.return_value.__enter__.return_value = pool_instance
+        # Lazy like the real imap_unordered, which the bounded feeder relies on
+        pool_instance.imap_unordered.side_effect = lambda func, tasks: (
+            [Match(path, path, ["hello"], {}) for path in batch] for batch, _ in tasks)
+
+        found = []
+        for index in range(3):
+            mock_discover.return_value = iter(paths)
+            found.append(set(main.scan_images_for_phrases("/f", "hello", processes=1, shard=(index, 3))))
+        self.assertEqual(set.union(*found), set(paths))
+        self.assertEqual(sum(map(len, found)), len(paths))
+
+    @patch("scan_image.scanner.os.path.isdir", return_value=True)
+    @patch("scan_image.scanner.scan_images_for_phrases", return_value={})
+    @patch("scan_image.scanner.logging")
+    def test_main_shard(self, mock_logging, mock_scan, mock_isdir):
+        with patch.object(sys, "argv", ["scanner.py", "-f", "/f", "-p", "hello", "--shard", "2/4"]):
+            main.main()
+        self.assertEqual(mock_scan.call_args[1]["shard"], (2, 4))
+        for bad in (["--shard", "4/4"], ["--shard", "x"], ["--shard", "0/2", "--watch"]):
+            with patch.object(sys, "argv", ["scanner.py", "-f", "/f", "-p", "hello"] + bad), \
+                    patch("sys.stderr"), self.assertRaises(SystemExit):
+                main.main()
+
+    @patch("scan_image.scanner.os.path.isdir", return_value=True)
+    @patch("scan_image.scanner.scan_images_for_phrases", return_value={})
+    @patch("scan_image.scanner.logging")
+    def test_main_scheduler(self, mock_logging, mock_scan, mock_isdir):
+        with patch.object(sys, "argv", ["scanner.py", "-f", "/f", "-p", "hello"]):
+            main.main()
+        self.assertEqual(mock_scan.call_args[1]["scheduler"], "pool")
+        with patch.object(sys, "argv", ["scanner.py", "-f", "/f", "-p", "hello", "--scheduler", "pipeline",
+                                        "--prefetch-threads", "2"]):
+            main.main()
+        self.assertEqual(mock_scan.call_args[1]["scheduler"], "pipeline")
+        self.assertEqual(mock_scan.call_args[1]["prefetch_threads"], 2)
+
+    @patch("scan_image.scanner.ocr_text_batch", side_effect=lambda images: ["hello"] * len(images))
+    @patch("scan_image.scanner.compute_perceptual_hash", side_effect=lambda image: image.path)
+    @patch("scan_image.scanner.has_text_heuristic", return_value=True)
+    @patch("scan_image.scanner._init_worker")
+    @patch("scan_image.scanner.logging")
+    def test_scan_archives(self, mock_logging, mock_init, mock_heur, mock_hash, mock_ocr):
+        buffer = io.BytesIO()
+        Image.new("RGB", (100, 100), "white").save(buffer, "PNG")
+        with tempfile.TemporaryDirectory() as folder:
+            archive_path = os.path.join(folder, "bundle.zip")
+            with zipfile.ZipFile(archive_path, "w") as archive:
+                archive.writestr("scans/page.png", buffer.getvalue())
+            with tarfile.open(os.path.join(folder, "bundle.tar.gz"), "w:gz") as archive:
+                info = tarfile.TarInfo("scans/page.png")
+                info.size = len(buffer.getvalue())
+                archive.addfile(info, io.BytesIO(buffer.getvalue()))
+            Image.new("RGB", (100, 100), "white").save(os.path.join(folder, "loose.png"))
+            for options in ({}, {"hash_first": True}, {"scheduler": "pipeline"}):
+                # Tar members are streamed, never read one by one
+                with ThreadPoolExecutor(max_workers=1) as executor, \
+                        patch("scan_image.archives.read_member", wraps=archives.read_member) as mock_read:
+                    found = main.scan_images_for_phrases(folder, ["hello"], executor=executor, processes=1,
+                                                         archives=True, **options)
+                self.assertEqual(sorted(found), [os.path.join(folder, "bundle.tar.gz!/scans/page.png"),
+                                                 os.path.join(folder, "bundle.zip!/scans/page.png"),
+                                                 os.path.join(folder, "loose.png")], options)
+                self.assertFalse([c for c in mock_read.call_args_list if ".tar.gz" in c.args[0]], options)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                found = main.scan_images_for_phrases(folder, ["hello"], executor=executor, processes=1)
+            self.assertEqual(list(found), [os.path.join(folder, "loose.png")])
+
+    @patch("scan_image.scanner._init_worker")
+    @patch("scan_image.scanner.logging")
+    def test_pipeline_scheduler(self, mock_logging, mock_init):
+        with tempfile.TemporaryDirectory() as folder:
+            for name, size in (("small.png", 10), ("big.png", 1000), ("mid.png", 100)):
+                with open(os.path.join(folder, name), "wb") as f:
+                    f.write(b"x" * size)
+            batches = []
+            def fake_process(args):
+                batch, phrases = args
+                batches.append(batch)
+                return [Match(path, path, list(phrases), {}) for path, data in batch]
+
+            metrics = Metrics()
+            with ThreadPoolExecutor(max_workers=1) as executor, \
+                    patch("scan_image.scanner.process_files", fake_process), \
+                    patch("scan_image.scanner.BATCH_SIZE", 2):
+                found = main.scan_images_for_phrases(folder, ["hello"], executor=executor, processes=1,
+                                                     metrics=metrics, scheduler="pipeline")
+
+        self.assertEqual(len(found), 3)
+        # Largest first, with the bytes read by the parent
+        self.assertEqual([[(os.path.basename(path), len(data)) for path, data in batch] for batch in batches],
+                         [[("big.png", 1000), ("mid.png", 100)], [("small.png", 10)]])
+        self.assertEqual(metrics.counters["bytes_read"], 1110)
+        self.assertIn("prefetch", metrics.snapshot()["stages"])
+
+    @patch("scan_image.scanner.set_preprocess")
+    @patch("scan_image.scanner.set_text_regions")
+    @patch("scan_image.scanner.set_prefilter")
+    @patch("scan_image.scanner.set_default_engine")
+    @patch("scan_image.scanner.configure_tesseract")
+    @patch("scan_image.scanner.setup_logging")
+    def test_init_worker_pins_omp_threads(self, *mocks):
+        with patch.dict(os.environ, clear=True):
+            main._init_worker("batch", 20, omp_threads=2)
+            self.assertEqual(os.environ["OMP_THREAD_LIMIT"], "2")
+        with patch.dict(os.environ, {"OMP_THREAD_LIMIT": "4"}):
+            # The user's own limit wins
+            main._init_worker("batch", 20, omp_threads=1)
+            self.assertEqual(os.environ["OMP_THREAD_LIMIT"], "4")
+        with patch("scan_image.scanner.cpu_count", return_value=8):
+            self.assertEqual(main._worker_initargs("batch", None, 0, processes=4)[6], 2)
+            self.assertEqual(main._worker_initargs("batch", None, 0, processes=16)[6], 1)
+
+    @patch("scan_image.merge.merge_main")
+    def test_main_dispatches_merge(self, mock_merge):
+        with patch.object(sys, "argv", ["scan-image", "merge", "a.jsonl", "b.jsonl"]):
+            main.main()
+        mock_merge.assert_called_once_with(["a.jsonl", "b.jsonl"])
+
+    @patch("scan_image.scanner.os.path.isdir", return_value=True)
+    @patch("scan_image.scanner.scan_images_for_phrases", return_value={"/f/a.png": ["hello"]})
+    @patch("scan_image.scanner.logging")
+    def test_main_first(self, mock_logging, mock_scan, mock_isdir):
+        for extra, limit in (([], None), (["--first"], 1), (["--limit", "5"], 5)):
+            with patch.object(sys, "argv", ["scanner.py", "-f", "/f", "-p", "hello"] + extra):
+                main.main()
+            self.assertEqual(mock_scan.call_args[1]["limit"], limit)
+        for bad in ("0", "-1", "x"):
+            with patch.object(sys, "argv", ["scanner.py", "-f", "/f", "-p", "hello", "--limit", bad]):
+                with self.assertRaises(SystemExit), patch("sys.stderr"):
+                    main.main()
+        with self.assertRaises(ValueError):
+            next(main.iter_matches("/f", ["hello"], limit=0))
+
+    @patch("scan_image.scanner.iter_image_files")
+    @patch("scan_image.scanner.cpu_count", return_value=4)
+    @patch("scan_image.scanner.Pool")
+    @patch("scan_image.scanner.logging")
+    def test_scan_groups_near_duplicates(self, mock_logging, mock_pool, mock_cpu, mock_discover):
+        mock_discover.side_effect = lambda folder, archives=False: iter(["/f/a.jpg", "/f/b.jpg", "/f/c.jpg"])
+        pool_instance = MagicMock()
+        mock_pool.return_value.__enter__.return_value = pool_instance
+        pool_instance.imap_unordered.return_value = [
+            [Match("/f/a.jpg", "ff00000000000000", ["hello"], {}),
+             Match("/f/b.jpg", "ff00000000000003", ["hello"], {})],
+            [Match("/f/c.jpg", "00000000000000ff", ["hello"], {})],
+        ]
+
+        groups = {}
+        result = main.scan_images_for_phrases("/f", ["hello"], dedupe_distance=4, groups=groups)
+        self.assertEqual(list(result), ["/f/a.jpg", "/f/c.jpg"])
+        self.assertEqual(groups, {"/f/a.jpg": ["/f/b.jpg"], "/f/c.jpg": []})
+        self.assertEqual(len(main.scan_images_for_phrases("/f", ["hello"])), 3)
+
+    @patch("scan_image.scanner.os.path.isdir", return_value=True)
+    @patch("scan_image.scanner.scan_images_for_phrases")
+    @patch("scan_image.scanner.logging")
+    def test_main_lists_near_duplicates(self, mock_logging, mock_scan, mock_isdir):
+        def fake_scan(folder, phrases, groups=None, **kwargs):
+            groups["/f/a.png"] = ["/f/a-copy.jpg"]
+            return {"/f/a.png": ["hello"]}
+        mock_scan.side_effect = fake_scan
+        with patch.object(sys, "argv", ["scanner.py", "-f", "/f", "-p", "hello", "--dedupe-distance", "6"]):
+            main.main()
+        self.assertEqual(mock_scan.call_args[1]["dedupe_distance"], 6)
+        with patch.object(sys, "argv", ["scanner.py", "-f", "/f", "-p", "hello", "--dedupe-distance", "24"]):
+            with self.assertRaises(SystemExit), patch("sys.stderr"):
+                main.main()
+        self.assertIn("- /f/a.png\n    ~ /f/a-copy.jpg", mock_logging.success.call_args[0][0])
+
+    @patch("scan_image.scanner.os.path.isdir", return_value=True)
+    @patch("scan_image.scanner.scan_images_for_phrases")
+    @patch("scan_image.scanner.logging")
+    def test_main_lists_all_duplicates_once(self, mock_logging, mock_scan, mock_isdir):
+        mock_scan.return_value = ["/f/a.png", "/f/a-copy.jpg"]
+        argv = ["scanner.py", "-f", "/f", "-p", "hello", "--hash-first", "--all-duplicates"]
+        with patch.object(sys, "argv", argv):
+            main.main()
+        self.assertIsNone(mock_scan.call_args[1]["groups"])
+        message = mock_logging.success.call_args[0][0]
+        self.assertIn("found in 2 images", message)
+        self.assertNotIn("~", message)
+
+    @patch("scan_image.scanner.os.path.isdir", return_value=True)
+    @patch("scan_image.scanner.scan_images_for_phrases")
+    @patch("scan_image.scanner.iter_matches")
+    @patch("scan_image.scanner.logging")
+    def test_main_streams_jsonl(self, mock_logging, mock_iter, mock_scan, mock_isdir):
+        written = []
+        def fake_iter(folder, phrases, groups, **kwargs):
+            # Each record must be on disk before the next match is produced
+            groups["/f/a.png"] = []
+            yield Match("/f/a.png", "ff00", ["hello"], {"ocr": 0.25})
+            with open(out_path) as f:
+                written.append(f.read())
+            # A near-duplicate found after its representative was written
+            groups["/f/a.png"].append("/f/a-copy.png")
+            groups["/f/b.png"] = []
+            yield Match("/f/b.png", "00ff", ["hello", "bye"], {})
+        mock_iter.side_effect = fake_iter
+
+        with tempfile.TemporaryDirectory() as tmp:
+            out_path = os.path.join(tmp, "matches.jsonl")
+            argv = ["scanner.py", "-f", "/f", "-p", "hello", "-p", "bye", "--output", "jsonl",
+                    "--output-file", out_path]
+            with patch.object(sys, "argv", argv):
+                main.main()
+            with open(out_path) as f:
+                lines = [json.loads(line) for line in f]
+
+        mock_scan.assert_not_called()
+        self.assertEqual(mock_iter.call_args[0], ("/f", ["hello", "bye"]))
+        self.assertEqual(json.loads(written[0]), {"path": "/f/a.png", "phash": "ff00", "phrases": ["hello"],
+                                                  "timings_ms": {"ocr": 250.0}})
+        self.assertEqual([line["path"] for line in lines], ["/f/a.png", "/f/b.png", "/f/a-copy.png"])
+        self.assertEqual(lines[-1], {"path": "/f/a-copy.png", "duplicate_of": "/f/a.png"})
+        mock_logging.success.assert_not_called()
+
+    @patch("scan_image.scanner.os.path.isdir", return_value=True)
+    @patch("scan_image.scanner.scan_images_for_phrases", return_value={})
+    @patch("scan_image.scanner.logging")
+    def test_main_hash_first(self, mock_logging, mock_scan, mock_isdir):
+        test_args = ["scanner.py", "-f", "/folder", "-p", "test", "--hash-first", "--all-duplicates"]
+        with patch.object(sys, "argv", test_args):
+            main.main()
+
+        args, kwargs = mock_scan.call_args
+        self.assertEqual(args, (os.path.normpath("/folder"), ["test"]))
+        self.assertTrue(kwargs["hash_first"])
+        self.assertTrue(kwargs["report_duplicates"])
+
+    @patch("scan_image.scanner.iter_image_files")
+    @patch("scan_image.scanner.cpu_count", return_value=4)
+    @patch("scan_image.scanner.Pool")
+    @patch("scan_image.scanner.logging")
+    def test_scan_hash_first_ocrs_one_per_group(self, mock_logging, mock_pool, mock_cpu, mock_discover):
+        """Duplicates are grouped before OCR and only representatives are OCR'd."""
+        mock_discover.side_effect = lambda folder, archives=False: iter(["/folder/a.jpg", "/folder/b.jpg", "/folder/c.jpg"])
+        pool_instance = MagicMock()
+        mock_pool.return_value.__enter__.return_value = pool_instance
+
+        ocr_tasks = []
+        def fake_imap(func, tasks):
+            if func is main.hash_files:
+                return [[("/folder/b.jpg", "hash1"), ("/folder/a.jpg", "hash1")],
+                        [("/folder/c.jpg", "hash2")]]
+            for batch, phrases in tasks:
+                ocr_tasks.extend((path, phrases) for path in batch)
+            return [[Match("/folder/a.jpg", None, ["hello"], {})]]
+        pool_instance.imap_unordered.side_effect = fake_imap
+
+        result = scan_images_for_phrase("/folder", "hello", hash_first=True)
+        self.assertEqual(result, ["/folder/a.jpg"])
+        self.assertEqual(sorted(ocr_tasks), [("/folder/a.jpg", ("hello",)), ("/folder/c.jpg", ("hello",))])
+
+        ocr_tasks.clear()
+        result = scan_images_for_phrase("/folder", "hello", hash_first=True, report_duplicates=True)
+        self.assertEqual(result, ["/folder/a.jpg", "/folder/b.jpg"])
+
+    def test_throttle_bounds_feeder(self):
+        """The feeder stops after `limit` items until results are released."""
+        throttle = main._Throttle(2)
+        fed = throttle.feed(iter(range(10)))
+        self.assertEqual([next(fed), next(fed)], [0, 1])
+        throttle.release()
+        self.assertEqual(next(fed), 2)
+        throttle.stop()
+        self.assertEqual(list(fed), [])
+
+    @patch("scan_image.supervisor.KILL_GRACE", 0)
+    @patch("scan_image.scanner.logging")
+    def test_stuck_worker_is_replaced(self, mock_logging):
+        """Files a killed worker did not finish are retried; the one it was stuck on is skipped."""
+        metrics = Metrics()
+        progress = SimpleQueue()
+        tasks = [(["a", "stuck1", "b"], False), (["c", "stuck2", "d"], True)]
+        with Pool(1, init_supervision, (progress, None)) as pool:
+            results = list(main._imap_bounded(pool, _stall_on_stuck, tasks, 1, metrics,
+                                              supervision=(progress, 0.5)))
+        self.assertEqual(sorted(path for result in results for path in result), ["a", "b", "c", "d"])
+        self.assertEqual(sorted(metrics.skipped), [("stuck1", "timeout"), ("stuck2", "timeout")])
+
+    @unittest.skipUnless(hasattr(signal, "SIGKILL"), "needs SIGKILL")
+    @patch("scan_image.scanner.logging")
+    def test_dead_worker_is_noticed_without_a_timeout(self, mock_logging):
+        """A worker killed mid-task, e.g. by the OOM killer, does not stall the scan; its file is skipped."""
+        metrics = Metrics()
+        progress = SimpleQueue()
+        tasks = [(["a", "crash1", "b"], False), (["c", "crash2", "d"], True)]
+        with Pool(1, init_supervision, (progress, None)) as pool:
+            results = list(main._imap_bounded(pool, _die_on_crash, tasks, 1, metrics,
+                                              supervision=(progress, None)))
+        self.assertEqual(sorted(path for result in results for path in result), ["a", "b", "c", "d"])
+        self.assertEqual(sorted(metrics.skipped), [("crash1", "worker died"), ("crash2", "worker died")])
+
+    @patch("scan_image.scanner.os.path.isdir", return_value=True)
+    @patch("scan_image.scanner.logging")
+    def test_main_timeout_options_and_skipped_report(self, mock_logging, mock_isdir):
+        def scan(folder, phrases, metrics, **kwargs):
+            metrics.skip("/f/huge.tif", "timeout")
+            return {}
+
+        with patch("scan_image.scanner.scan_images_for_phrases", side_effect=scan) as mock_scan:
+            with patch.object(sys, "argv", ["scanner.py", "-f", "/f", "-p", "hello"]):
+                main.main()
+            kwargs = mock_scan.call_args[1]
+            self.assertEqual((kwargs["timeout"], kwargs["max_tasks_per_worker"], kwargs["max_worker_rss_mb"]),
+                             (main.DEFAULT_TIMEOUT, None, main.DEFAULT_MAX_WORKER_RSS_MB))
+            mock_logging.warning.assert_any_call("1 image(s) were skipped:\n- /f/huge.tif: timeout")
+            argv = ["scanner.py", "-f", "/f", "-p", "hello", "--timeout", "0", "--max-tasks-per-worker", "50",
+                    "--max-worker-memory-mb", "0"]
+            with patch.object(sys, "argv", argv):
+                main.main()
+            kwargs = mock_scan.call_args[1]
+            self.assertEqual((kwargs["timeout"], kwargs["max_tasks_per_worker"], kwargs["max_worker_rss_mb"]),
+                             (None, 50, None))
+            for bad in (["--timeout", "-1"], ["--timeout", "nan"], ["--max-tasks-per-worker", "0"],
+                        ["--max-worker-memory-mb", "-5"]):
+                with patch.object(sys, "argv", ["scanner.py", "-f", "/f", "-p", "hello"] + bad):
+                    with self.assertRaises(SystemExit), patch("sys.stderr"):
+                        main.main()
+
+    @patch("scan_image.scanner.Pool")
+    @patch("scan_image.scanner.iter_image_files", return_value=[])
+    @patch("scan_image.scanner.logging")
+    def test_supervised_pool(self, mock_logging, mock_discover, mock_pool):
+        main.scan_images_for_phrases("/f", ["hello"], processes=2, timeout=30, max_tasks_per_worker=10)
+        kwargs = mock_pool.call_args[1]
+        self.assertIs(kwargs["initializer"], main._init_supervised_worker)
+        self.assertEqual(kwargs["maxtasksperchild"], 10)
+        initargs, progress, max_rss_mb = kwargs["initargs"]
+        self.assertEqual(initargs[7], 30)
+        main.scan_images_for_phrases("/f", ["hello"], processes=2)
+        self.assertIs(mock_pool.call_args[1]["initializer"], main._init_worker)
+        self.assertIsNone(mock_pool.call_args[1]["maxtasksperchild"])
+
+    @patch("scan_image.scanner.ocr_text_batch", return_value=["say hello"])
+    @patch("scan_image.scanner.compute_perceptual_hash", return_value="hash1")
+    @patch("scan_image.scanner.has_text_heuristic", return_value=True)
+    @patch("scan_image.scanner.load_image")
+    def test_process_file_shares_context(self, mock_load, mock_heur, mock_hash, mock_ocr):
+        """Every stage receives the single decoded context."""
+        ctx = MagicMock()
+        mock_load.return_value = ctx
+
+        result = main.process_file(("/folder/a.png", "hello"))
+
+        self.assertEqual(result[:3], ("/folder/a.png", "hash1", ["hello"]))
+        self.assertEqual(set(result.timings), {"read", "heuristic", "decode", "hash", "ocr"})
+        mock_load.assert_called_once_with("/folder/a.png", None, decode=False)
+        mock_heur.assert_called_once_with(ctx)
+        mock_hash.assert_called_once_with(ctx)
+        mock_ocr.assert_called_once_with([ctx])
+
+    @patch("scan_image.scanner.ocr_text_batch", return_value=["hello there", "nothing"])
+    @patch("scan_image.scanner.compute_perceptual_hash", side_effect=["hash1", "hash2"])
+    @patch("scan_image.scanner.has_text_heuristic", return_value=True)
+    @patch("scan_image.scanner.load_image")
+    def test_process_files_ocrs_batch_in_one_call(self, mock_load, mock_heur, mock_hash, mock_ocr):
+        """Images that pass the filters are OCR'd together."""
+        contexts = {}
+        def fake_load(path, data=None, decode=True):
+            if path.endswith(".txt"):
+                return None
+            contexts[path] = MagicMock(path=path)
+            return contexts[path]
+        mock_load.side_effect = fake_load
+
+        result = main.process_files((["/f/a.png", "/f/b.txt", "/f/c.png"], ("hello",)))
+
+        self.assertEqual([match[:3] for match in result], [("/f/a.png", "hash1", ["hello"])])
+        mock_ocr.assert_called_once_with([contexts["/f/a.png"], contexts["/f/c.png"]])
+
+    @patch("scan_image.scanner.ocr_text_batch")
+    @patch("scan_image.scanner.locate_phrases")
+    @patch("scan_image.scanner.locating", return_value=True)
+    @patch("scan_image.scanner.compute_perceptual_hash", side_effect=["hash1", "hash2"])
+    @patch("scan_image.scanner.has_text_heuristic", return_value=True)
+    @patch("scan_image.scanner.load_image", side_effect=lambda path, data=None, decode=True: MagicMock(path=path))
+    def test_process_files_locates_phrases(self, mock_load, mock_heur, mock_hash, mock_locating, mock_locate,
+                                           mock_batch):
+        """Each image is OCR'd until its phrases are found, and the match records where they are."""
+        mock_locate.side_effect = [({"invoice total": (10, 20, 90, 60)}, "Invoice\ntotal", False), ({}, "", True)]
+
+        result = main.process_files((["/f/a.png", "/f/b.png"], ("invoice total", "due")))
+
+        self.assertEqual(result, [Match("/f/a.png", "hash1", ["invoice total"], result[0].timings,
+                                        {"invoice total": (10, 20, 90, 60)})])
+        self.assertEqual(mock_locate.call_args[0][1], ("invoice total", "due"))
+        mock_batch.assert_not_called()
+        self.assertEqual(main._match_record(result[0])["boxes"], {"invoice total": [10, 20, 90, 60]})
+        # Text from the cache matches across lines too, without a box
+        record = main._Record("/f/c.png", main.CacheEntry(True, True, "hash3", "see invoice\nTOTAL"))
+        self.assertEqual(main._find_phrases([record], ("invoice total",)),
+                         [Match("/f/c.png", "hash3", ["invoice total"], {}, {"invoice total": None})])
+
+    @patch("scan_image.scanner.ocr_text_tiled")
+    @patch("scan_image.scanner.ocr_text_batch", return_value=["small text"])
+    def test_ocr_records_tiles_large_images(self, mock_batch, mock_tiled):
+        with tempfile.TemporaryDirectory() as tmp:
+            pages = os.path.join(tmp, "pages.tiff")
+            Image.new("RGB", (100, 100), "white").save(pages, save_all=True,
+                                                       append_images=[Image.new("RGB", (100, 100), "white")])
+            small = os.path.join(tmp, "small.png")
+            Image.new("RGB", (100, 100), "white").save(small)
+            entry = main.CacheEntry(True, True, "hash", None)
+            records = [main._Record(path, entry, key, image=main.load_image(path, decode=False))
+                       for path, key in ((pages, "k1"), (small, "k2"))]
+        cache = MagicMock()
+        matcher = main.get_matcher(("hello",))
+        for complete, cached in ((False, ["k2"]), (True, ["k1", "k2"])):
+            cache.reset_mock()
+            for record in records:
+                record.entry = entry
+            mock_tiled.return_value = ("hello", complete)
+
+            main._ocr_records(records, cache, matcher)
+
+            mock_tiled.assert_called_with(records[0].image, matcher)
+            mock_batch.assert_called_with([records[1].image])
+            self.assertEqual([record.entry.text for record in records], ["hello", "small text"])
+            # Text cut short once the phrases were found is not cached
+            self.assertEqual(sorted(call.args[0] for call in cache.put.call_args_list), cached)
+
+    @patch("scan_image.scanner.ocr_text_batch", return_value=["hello there"])
+    @patch("scan_image.scanner.compute_perceptual_hash", return_value="hash1")
+    @patch("scan_image.scanner.has_text_heuristic", return_value=True)
+    @patch("scan_image.scanner.load_image")
+    def test_process_files_uses_prefetched_bytes(self, mock_load, mock_heur, mock_hash, mock_ocr):
+        mock_load.side_effect = lambda path, data=None, decode=True: MagicMock(path=path, data=data)
+        task = (main.process_files, ([("/f/a.png", b"12345")], ("hello",)), None, None)
+
+        result, snapshot = main._measured_task(task)
+
+        self.assertEqual([match[:3] for match in result], [("/f/a.png", "hash1", ["hello"])])
+        self.assertEqual(mock_load.call_args_list[0][0][:2], ("/f/a.png", b"12345"))
+        # Counted by the parent that read them
+        self.assertEqual(snapshot["counters"]["bytes_read"], 0)
+
+    @patch("scan_image.scanner.ocr_text_batch", return_value=["hello there"])
+    @patch("scan_image.scanner.compute_perceptual_hash", return_value="hash1")
+    @patch("scan_image.scanner.has_text_heuristic", side_effect=lambda image: image.path != "/f/b.png")
+    @patch("scan_image.scanner.load_image")
+    def test_process_files_counts_stages(self, mock_load, mock_heur, mock_hash, mock_ocr):
+        mock_load.side_effect = lambda path, data=None, decode=True: (
+            None if path.endswith(".txt") else MagicMock(path=path, data=b"12345"))
+        task = (main.process_files, (["/f/a.png", "/f/b.png", "/f/c.txt"], ("hello",)), None, None)
+
+        result, snapshot = main._measured_task(task)
+
+        self.assertEqual([match[:3] for match in result], [("/f/a.png", "hash1", ["hello"])])
+        self.assertEqual(snapshot["counters"], {
+            "files_seen": 3, "bytes_read": 10, "rejected_invalid": 1, "rejected_heuristic": 1,
+            "cache_hits": 0, "ocr_calls": 1, "ocr_images": 1, "matches": 1})
+        self.assertEqual(list(snapshot["stages"]), ["read", "decode", "heuristic", "hash", "ocr", "match"])
+        self.assertEqual(snapshot["stages"]["read"]["calls"], 3)
+
+    @patch("scan_image.scanner.iter_image_files")
+    @patch("scan_image.scanner.Pool")
+    @patch("scan_image.scanner.logging")
+    def test_scan_merges_worker_metrics(self, mock_logging, mock_pool, mock_discover):
+        mock_discover.return_value = iter(["/f/a.jpg", "/f/b.jpg"])
+        pool_instance = MagicMock()
+        mock_pool.return_value.__enter__.return_value = pool_instance
+        snapshot = {"counters": {"files_seen": 2}, "stages": {"ocr": {"calls": 1, "seconds": 0.5}}}
+        def fake_imap(func, tasks):
+            self.assertIs(func, main._measured_task)
+            return [([Match("/f/a.jpg", "hash1", ["hello"], {})], snapshot) for _ in tasks]
+        pool_instance.imap_unordered.side_effect = fake_imap
+
+        metrics = Metrics()
+        result = main.scan_images_for_phrases("/f", ["hello"], processes=1, metrics=metrics)
+
+        self.assertEqual(list(result), ["/f/a.jpg"])
+        self.assertEqual(metrics.counters["files_seen"], 2)
+        self.assertEqual(metrics.stages["ocr"], [1, 0.5])
+        self.assertEqual(metrics.stages["discovery"][0], 3)
+
+    @patch("scan_image.scanner.os.path.isdir", return_value=True)
+    @patch("scan_image.scanner.scan_images_for_phrases", return_value={"/f/a.png": ["hello"]})
+    @patch("scan_image.scanner.logging")
+    def test_main_writes_metrics(self, mock_logging, mock_scan, mock_isdir):
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path, prom_path = os.path.join(tmp, "metrics.json"), os.path.join(tmp, "scan.prom")
+            argv = ["scanner.py", "-f", "/f", "-p", "hello", "--metrics-json", json_path,
+                    "--prometheus-textfile", prom_path, "--profile", os.path.join(tmp, "prof")]
+            with patch.object(sys, "argv", argv):
+                main.main()
+            with open(json_path) as f:
+                data = json.load(f)
+            with open(prom_path) as f:
+                self.assertIn("scan_image_images_found 1\n", f.read())
+        kwargs = mock_scan.call_args[1]
+        self.assertIsInstance(kwargs["metrics"], Metrics)
+        self.assertEqual(kwargs["profile_dir"], os.path.join(tmp, "prof"))
+        self.assertEqual(data["images_found"], 1)
+        self.assertIn("counters", data)
+
+    @patch("scan_image.scanner.ocr_text_batch")
+    @patch("scan_image.scanner.compute_perceptual_hash", return_value="abcd")
+    @patch("scan_image.scanner.has_text_heuristic", return_value=True)
+    def test_process_files_uses_cache(self, mock_heur, mock_hash, mock_ocr):
+        """A second run over unchanged or identical files neither decodes nor OCRs."""
+        with tempfile.TemporaryDirectory() as tmp:
+            image_path = os.path.join(tmp, "a.png")
+            Image.new("RGB", (100, 100), "white").save(image_path)
+            copy_path = os.path.join(tmp, "copy.png")
+            shutil.copy(image_path, copy_path)
+            mock_ocr.side_effect = lambda images: ["Hello there"] * len(images)
+
+            db = OcrCache(os.path.join(tmp, "cache"), "fp")
+            try:
+                with patch("scan_image.scanner.get_cache", return_value=db):
+                    first = main.process_files(([image_path], ("hello",)))
+                    mock_ocr.assert_called_once()
+                    with patch("scan_image.scanner.load_image", side_effect=AssertionError("decoded")):
+                        again = main.process_files(([image_path, copy_path], ("hello", "there")))
+            finally:
+                db.close()
+
+        self.assertEqual([match[:3] for match in first], [(image_path, "abcd", ["hello"])])
+        self.assertEqual([match[:3] for match in again], [(image_path, "abcd", ["hello", "there"]),
+                                                          (copy_path, "abcd", ["hello", "there"])])
+        mock_ocr.assert_called_once()
+        mock_heur.assert_called_once()
+
+    @patch("scan_image.scanner.ocr_text_batch", side_effect=lambda images: ["Hello there"] * len(images))
+    @patch("scan_image.scanner.compute_perceptual_hash", return_value="abcd")
+    @patch("scan_image.scanner.has_text_heuristic", return_value=True)
+    def test_process_uploads_are_cached_by_content(self, mock_heur, mock_hash, mock_ocr):
+        buffer = io.BytesIO()
+        Image.new("RGB", (100, 100), "white").save(buffer, "PNG")
+        with tempfile.TemporaryDirectory() as tmp:
+            db = OcrCache(os.path.join(tmp, "cache"), "fp")
+            try:
+                with patch("scan_image.scanner.get_cache", return_value=db):
+                    for name in ("upload.png", "again.png"):
+                        found = main.process_uploads(([(name, buffer.getvalue())], ("hello",)))
+                        self.assertEqual([match[:3] for match in found], [(name, "abcd", ["hello"])])
+            finally:
+                db.close()
+        mock_ocr.assert_called_once()
+
+    @patch("scan_image.scanner.os.path.isdir", return_value=True)
+    @patch("scan_image.scanner.scan_images_for_phrases", return_value={})
+    @patch("scan_image.scanner.logging")
+    def test_main_stage_options(self, mock_logging, mock_scan, mock_isdir):
+        test_args = ["scanner.py", "-f", "/f", "-p", "x", "--prefilter", "edges",
+                     "--min-edge-fraction", "0.01", "--prefilter-size", "1024", "--text-regions"]
+        with patch.object(sys, "argv", test_args):
+            main.main()
+        prefilter = mock_scan.call_args[1]["prefilter"]
+        self.assertEqual((prefilter.method, prefilter.max_side, prefilter.min_edge_fraction), ("edges", 1024, 0.01))
+        self.assertTrue(mock_scan.call_args[1]["text_regions"])
+
+    @patch("scan_image.scanner.tesseract_version", return_value="5.4.0")
+    def test_prefilter_is_part_of_fingerprint(self, mock_version):
+        """Cached has_text decisions are dropped when the prefilter changes."""
+        off = DEFAULT_PREFILTER._replace(method="off")
+        self.assertEqual(main._fingerprint("auto"), main._fingerprint("auto", DEFAULT_PREFILTER))
+        self.assertNotEqual(main._fingerprint("auto"), main._fingerprint("auto", off))
+        self.assertNotEqual(main._fingerprint("auto"), main._fingerprint("auto", text_regions=True))
+
+    @patch("scan_image.scanner.has_text_heuristic")
+    @patch("scan_image.scanner.load_image", return_value=None)
+    def test_process_file_invalid_image(self, mock_load, mock_heur):
+        self.assertIsNone(main.process_file(("/folder/a.txt", "hello")))
+        mock_heur.assert_not_called()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,203 @@
+import os
+import json
+import http.client
+import queue
+import tempfile
+import threading
+import unittest
+from multiprocessing.pool import ThreadPool
+from unittest.mock import patch
+from scan_image import serve
+from scan_image.scanner import Match
+
+def _echo(args):
+    if args == "boom":
+        raise ValueError("boom")
+    return args
+
+def _fake_process_files(args):
+    batch, phrases = args
+    return [Match(path, f"{i:016x}", phrases, {}) for i, path in enumerate(batch) if "hit" in path]
+
+def _fake_process_uploads(args):
+    uploads, phrases = args
+    return [Match(name, "0" * 16, phrases, {}) for name, data in uploads if data == b"hello"]
+
+def _post(port, path, headers, body=b""):
+    """Send a raw POST, headers as given; returns the response status."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        connection.putrequest("POST", path)
+        for name, value in headers.items():
+            connection.putheader(name, value)
+        connection.endheaders(body.encode() if isinstance(body, str) else body)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+class FakePool:
+    """Runs the scheduler's tasks one at a time when the test says so."""
+
+    def __init__(self):
+        self.submitted = queue.Queue()
+
+    def apply_async(self, func, args, callback, error_callback):
+        self.submitted.put((func, args, callback, error_callback))
+
+    def run_next(self):
+        func, args, callback, error_callback = self.submitted.get(timeout=5)
+        try:
+            callback(func(*args))
+        except Exception as e:
+            error_callback(e)
+        return args[0][1]
+
+class TestFairScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = FakePool()
+
+    def scheduler(self, slots, max_requests=serve.DEFAULT_MAX_REQUESTS):
+        scheduler = serve.FairScheduler(self.pool, slots, max_requests)
+        self.addCleanup(scheduler.stop)
+        return scheduler
+
+    def test_new_request_gets_the_next_worker(self):
+        scheduler = self.scheduler(1)
+        scan = iter(scheduler.submit([(_echo, "a1"), (_echo, "a2"), (_echo, "a3")]))
+        # a1 is running when the check arrives
+        running = self.pool.submitted.get(timeout=5)
+        check = iter(scheduler.submit([(_echo, "b1")]))
+        self.pool.submitted.put(running)
+
+        ran = [self.pool.run_next()]
+        self.assertEqual(next(scan)[0], "a1")
+        ran.append(self.pool.run_next())
+        self.assertEqual([result for result, _ in check], ["b1"])
+        ran.append(self.pool.run_next())
+        self.assertEqual(next(scan)[0], "a2")
+        ran.append(self.pool.run_next())
+        self.assertEqual(ran, ["a1", "b1", "a2", "a3"])
+        self.assertEqual([result for result, _ in scan], ["a3"])
+
+    def test_unread_results_hold_back_only_their_request(self):
+        scheduler = self.scheduler(2)
+        job = scheduler.submit([(_echo, i) for i in range(5)])
+        self.assertEqual([self.pool.run_next(), self.pool.run_next()], [0, 1])
+        with self.assertRaises(queue.Empty):
+            self.pool.submitted.get(timeout=0.3)
+        results = iter(job)
+        self.assertEqual(next(results)[0], 0)
+        self.assertEqual(self.pool.run_next(), 2)
+        # Closing drops the tasks not started yet
+        job.close()
+        self.assertEqual([result for result, _ in results], [1, 2])
+        with self.assertRaises(queue.Empty):
+            self.pool.submitted.get(timeout=0.3)
+
+    def test_slow_folder_walk_holds_back_only_its_request(self):
+        scheduler = self.scheduler(1)
+        walked = threading.Event()
+
+        def slow_walk():
+            walked.wait(timeout=5)
+            yield (_echo, "a1")
+
+        scan = scheduler.submit(slow_walk())
+        check = scheduler.submit([(_echo, "b1")])
+        self.assertEqual(self.pool.run_next(), "b1")
+        self.assertEqual([result for result, _ in check], ["b1"])
+        walked.set()
+        self.assertEqual(self.pool.run_next(), "a1")
+        self.assertEqual([result for result, _ in scan], ["a1"])
+
+    def test_folder_walk_errors_reach_their_request(self):
+        scheduler = self.scheduler(1)
+
+        def failing_walk():
+            yield (_echo, "a1")
+            raise OSError("gone")
+
+        job = scheduler.submit(failing_walk())
+        self.pool.run_next()
+        results = iter(job)
+        self.assertEqual(next(results)[0], "a1")
+        with self.assertRaises(OSError):
+            next(results)
+
+    def test_task_errors_reach_their_request(self):
+        scheduler = self.scheduler(1)
+        job = scheduler.submit([(_echo, "boom")])
+        self.pool.run_next()
+        with self.assertRaises(ValueError):
+            list(job)
+
+    def test_too_many_requests(self):
+        scheduler = self.scheduler(1, max_requests=1)
+        job = scheduler.submit([])
+        self.assertIsNone(scheduler.submit([]))
+        job.close()
+        self.assertIsNotNone(scheduler.submit([]))
+
+class TestService(unittest.TestCase):
+
+    @patch("scan_image.serve.compute_perceptual_hash")
+    @patch("scan_image.serve.has_text_heuristic")
+    @patch("scan_image.serve.get_engine")
+    @patch("scan_image.serve._init_worker")
+    def test_workers_load_image_libraries_up_front(self, mock_init, mock_engine, mock_heuristic, mock_hash):
+        serve._init_serve_worker("auto", 20)
+        mock_init.assert_called_once_with("auto", 20)
+        mock_engine.assert_called_once_with()
+        image = mock_heuristic.call_args[0][0]
+        self.assertEqual(image.image.size, (64, 64))
+        mock_hash.assert_called_once_with(image)
+
+    @patch("scan_image.serve.process_uploads", _fake_process_uploads)
+    @patch("scan_image.serve.process_files", _fake_process_files)
+    @patch("scan_image.serve.Pool", lambda processes, initializer, initargs, maxtasksperchild: ThreadPool(processes))
+    @patch("scan_image.serve.logging")
+    def test_scan_and_check_over_http(self, mock_logging):
+        started = queue.Queue()
+        thread = threading.Thread(target=serve.serve, kwargs={"port": 0, "processes": 2, "ready": started.put})
+        thread.start()
+        server = started.get(timeout=10)
+        port = server.server_address[1]
+        try:
+            with tempfile.TemporaryDirectory() as folder:
+                for name in ("hit1.png", "miss.png", "hit2.jpg", "notes.txt"):
+                    open(os.path.join(folder, name), "wb").close()
+                records = list(serve.remote_scan(folder, ["hello"], port=port))
+                self.assertEqual(sorted(os.path.basename(record["path"]) for record in records),
+                                 ["hit1.png", "hit2.jpg"])
+                self.assertEqual(records[0]["phrases"], ["hello"])
+                self.assertEqual(len(list(serve.remote_scan(folder, ["hello"], limit=1, port=port))), 1)
+                with self.assertRaises(serve.ServiceError) as raised:
+                    list(serve.remote_scan(os.path.join(folder, "missing"), ["hello"], port=port))
+                self.assertEqual(raised.exception.status, 400)
+                for bad in ({"dedupe_distance": "4"}, {"dedupe_distance": -1}, {"dedupe_distance": 13},
+                            {"limit": 1.5}, {"limit": 0}, {"limit": -1}):
+                    with self.assertRaises(serve.ServiceError) as raised:
+                        list(serve.remote_scan(folder, ["hello"], port=port, **bad))
+                    self.assertEqual(raised.exception.status, 400)
+                for bad in ({"folder": 5, "phrases": ["hello"]}, {"folder": folder, "phrases": ["ok", 1]},
+                            {"folder": folder, "phrases": [""]}):
+                    body = json.dumps(bad)
+                    self.assertEqual(_post(port, "/scan", {"Content-Length": str(len(body))}, body), 400)
+
+            self.assertEqual(_post(port, "/check?phrase=hello", {"Content-Length": "many"}), 400)
+            self.assertEqual(_post(port, "/check?phrase=hello", {"Content-Length": "-5"}), 400)
+            self.assertEqual(_post(port, "/check?phrase=hello", {}), 411)
+
+            self.assertEqual(serve.remote_check(b"hello", ["hello"], "upload.png", port=port), ["hello"])
+            self.assertEqual(serve.remote_check(b"other", ["hello"], port=port), [])
+        finally:
+            server.shutdown()
+            thread.join(timeout=10)
+        self.assertFalse(thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import unittest
+from unittest.mock import ANY, MagicMock, patch
+from scan_image import supervisor
+
+class TestSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.progress = MagicMock()
+        supervisor.init_worker(self.progress, 50)
+        supervisor._tasks_done = 1
+
+    def tearDown(self):
+        supervisor.init_worker(None)
+        supervisor._tasks_done = 0
+
+    def test_deadline(self):
+        self.assertEqual(supervisor.deadline(100.0, ["a"], None), float("inf"))
+        # Before naming its files a worker is only watched for dying
+        self.assertEqual(supervisor.deadline(100.0, (), 10), float("inf"))
+        with patch("scan_image.supervisor.KILL_GRACE", 5):
+            # Per image, however many files the batch has
+            self.assertEqual(supervisor.deadline(100.0, ["a", "b"], 10), 115.0)
+
+    @patch("scan_image.supervisor.current_rss_mb", return_value=10)
+    def test_task_reports_progress(self, mock_rss):
+        def work(paths):
+            supervisor.report_page_done()
+            supervisor.report_progress(paths)
+            supervisor.report_page_done()
+            return len(paths)
+
+        self.assertEqual(supervisor.supervised_task((7, work, ["a", "b"])), (7, os.getpid(), 2))
+        # The task's start, its files, then a page done on them: the deadline restarts
+        self.assertEqual([call[0][0] for call in self.progress.put.call_args_list],
+                         [(os.getpid(), 7, (), ANY), (os.getpid(), 7, ("a", "b"), ANY),
+                          (os.getpid(), 7, ("a", "b"), ANY)])
+        # Outside a task nothing is reported
+        supervisor.report_progress(["c"])
+        supervisor.report_page_done()
+        self.assertEqual(self.progress.put.call_count, 3)
+
+    @patch("scan_image.supervisor.os._exit", side_effect=SystemExit)
+    @patch("scan_image.supervisor.current_rss_mb", return_value=100)
+    def test_worker_above_memory_limit_retires(self, mock_rss, mock_exit):
+        func = MagicMock()
+        with self.assertRaises(SystemExit):
+            supervisor.supervised_task((3, func, ["a"]))
+        func.assert_not_called()
+        self.progress.put.assert_called_once_with((os.getpid(), 3, None, ANY))
+
+        # A fresh worker runs its first task whatever its size
+        supervisor._tasks_done = 0
+        self.assertEqual(supervisor.supervised_task((4, func, ["a"]))[0], 4)
+        func.assert_called_once_with(["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+from scan_image import tiles
+
+class TestTiles(unittest.TestCase):
+
+    def test_small_image_is_one_tile(self):
+        self.assertEqual(tiles.tile_boxes(300, 200), [(0, 0, 300, 200)])
+
+    def test_tiles_cover_with_overlap(self):
+        boxes = tiles.tile_boxes(10000, 5000, size=4000, overlap=500)
+        xs = sorted({(x0, x1) for x0, _, x1, _ in boxes})
+        ys = sorted({(y0, y1) for _, y0, _, y1 in boxes})
+        self.assertEqual(xs, [(0, 4000), (3500, 7500), (6000, 10000)])
+        self.assertEqual(ys, [(0, 4000), (1000, 5000)])
+        # Reading order: left to right, then top to bottom
+        self.assertEqual(boxes[:3], [(0, 0, 4000, 4000), (3500, 0, 7500, 4000), (6000, 0, 10000, 4000)])
+        self.assertEqual(len(boxes), 6)
+
+    def test_needs_tiling(self):
+        self.assertFalse(tiles.needs_tiling(4000, 4000))
+        self.assertTrue(tiles.needs_tiling(20000, 20000))
+        self.assertTrue(tiles.needs_tiling(800, 600, pages=3))
+
+
+if __name__ == "__main__":
+    unittest.main()
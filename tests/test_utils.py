@@ -1,7 +1,12 @@
+import os
+import tempfile
 import unittest
+import warnings
 import numpy as np
+from PIL import Image, ImageDraw, ImageFont
 from unittest.mock import patch, MagicMock
-from scan_image import utils
+from scan_image import metrics, ocr, preprocess, tiles, utils
+from scan_image.matcher import PhraseMatcher
 
 class TestUtils(unittest.TestCase):
 
@@ -42,6 +47,7 @@ class TestUtils(unittest.TestCase):
 
         self.assertFalse(utils.is_valid_image("file.jpg"))
 
+    @patch("scan_image.utils._prefilter", utils.DEFAULT_PREFILTER._replace(method="edges"))
     @patch("scan_image.utils.cv2.imread")
     @patch("scan_image.utils.cv2.Canny")
     def test_has_text_heuristic_detects_text(self, mock_canny, mock_read):
@@ -106,6 +112,328 @@ class TestUtils(unittest.TestCase):
         self.assertFalse(result)
         mock_log.error.assert_called()
 
+    def test_find_phrases_batch(self):
+        """One engine call for the whole batch, one result per image."""
+        engine = MagicMock()
+        engine.images_to_strings.return_value = ["a Test here", "nothing"]
+        images = [MagicMock(), MagicMock()]
+        m = PhraseMatcher(["test", "here", "absent"])
+        self.assertEqual(utils.find_phrases_batch(images, m, engine=engine), [["test", "here"], []])
+        engine.images_to_strings.assert_called_once_with([images[0].image, images[1].image])
+        self.assertEqual(utils.find_phrases_batch([], m, engine=engine), [])
+
+    @patch("scan_image.utils.logging")
+    @patch("scan_image.utils.Image.open")
+    def test_find_phrases(self, mock_open, mock_log):
+        engine = MagicMock()
+        engine.image_to_string.return_value = "Invoice TOTAL due"
+        m = PhraseMatcher(["invoice", "total", "refund"])
+        self.assertEqual(utils.find_phrases("img.png", m, engine=engine), ["invoice", "total"])
+        engine.image_to_string.side_effect = Exception("OCR crash")
+        self.assertEqual(utils.find_phrases("img.png", m, engine=engine), [])
+        mock_log.error.assert_called()
+
+
+class TestImageContext(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "text.png")
+        img = Image.new("RGB", (200, 80), color="white")
+        ImageDraw.Draw(img).text((10, 30), "HELLO", fill="black")
+        img.save(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_load_image_reads_once(self):
+        """load_image decodes the file and exposes a cached grayscale array."""
+        ctx = utils.load_image(self.path)
+        self.assertIsNotNone(ctx)
+        self.assertEqual(ctx.image.size, (200, 80))
+        self.assertEqual(ctx.gray.shape, (80, 200))
+        self.assertIs(ctx.gray, ctx.gray)
+        with open(self.path, "rb") as f:
+            self.assertEqual(ctx.data, f.read())
+
+    def test_load_image_rejects_small_corrupt_and_unknown(self):
+        small = os.path.join(self.tmp.name, "small.png")
+        Image.new("RGB", (10, 10)).save(small)
+        corrupt = os.path.join(self.tmp.name, "corrupt.jpg")
+        with open(corrupt, "wb") as f:
+            f.write(b"not an image")
+        self.assertIsNone(utils.load_image(small))
+        self.assertIsNone(utils.load_image(corrupt))
+        self.assertIsNone(utils.load_image(os.path.join(self.tmp.name, "file.txt")))
+
+    def test_stages_accept_context(self):
+        """Stages given a context must not touch the file again."""
+        ctx = utils.load_image(self.path)
+        with patch("scan_image.utils.Image.open", side_effect=AssertionError("reopened")), \
+             patch("scan_image.utils.cv2.imread", side_effect=AssertionError("reread")), \
+             patch("scan_image.utils.pytesseract.image_to_string", return_value="HELLO") as mock_ocr:
+            self.assertEqual(utils.compute_perceptual_hash(ctx), utils.imagehash.phash(ctx.image))
+            utils.has_text_heuristic(ctx)
+            self.assertTrue(utils.contains_phrase(ctx, "hello"))
+            self.assertIs(mock_ocr.call_args[0][0], ctx.image)
+
+
+class TestTiledOcr(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def page(self, text):
+        img = Image.new("RGB", (400, 200), color="white")
+        if text:
+            ImageDraw.Draw(img).text((20, 80), text, fill="black", font=ImageFont.load_default(size=24))
+        return img
+
+    def tiff(self, texts):
+        path = os.path.join(self.tmp.name, "pages.tiff")
+        pages = [self.page(text) for text in texts]
+        pages[0].save(path, save_all=True, append_images=pages[1:])
+        return utils.load_image(path, decode=False)
+
+    def test_pages_are_ocrd_one_by_one(self):
+        ctx = self.tiff(["first page", "", "third page"])
+        self.assertEqual(ctx.pages, 3)
+        self.assertTrue(ctx.tiled)
+        # The prefilter leaves multi-page files to the page-by-page check
+        self.assertTrue(utils.has_text_heuristic(ctx))
+        engine = MagicMock()
+        engine.image_to_string.side_effect = ["first page ", "third page"]
+
+        text, complete = utils.ocr_text_tiled(ctx, engine=engine)
+
+        self.assertEqual((text, complete), ("first page\nthird page", True))
+        # The blank page was skipped, every page went to the engine as grayscale
+        self.assertEqual([call.args[0].shape for call in engine.image_to_string.call_args_list], [(200, 400)] * 2)
+
+    def test_stops_once_all_phrases_are_found(self):
+        ctx = self.tiff(["first page", "second page", "third page"])
+        engine = MagicMock()
+        engine.image_to_string.side_effect = ["first page", "second page", "third page"]
+
+        text, complete = utils.ocr_text_tiled(ctx, PhraseMatcher(["first", "second"]), engine)
+
+        self.assertEqual((text, complete), ("first page\nsecond page", False))
+        self.assertEqual(engine.image_to_string.call_count, 2)
+
+    def test_large_image_is_ocrd_in_overlapping_tiles(self):
+        path = os.path.join(self.tmp.name, "big.png")
+        Image.new("RGB", (250, 120), color="white").save(path)
+        with patch("scan_image.tiles.TILE_MIN_PIXELS", 10000):
+            ctx = utils.load_image(path)
+        self.assertTrue(ctx.tiled)
+        # Decoded straight to grayscale
+        self.assertEqual(ctx.image.mode, "L")
+        engine = MagicMock()
+        engine.image_to_string.return_value = "tile"
+        with patch("scan_image.utils.tile_boxes", lambda w, h: tiles.tile_boxes(w, h, size=100, overlap=20)):
+            text, complete = utils.ocr_text_tiled(ctx, engine=engine)
+        shapes = [call.args[0].shape for call in engine.image_to_string.call_args_list]
+        self.assertEqual(shapes, [(100, 100)] * 3 + [(100, 100)] * 3)
+        self.assertTrue(complete)
+
+    @patch("scan_image.utils.logging")
+    def test_oversized_image_is_skipped(self, mock_logging):
+        path = os.path.join(self.tmp.name, "huge.png")
+        Image.new("RGB", (300, 300)).save(path)
+        recorded = metrics.Metrics()
+        # PIL's own limit is raised to MAX_PIXELS as well, and warns above it
+        with patch("scan_image.utils.MAX_PIXELS", 50000), patch("PIL.Image.MAX_IMAGE_PIXELS", 50000), \
+                patch("scan_image.utils.get_metrics", return_value=recorded), warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            self.assertIsNone(utils.load_image(path))
+        mock_logging.warning.assert_called_once()
+        self.assertEqual(recorded.skipped, [(path, "too large")])
+
+    @patch("scan_image.utils.logging")
+    def test_decode_memory_is_bounded(self, mock_logging):
+        """Only JPEG decodes straight to grayscale: a colour PNG costs 5 bytes per pixel, 4 of them in colour."""
+        names = {}
+        for name, mode in (("gray.png", "L"), ("colour.png", "RGB"), ("colour.jpg", "RGB")):
+            names[name] = os.path.join(self.tmp.name, name)
+            Image.new(mode, (300, 300), "white").save(names[name])
+        recorded = metrics.Metrics()
+        with patch("scan_image.utils.MAX_DECODE_BYTES", 300 * 300 * 2), \
+                patch("scan_image.utils.get_metrics", return_value=recorded):
+            self.assertIsNotNone(utils.load_image(names["gray.png"]))
+            self.assertIsNotNone(utils.load_image(names["colour.jpg"]))
+            self.assertIsNone(utils.load_image(names["colour.png"]))
+        self.assertEqual(recorded.skipped, [(names["colour.png"], "too large")])
+
+    @patch("scan_image.utils.logging")
+    def test_oversized_page_is_skipped(self, mock_logging):
+        ctx = self.tiff(["first page", "second page"])
+        engine = MagicMock()
+        engine.image_to_string.return_value = "first page"
+        recorded = metrics.Metrics()
+        # The first page fits; the colour second page does not
+        with patch("scan_image.utils.MAX_DECODE_BYTES", 400 * 200 * 2), \
+                patch("scan_image.utils.get_metrics", return_value=recorded):
+            text, complete = utils.ocr_text_tiled(ctx, engine=engine)
+        self.assertEqual((text, complete), ("first page", True))
+        self.assertEqual(recorded.skipped, [(ctx.path, "page 2 too large")])
+
+    def test_pil_limit_raised_once_on_import(self):
+        self.assertEqual(utils.Image.MAX_IMAGE_PIXELS, utils.MAX_PIXELS)
+
+
+class TestTextRegions(unittest.TestCase):
+
+    def context(self, size, lines):
+        img = Image.new("RGB", size, color="white")
+        draw = ImageDraw.Draw(img)
+        for xy, text in lines:
+            draw.text(xy, text, fill="black", font=ImageFont.load_default(size=20))
+        return utils.ImageContext("img.png", b"", img)
+
+    def test_only_regions_are_ocrd(self):
+        """Crops go to the engine grouped by page segmentation mode; texts come back in reading order."""
+        sparse = self.context((1200, 900), [((40, 40), "top"), ((40, 800), "bottom"),
+                                            ((600, 300), "block one"), ((600, 326), "block two")])
+        blank = self.context((300, 200), [])
+        engine = MagicMock()
+        calls = []
+        def fake_ocr(images, psm):
+            calls.append((psm, [image.size for image in images]))
+            return [f"text{psm}"] * len(images)
+        engine.images_to_strings.side_effect = fake_ocr
+
+        texts = utils.ocr_text_batch([sparse, blank], engine, text_regions=True)
+
+        self.assertEqual(texts, ["text7\ntext6\ntext7", "textNone"])
+        self.assertEqual(sorted(psm or 0 for psm, _ in calls), [0, 6, 7])
+        cropped = sum(w * h for psm, sizes in calls if psm for w, h in sizes)
+        self.assertLess(cropped, 0.1 * 1200 * 900)
+
+    def test_preprocessed_array_goes_to_engine(self):
+        ctx = self.context((300, 200), [((10, 10), "hello")])
+        engine = MagicMock()
+        engine.images_to_strings.return_value = ["hello"]
+        config = preprocess.DEFAULT_PREPROCESS._replace(binarize="otsu")
+        with patch("scan_image.preprocess._preprocess", config):
+            self.assertEqual(utils.ocr_text_batch([ctx], engine), ["hello"])
+        sent = engine.images_to_strings.call_args[0][0][0]
+        self.assertIsInstance(sent, np.ndarray)
+        self.assertEqual(set(np.unique(sent)), {0, 255})
+
+    def test_regions_off_by_default(self):
+        ctx = self.context((300, 200), [((10, 10), "hello")])
+        engine = MagicMock()
+        engine.images_to_strings.return_value = ["hello"]
+        self.assertEqual(utils.ocr_text_batch([ctx], engine), ["hello"])
+        engine.images_to_strings.assert_called_once_with([ctx.image])
+
+    def test_locate_stops_at_the_band_with_the_phrase(self):
+        """A dense page is OCR'd band by band; the phrase's box is in page pixels."""
+        page = self.context((400, 1300), [((5, 5 + 25 * i), "dense text " * 4) for i in range(50)])
+        bands = [[ocr.Word("the", (0, 0, 30, 20), (1, 1, 1)), ocr.Word("invoice", (40, 180, 100, 200), (1, 1, 9))],
+                 [ocr.Word("total", (10, 5, 60, 25), (1, 1, 1)), ocr.Word("due", (70, 5, 90, 25), (1, 1, 1))]]
+        engine = MagicMock(starts_process=False)
+        engine.image_to_data.side_effect = lambda crop, psm: bands.pop(0)
+
+        found, text, complete = utils.locate_phrases(page, ["Invoice Total"], engine)
+
+        self.assertEqual(engine.image_to_data.call_count, 2)
+        first_crop = engine.image_to_data.call_args_list[0][0][0]
+        self.assertEqual(found, {"Invoice Total": (10, 180, 100, first_crop.height + 25)})
+        self.assertEqual(text, "the\ninvoice\ntotal due")
+        self.assertFalse(complete)
+
+    def test_locate_sends_every_band_in_one_call_to_process_engines(self):
+        page = self.context((400, 1300), [((5, 5 + 25 * i), "dense text " * 4) for i in range(50)])
+        engine = MagicMock(starts_process=True)
+        engine.images_to_data.side_effect = lambda crops, psm: (
+            [[ocr.Word("invoice", (40, 5, 100, 25), (1, 1, 1)), ocr.Word("total", (110, 5, 160, 25), (1, 1, 1))]] +
+            [[] for _ in crops[1:]])
+
+        found, text, complete = utils.locate_phrases(page, ["Invoice Total"], engine)
+
+        engine.images_to_data.assert_called_once()
+        engine.image_to_data.assert_not_called()
+        self.assertGreater(len(engine.images_to_data.call_args[0][0]), 1)
+        self.assertEqual(found, {"Invoice Total": (40, 5, 160, 25)})
+        self.assertEqual(text, "invoice total")
+        self.assertTrue(complete)
+
+    @patch("scan_image.utils.logging")
+    def test_failed_image_does_not_fail_its_batch(self, mock_logging):
+        good, slow = self.context((300, 200), []), utils.ImageContext("slow.png", b"", Image.new("L", (300, 200)))
+        def fake_ocr(images):
+            if slow.image in images:
+                raise ocr.OcrTimeout("tesseract killed after 5s")
+            return ["text"] * len(images)
+        engine = MagicMock()
+        engine.images_to_strings.side_effect = fake_ocr
+        metrics.collect_metrics()
+
+        self.assertEqual(utils.ocr_text_batch([good, slow, good], engine), ["text", None, "text"])
+        self.assertEqual(metrics.collect_metrics().skipped, [("slow.png", "timeout")])
+
+    @patch("scan_image.utils.logging")
+    def test_batch_timeout_skips_only_the_stuck_image(self, mock_logging):
+        images = [utils.ImageContext(f"{name}.png", b"", Image.new("L", (300, 200))) for name in "abcd"]
+        engine = MagicMock()
+        engine.images_to_strings.side_effect = [ocr.OcrTimeout("killed", done=["a text"]), ["c text", "d text"]]
+        metrics.collect_metrics()
+
+        self.assertEqual(utils.ocr_text_batch(images, engine), ["a text", None, "c text", "d text"])
+        self.assertEqual(engine.images_to_strings.call_count, 2)
+        self.assertEqual(metrics.collect_metrics().skipped, [("b.png", "timeout")])
+
+
+class TestPrefilter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def save(self, name, scale, text=True):
+        img = Image.new("RGB", (300 * scale, 120 * scale), color="white")
+        if text:
+            font = ImageFont.load_default(size=18 * scale)
+            ImageDraw.Draw(img).text((10 * scale, 40 * scale), "Invoice total paid", fill="black", font=font)
+        path = os.path.join(self.tmp.name, name)
+        img.save(path)
+        return path
+
+    def test_decision_does_not_depend_on_resolution(self):
+        """The same picture passes or fails at every size."""
+        for method in ("edges", "regions"):
+            config = utils.DEFAULT_PREFILTER._replace(method=method, max_side=256)
+            for scale in (1, 4):
+                text = utils.load_image(self.save(f"text{scale}.png", scale), decode=False)
+                blank = utils.load_image(self.save(f"blank{scale}.png", scale, text=False), decode=False)
+                self.assertTrue(utils.has_text_heuristic(text, config=config), (method, scale))
+                self.assertFalse(utils.has_text_heuristic(blank, config=config), (method, scale))
+
+    def test_jpeg_rejected_without_full_decode(self):
+        """Large JPEGs are checked on a draft-mode preview."""
+        path = os.path.join(self.tmp.name, "big.jpg")
+        Image.new("RGB", (2000, 1500), color="gray").save(path)
+        ctx = utils.load_image(path, decode=False)
+        self.assertFalse(utils.has_text_heuristic(ctx))
+        self.assertFalse(ctx._loaded)
+        self.assertLessEqual(max(ctx.preview(256).shape), 256)
+
+    def test_off_passes_everything(self):
+        path = self.save("blank.png", 1, text=False)
+        with patch("scan_image.utils.cv2.Canny", side_effect=AssertionError("filtered")):
+            self.assertTrue(utils.has_text_heuristic(path, config=utils.DEFAULT_PREFILTER._replace(method="off")))
+
+    def test_edge_thresh_overrides_config(self):
+        path = self.save("text.png", 1)
+        self.assertTrue(utils.has_text_heuristic(path, edge_thresh=0.001))
+        self.assertFalse(utils.has_text_heuristic(path, edge_thresh=0.5))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,136 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from scan_image import watch
+from scan_image.scanner import Match
+
+class FakePool:
+    """Runs pool work inline so the watch loop can be tested without worker processes."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def apply_async(self, func, args, callback=None, error_callback=None):
+        callback(func(*args))
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+class WatcherTests:
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = self.tmp.name
+        self.write("old.png")
+
+    def write(self, name, content="x"):
+        path = os.path.join(self.root, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def collect(self, watcher, polls=3):
+        found = set()
+        for _ in range(polls):
+            found |= watcher.poll(timeout=0.05)
+        return found
+
+    def test_reports_new_images_only(self):
+        watcher = self.make_watcher()
+        self.addCleanup(watcher.close)
+        new = self.write("new.png")
+        self.write("notes.txt")
+        self.assertEqual(self.collect(watcher), {new})
+        self.assertEqual(self.collect(watcher), set(), "a file is reported once")
+
+    def test_reports_images_in_new_directories(self):
+        watcher = self.make_watcher()
+        self.addCleanup(watcher.close)
+        os.makedirs(os.path.join(self.root, "sub", "deeper"))
+        nested = self.write(os.path.join("sub", "deeper", "a.jpg"))
+        self.assertEqual(self.collect(watcher, polls=4), {nested})
+
+class TestPollingWatcher(WatcherTests, unittest.TestCase):
+
+    def make_watcher(self):
+        return watch.PollingWatcher(self.root, interval=0.01)
+
+    def test_waits_for_file_to_settle(self):
+        watcher = self.make_watcher()
+        path = self.write("growing.png", "x")
+        self.assertEqual(watcher.poll(timeout=0.01), set())
+        with open(path, "a") as f:
+            f.write("more")
+        self.assertEqual(watcher.poll(timeout=0.01), set(), "still changing")
+        self.assertEqual(watcher.poll(timeout=0.01), {path})
+
+    def test_full_rescan_finds_in_place_edits(self):
+        watcher = watch.PollingWatcher(self.root, interval=0.01, full_rescan_interval=0)
+        path = os.path.join(self.root, "old.png")
+        with open(path, "a") as f:
+            f.write("edited")
+        self.assertEqual(self.collect(watcher), {path})
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+class TestInotifyWatcher(WatcherTests, unittest.TestCase):
+
+    def make_watcher(self):
+        return watch.InotifyWatcher(self.root)
+
+    def test_reports_rewritten_files(self):
+        watcher = self.make_watcher()
+        self.addCleanup(watcher.close)
+        path = self.write("old.png", "rewritten")
+        self.assertEqual(self.collect(watcher), {path})
+
+
+@patch("scan_image.watch.Pool", FakePool)
+class TestWatchImages(unittest.TestCase):
+
+    def test_matches_emitted_and_deduplicated_across_session(self):
+        """Initial files and later arrivals are scanned; a repeated hash is reported once."""
+        stop = threading.Event()
+        matches = []
+        arrivals = [{"/w/new.png", "/w/copy.png"}, set()]
+
+        class FakeWatcher:
+            def poll(self, timeout=None):
+                if not arrivals:
+                    stop.set()
+                    return set()
+                return arrivals.pop(0)
+
+            def close(self):
+                pass
+
+        def fake_process(args):
+            batch, phrases = args
+            hashes = {"/w/a.png": "h1", "/w/new.png": "h2", "/w/copy.png": "h2"}
+            return [Match(path, hashes[path], list(phrases), {}) for path in batch]
+
+        with patch("scan_image.watch.open_watcher", return_value=FakeWatcher()), \
+             patch("scan_image.watch.iter_image_files", return_value=iter(["/w/a.png"])), \
+             patch("scan_image.watch.process_files", fake_process):
+            watch.watch_images_for_phrases("/w", ["hello"], lambda p, m: matches.append((p, m)),
+                                           stop_event=stop, poll_interval=0)
+
+        self.assertEqual(matches[0], ("/w/a.png", ["hello"]))
+        self.assertEqual(len(matches), 2)
+        self.assertIn(matches[1][0], {"/w/new.png", "/w/copy.png"})
+
+
+if __name__ == "__main__":
+    unittest.main()